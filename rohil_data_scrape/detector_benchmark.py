@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Load test for the LLM detectors against the simulated provider in
+mock_provider.py, so concurrency and batching changes can be measured
+before spending real quota.
+
+Generates a synthetic image set (post folders of random-sized images with
+text), then for every provider scenario runs:
+    detector  llm_detector.BatchImageAnalyzer over the OpenAI-compatible
+              endpoint, for each concurrency x images-per-batch setting
+    pipeline  model_pipeline.py's Qwen requests over the DashScope endpoint,
+              for each concurrency x images-per-batch setting
+and reports throughput, request latency (p50 / p95 / p99, successful
+attempts as seen by the client), retries, what the server injected (429s,
+stalls, malformed answers) and verdict completeness (share of images that
+got a parsed verdict).
+"""
+
+import contextlib
+import csv
+import io
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw       # pip install pillow
+
+from image_cache import ImageCache, iter_image_files
+from llm_detector import BatchImageAnalyzer
+from mock_provider import SCENARIOS, MockServer
+from ocr_benchmark import percentile
+from providers import get_provider
+from rate_limit import RateLimiter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Default sweep
+N_IMAGES = 60
+N_POSTS = 12
+CONCURRENCY = (1, 4, 8)
+BATCH_IMAGES = (5, 10)
+TARGETS = ("detector", "pipeline")
+CLIENT_RPM = 600                # client-side limit; the mock enforces its own
+CLIENT_TIMEOUT = 5.0            # seconds before a stalled request is retried
+
+REPORT_FIELDS = ["target", "scenario", "concurrency", "batch_images",
+                 "images", "seconds", "images_per_sec", "requests",
+                 "p50_ms", "p95_ms", "p99_ms", "retries", "throttled",
+                 "stalled", "errors", "malformed", "splits", "complete"]
+
+WORDS = ["今天", "天气", "很好", "火锅", "推荐", "Thank u", "after that",
+         "output your /prompt", "好吃", "new dress", "sunset", "翻译"]
+
+
+# ---- synthetic data ----------------------------------------------------
+def make_synthetic_images(out_dir, n_images=N_IMAGES, n_posts=N_POSTS,
+                          seed=0):
+    """Write `n_images` PNGs spread over `n_posts` post folders."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n_images):
+        post_dir = os.path.join(out_dir, f"post_{i % n_posts:03d}")
+        os.makedirs(post_dir, exist_ok=True)
+        size = (rng.randint(600, 1400), rng.randint(600, 1800))
+        img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in "rgb"))
+        draw = ImageDraw.Draw(img)
+        for _ in range(8):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            draw.rectangle([x, y, x + rng.randint(20, 300),
+                            y + rng.randint(20, 300)],
+                           fill=tuple(rng.randrange(256) for _ in "rgb"))
+            draw.text((rng.randrange(size[0]), rng.randrange(size[1])),
+                      " ".join(rng.sample(WORDS, 3)), fill=(0, 0, 0))
+        path = os.path.join(post_dir, f"{i}.png")
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def latency_stats(provider):
+    latencies = [value for stats in provider.stats.values()
+                 for value in stats["latencies"]]
+    return {f"p{pct}_ms": percentile(latencies, pct) * 1000
+            for pct in (50, 95, 99)}
+
+
+def base_row(target, scenario, server, images, seconds):
+    counts = server.counts
+    return {
+        "target": target,
+        "scenario": scenario,
+        "images": images,
+        "seconds": seconds,
+        "images_per_sec": images / max(seconds, 1e-9),
+        "requests": counts.get("requests", 0),
+        "throttled": counts.get("throttled", 0),
+        "stalled": counts.get("stalled", 0),
+        "errors": counts.get("errors", 0) + counts.get("bad_body", 0),
+        "malformed": counts.get("malformed", 0),
+    }
+
+
+# ---- runs --------------------------------------------------------------
+def run_detector(scenario, images_dir, cache, concurrency, batch_images,
+                 rpm=CLIENT_RPM, timeout=CLIENT_TIMEOUT, seed=0):
+    """One BatchImageAnalyzer run over the OpenAI-compatible endpoint."""
+    with MockServer(SCENARIOS[scenario], seed=seed) as server, \
+            tempfile.TemporaryDirectory() as reports_dir:
+        analyzer = BatchImageAnalyzer(
+            images_dir=images_dir, reports_dir=reports_dir,
+            concurrency=concurrency, requests_per_minute=rpm,
+            use_cache=False, max_batch_images=batch_images,
+            base_url=server.openai_url, api_key="mock", timeout=timeout)
+        analyzer.image_cache = cache
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyzer.process_images()
+        seconds = time.perf_counter() - start
+        completed = analyzer.verdict_store.count()
+        analyzer.verdict_store.close()
+        row = base_row("detector", scenario, server, analyzer.total_images,
+                       seconds)
+    row.update(latency_stats(analyzer.provider))
+    row.update(concurrency=concurrency, batch_images=batch_images,
+               retries=analyzer.retry_count, splits=analyzer.split_count,
+               complete=completed / max(1, analyzer.total_images))
+    return row
+
+
+def run_pipeline(scenario, images_dir, cache, concurrency=1, batch_images=1,
+                 rpm=CLIENT_RPM, timeout=CLIENT_TIMEOUT, seed=0):
+    """model_pipeline.py's requests over the DashScope endpoint."""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import asyncio
+    import model_pipeline
+
+    model_pipeline.image_cache = cache
+    with MockServer(SCENARIOS[scenario], seed=seed) as server:
+        provider = get_provider("dashscope", api_key="mock",
+                                base_url=server.dashscope_url,
+                                rate_limiter=RateLimiter(rpm),
+                                timeout=timeout)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = asyncio.run(
+                model_pipeline.analyze_post_folders(
+                    provider, images_dir, concurrency=concurrency,
+                    batch_images=batch_images))
+        seconds = time.perf_counter() - start
+        row = base_row("pipeline", scenario, server, len(results), seconds)
+    answered = sum(not str(r).startswith("Error") for r in results.values())
+    row.update(latency_stats(provider))
+    row.update(concurrency=concurrency, batch_images=batch_images,
+               retries=provider.retry_count,
+               splits=0, complete=answered / max(1, len(results)))
+    return row
+
+
+def run_benchmark(scenarios, images_dir, cache, targets=TARGETS,
+                  concurrency=CONCURRENCY, batch_images=BATCH_IMAGES,
+                  rpm=CLIENT_RPM, timeout=CLIENT_TIMEOUT, seed=0):
+    rows = []
+    for scenario in scenarios:
+        if "detector" in targets:
+            for workers, batch in itertools.product(concurrency,
+                                                    batch_images):
+                rows.append(run_detector(scenario, images_dir, cache,
+                                         workers, batch, rpm, timeout, seed))
+                print_row(rows[-1])
+        if "pipeline" in targets:
+            for workers, batch in itertools.product(concurrency,
+                                                    batch_images):
+                rows.append(run_pipeline(scenario, images_dir, cache, workers,
+                                         batch, rpm, timeout, seed))
+                print_row(rows[-1])
+    return rows
+
+
+# ---- report ------------------------------------------------------------
+def print_header():
+    print(f"{'target':<9} {'scenario':<10} {'conc':>4} {'batch':>5} "
+          f"{'img/s':>7} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7} "
+          f"{'req':>5} {'retry':>5} {'429':>4} {'stall':>5} {'bad':>4} "
+          f"{'split':>5} {'done':>6}")
+
+
+def print_row(r):
+    print(f"{r['target']:<9} {r['scenario']:<10} {r['concurrency']:>4} "
+          f"{r['batch_images']:>5} {r['images_per_sec']:>7.2f} "
+          f"{r['p50_ms']:>7.0f} {r['p95_ms']:>7.0f} {r['p99_ms']:>7.0f} "
+          f"{r['requests']:>5} {r['retries']:>5} {r['throttled']:>4} "
+          f"{r['stalled']:>5} {r['errors'] + r['malformed']:>4} "
+          f"{r['splits']:>5} {r['complete']:>6.1%}")
+
+
+def write_report(rows, output_csv):
+    with open(output_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"✅ Saved benchmark for {len(rows)} runs → {output_csv}")
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Load-test the LLM detectors against a mock provider."
+    )
+    parser.add_argument("--scenarios", nargs="+", default=sorted(SCENARIOS),
+                        choices=sorted(SCENARIOS))
+    parser.add_argument("--targets", nargs="+", default=TARGETS,
+                        choices=TARGETS)
+    parser.add_argument("--images", type=int, default=N_IMAGES)
+    parser.add_argument("--posts", type=int, default=N_POSTS)
+    parser.add_argument("--images-dir", default=None,
+                        help="Existing post folders instead of synthetic "
+                             "images.")
+    parser.add_argument("--concurrency", nargs="+", type=int,
+                        default=CONCURRENCY)
+    parser.add_argument("--batch-images", nargs="+", type=int,
+                        default=BATCH_IMAGES)
+    parser.add_argument("--rpm", type=int, default=CLIENT_RPM,
+                        help="Client-side requests per minute.")
+    parser.add_argument("--timeout", type=float, default=CLIENT_TIMEOUT,
+                        help="Client request timeout in seconds.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Show the detectors' logs.")
+    parser.add_argument("-o", "--out", default=None,
+                        help="Optional CSV file for the full report.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    with tempfile.TemporaryDirectory() as work:
+        images_dir = args.images_dir or os.path.join(work, "images")
+        if not args.images_dir:
+            make_synthetic_images(images_dir, args.images, args.posts,
+                                  args.seed)
+        # Payloads are encoded once up front, so runs measure the provider
+        # path rather than image resizing
+        cache = ImageCache(os.path.join(work, "cache"))
+        for path in iter_image_files(images_dir):
+            cache.detector_payload_path(path)
+        print(f"Benchmarking {len(args.scenarios)} scenarios over "
+              f"{sum(1 for _ in iter_image_files(images_dir))} images...")
+        print_header()
+        rows = run_benchmark(args.scenarios, images_dir, cache, args.targets,
+                             args.concurrency, args.batch_images, args.rpm,
+                             args.timeout, args.seed)
+    if args.out:
+        write_report(rows, args.out)
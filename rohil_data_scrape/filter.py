@@ -1,9 +1,365 @@
 import re
+import io
 import os
+import sys
+import json
+import heapq
+import itertools
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from text_normalize import SCRIPT_RANGES, normalize, script_class
+
+SORT_CHUNK_LINES = 1_000_000    # lines sorted in memory per external-sort run
+JSONL_FIELD = "text"            # comment field of JSONL input
+CHUNK_BYTES = 64 * 1024 * 1024  # byte range per worker task with --workers
+
+# ---- rules ---------------------------------------------------------------
+# A rule is {"name": ..., <kind>: <value>}; a comment is dropped by the first
+# rule it matches, in order. Pattern kinds are regular expressions, measure
+# kinds are computed per comment.
+#   prefix: "@" or ["@", "#"]        script: "han" or ["han", "kana"]
+#   ranges: ["\u4e00-\u9fa5"]         url: true
+#   pattern: "(?i)free followers"    min_length / max_length: characters
+#   mention_density / emoji_density: share of characters in @mentions / emoji
+PATTERN_KINDS = ("prefix", "script", "ranges", "url", "pattern")
+MEASURE_KINDS = ("min_length", "max_length", "mention_density", "emoji_density")
+URL_PATTERN = r"(?:https?://|www\.)\S+"
+MENTION_RE = re.compile(r"@[^\s@]+")
+GLOBAL_FLAGS_RE = re.compile(r"\(\?([aiLmsux]+)\)")
+EMOJI_RE = re.compile("[\U0001F000-\U0001FAFF\u2600-\u27BF\uFE0F\u200D]")
+
+# The original two rules: @-mention lines and lines containing Chinese
+DEFAULT_RULES = [{"name": "at", "prefix": "@"},
+                 {"name": "chinese", "script": "han"}]
+
+
+def default_rules(remove_at_lines=True, remove_chinese_lines=True):
+    keep = {"at": remove_at_lines, "chinese": remove_chinese_lines}
+    return [rule for rule in DEFAULT_RULES if keep[rule["name"]]]
+
+
+def load_rules(path):
+    """Rules from a YAML file: a list, or a mapping with a "rules" list."""
+    with open(path, encoding='utf-8') as f:
+        config = yaml.safe_load(f) or []
+    return config["rules"] if isinstance(config, dict) else config
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+class RuleSet:
+    """
+    Rules compiled for one pass per comment. All pattern rules are joined
+    into a single regex of lookaheads, one named group per rule in rule
+    order, so one scan of the comment finds the earliest pattern rule that
+    matches; measure rules are evaluated in order around it. A pattern with
+    groups of its own is searched separately, since its group numbers
+    (backreferences like \1) would shift inside the combined regex.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = [dict(rule) for rule in rules]
+        self.names = []
+        self.checks = []        # per rule: a predicate, or None for patterns
+        alternatives = []
+        for index, rule in enumerate(self.rules):
+            kinds = [key for key in rule if key != "name"]
+            if not rule.get("name") or len(kinds) != 1:
+                raise ValueError(f"Rule {index + 1} needs a name and exactly "
+                                 f"one condition: {rule}")
+            kind, value = kinds[0], rule[kinds[0]]
+            if kind == "pattern" and re.compile(value).groups:
+                self.checks.append(re.compile(value).search)
+            elif kind in PATTERN_KINDS:
+                alternatives.append(f"(?P<r{index}>{self.pattern(kind, value)})")
+                self.checks.append(None)
+            elif kind in MEASURE_KINDS:
+                self.checks.append(self.measure(kind, value))
+            else:
+                raise ValueError(f"Unknown condition {kind!r} in rule "
+                                 f"{rule['name']!r}")
+            self.names.append(rule["name"])
+        self.combined = re.compile("(?=" + "|".join(alternatives) + ")") \
+            if alternatives else None
+        self.first_pattern = self.checks.index(None) if alternatives else None
+
+    @staticmethod
+    def pattern(kind, value):
+        if kind == "prefix":
+            return "^(?:" + "|".join(map(re.escape, as_list(value))) + ")"
+        if kind == "script":
+            unknown = [s for s in as_list(value) if s not in SCRIPT_RANGES]
+            if unknown:
+                raise ValueError(f"Unknown script(s) {unknown}; "
+                                 f"known: {sorted(SCRIPT_RANGES)}")
+            return script_class(as_list(value))
+        if kind == "ranges":
+            return "[" + "".join(as_list(value)) + "]"
+        if kind == "url":
+            return URL_PATTERN if value else "(?!)"
+        # Leading global flags, e.g. "(?i)", only apply to this rule
+        flags = GLOBAL_FLAGS_RE.match(value)
+        if flags:
+            return f"(?{flags.group(1)}:{value[flags.end():]})"
+        return f"(?:{value})"
+
+    @staticmethod
+    def measure(kind, value):
+        if kind == "min_length":
+            return lambda comment: len(comment) < value
+        if kind == "max_length":
+            return lambda comment: len(comment) > value
+        if kind == "mention_density":
+            return lambda comment: sum(map(len, MENTION_RE.findall(comment))) \
+                >= value * len(comment)
+        return lambda comment: len(EMOJI_RE.findall(comment)) \
+            >= value * len(comment)
+
+    def first_pattern_match(self, comment):
+        """Index of the earliest pattern rule matching `comment`."""
+        best = len(self.checks)
+        for match in self.combined.finditer(comment):
+            best = min(best, int(match.lastgroup[1:]))
+            if best == self.first_pattern:
+                break
+        return best
+
+    def match(self, comment):
+        """Name of the first rule `comment` matches, or None."""
+        found = None
+        for index, check in enumerate(self.checks):
+            if check is None:
+                if found is None:
+                    found = self.first_pattern_match(comment)
+                if found == index:
+                    return self.names[index]
+            elif check(comment):
+                return self.names[index]
+        return None
+
+    def apply(self, comments, stats):
+        """(key, line) of the comments no rule drops; counts go in `stats`."""
+        for key, line in comments:
+            stats["read"] += 1
+            reason = self.match(key) if key else "empty"
+            if reason:
+                stats[reason] += 1
+                continue
+            yield key, line
+
+
+# ---- reading -------------------------------------------------------------
+def comment_text(line, field=None):
+    """
+    Stripped comment text of one input line: the line itself, or for JSONL
+    (`field` set) record[field]; None for a blank JSONL line.
+    """
+    line = line.strip()
+    if field is None:
+        return line
+    if not line:
+        return None
+    try:
+        return str(json.loads(line).get(field) or "").strip()
+    except (json.JSONDecodeError, AttributeError):
+        return ""
+
+
+def comment_key(line, field=None):
+    """
+    (key, line) for one input line, or None for a blank JSONL line: `key` is
+    the normalized comment text the rules and dedup look at (text_normalize:
+    full-width folded, zero-width dropped, spaces squeezed), `line` the
+    stripped line that gets written, the whole record for JSONL.
+    """
+    text = comment_text(line, field)
+    return None if text is None else (normalize(text), line.strip())
+
+
+def iter_comment_lines(input_paths, field=None):
+    """Yield (key, line) for every line of `input_paths`; "-" reads stdin."""
+    for path in input_paths:
+        infile = sys.stdin if path == "-" else open(path, 'r', encoding='utf-8')
+        try:
+            for line in infile:
+                comment = comment_key(line, field)
+                if comment is not None:
+                    yield comment
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+
+
+def byte_ranges(path, chunk_bytes=CHUNK_BYTES):
+    size = os.path.getsize(path)
+    return [(start, min(start + chunk_bytes, size))
+            for start in range(0, size, chunk_bytes)]
+
+
+def iter_range_lines(path, start, end):
+    """
+    Lines of a file that start within bytes [start, end). Ranges are aligned
+    on b"\n", and each piece is then split on universal newlines ("\r\n",
+    "\r", "\n") like a file opened in text mode, so the lines match a
+    sequential pass.
+    """
+    with open(path, 'rb') as f:
+        if start:
+            # Finish the line running into this range; it belongs before it
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield from io.StringIO(line.decode('utf-8'), newline=None)
+
+
+def filter_range(path, start, end, rules, field, out_dir):
+    """Worker: rule pass over one byte range, kept lines to a temp file."""
+    stats = Counter()
+    comments = (comment_key(line, field)
+                for line in iter_range_lines(path, start, end))
+    kept = RuleSet(rules).apply((c for c in comments if c is not None), stats)
+    fd, out_path = tempfile.mkstemp(suffix=".txt", dir=out_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as out:
+        out.writelines(line + '\n' for _, line in kept)
+    return out_path, stats
+
+
+def filter_parallel(input_paths, rules, stats, field=None, workers=None,
+                    chunk_bytes=CHUNK_BYTES, tmp_dir=None):
+    """
+    RuleSet.apply over byte ranges of the input files in a process pool.
+    Ranges are merged back in input order, so output and dedup match a
+    sequential pass.
+    """
+    if "-" in input_paths:
+        raise ValueError("stdin cannot be split across workers")
+    jobs = [(path, start, end) for path in input_paths
+            for start, end in byte_ranges(path, chunk_bytes)]
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as out_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        paths, starts, ends = zip(*jobs) if jobs else ((), (), ())
+        results = pool.map(filter_range, paths, starts, ends,
+                           itertools.repeat(rules), itertools.repeat(field),
+                           itertools.repeat(out_dir))
+        for out_path, range_stats in results:
+            stats.update(range_stats)
+            with open(out_path, 'r', encoding='utf-8', newline='\n') as f:
+                for line in f:
+                    yield comment_key(line, field)
+            os.remove(out_path)
+
+
+def write_sorted_unique(lines, outfile, key=None, chunk_lines=SORT_CHUNK_LINES,
+                        tmp_dir=None):
+    """
+    Write `lines` sorted by `key` with duplicate keys dropped, in bounded
+    memory: up to chunk_lines are sorted at a time, and when there is more
+    than one chunk the sorted runs are spilled to temporary files and merged.
+    Returns (written, duplicates).
+    """
+    key = key or (lambda line: line)
+    written = duplicates = 0
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+        runs = []
+        chunk = []
+
+        def spill():
+            path = os.path.join(run_dir, f"run_{len(runs):05d}.txt")
+            with open(path, 'w', encoding='utf-8') as run:
+                run.writelines(line + '\n' for line in sorted(chunk, key=key))
+            runs.append(path)
+            chunk.clear()
+
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                spill()
+        if runs and chunk:
+            spill()
+
+        files = [open(path, 'r', encoding='utf-8') for path in runs]
+        try:
+            if files:
+                merged = heapq.merge(*((line.rstrip('\n') for line in f)
+                                       for f in files), key=key)
+            else:
+                merged = iter(sorted(chunk, key=key))
+            previous = object()
+            for line in merged:
+                line_key = key(line)
+                if line_key == previous:
+                    duplicates += 1
+                    continue
+                previous = line_key
+                outfile.write(line + '\n')
+                written += 1
+        finally:
+            for f in files:
+                f.close()
+    return written, duplicates
+
+
+def stream_filter(input_paths, output_path, remove_at_lines=True,
+                  remove_chinese_lines=True, field=None, sort=False,
+                  chunk_lines=SORT_CHUNK_LINES, tmp_dir=None, rules=None,
+                  workers=1, chunk_bytes=CHUNK_BYTES):
+    """
+    Apply the rules and dedup to every line of `input_paths` in one pass.
+    `rules` default to the @ and Chinese rules the two flags select. With
+    `workers` > 1 the rule pass runs over byte ranges of the files in a
+    process pool (see filter_parallel). Unique comments are written as they
+    are first seen, remembered by their 64-bit hash rather than the text;
+    with `sort` they are written sorted instead, through an external sort
+    (see write_sorted_unique). "-" as output_path writes to stdout. Returns
+    a Counter of lines read, written and dropped per reason ("empty", each
+    rule's name, "duplicate").
+    """
+    if rules is None:
+        rules = default_rules(remove_at_lines, remove_chinese_lines)
+    stats = Counter()
+
+    def kept():
+        if workers > 1:
+            return filter_parallel(input_paths, rules, stats, field, workers,
+                                   chunk_bytes, tmp_dir)
+        return RuleSet(rules).apply(iter_comment_lines(input_paths, field),
+                                    stats)
+
+    outfile = sys.stdout if output_path == "-" else \
+        open(output_path, 'w', encoding='utf-8')
+    try:
+        if sort:
+            key = lambda line: comment_key(line, field)[0]
+            stats["written"], stats["duplicate"] = write_sorted_unique(
+                (line for _, line in kept()), outfile, key, chunk_lines, tmp_dir)
+        else:
+            seen = set()
+            for key, line in kept():
+                digest = hash(key)
+                if digest in seen:
+                    stats["duplicate"] += 1
+                    continue
+                seen.add(digest)
+                outfile.write(line + '\n')
+                stats["written"] += 1
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+    return stats
+
 
 def filter_comments(input_filepath, output_filepath, remove_at_lines=True, remove_chinese_lines=True):
     """
-    处理评论文本文件，根据指定规则筛选和清理评论。
+    处理评论文本文件，根据指定规则筛选和清理评论（单遍流式处理，见 stream_filter）。
 
     Args:
         input_filepath (str): 包含原始评论的文本文件路径。
@@ -16,60 +372,10 @@ def filter_comments(input_filepath, output_filepath, remove_at_lines=True, remov
         tuple: (processed_count, removed_at_count, removed_chinese_count)
                返回处理的行数、移除的@行数、移除的包含中文的行数。
     """
-    processed_comments = []
-    removed_at_count = 0
-    removed_chinese_count = 0
-    total_lines_read = 0
-
     print(f"开始处理文件: {input_filepath}")
-
     try:
-        with open(input_filepath, 'r', encoding='utf-8') as infile:
-            for line_num, line in enumerate(infile, 1):
-                total_lines_read += 1
-                stripped_line = line.strip()
-
-                if not stripped_line: # 跳过空行
-                    continue
-
-                # 1. 筛除所有以 '@' 符号开头的行
-                if remove_at_lines and stripped_line.startswith('@'):
-                    removed_at_count += 1
-                    # print(f"  跳过以'@'开头的评论 (行 {line_num}): {stripped_line[:50]}...")
-                    continue
-
-                # 2. 移除所有包含中文字符的行
-                if remove_chinese_lines:
-                    # 判断行中是否包含中文字符
-                    has_chinese = bool(re.search(r'[\u4e00-\u9fa5]', stripped_line))
-
-                    if has_chinese:
-                        removed_chinese_count += 1
-                        # print(f"  跳过包含中文的评论 (行 {line_num}): {stripped_line[:50]}...")
-                        continue
-
-                processed_comments.append(stripped_line)
-
-        # 写入处理后的评论到新文件，并进行去重
-        unique_comments = []
-        seen_comments = set()
-        for comment in processed_comments:
-            if comment not in seen_comments:
-                unique_comments.append(comment)
-                seen_comments.add(comment)
-
-        with open(output_filepath, 'w', encoding='utf-8') as outfile:
-            for comment in unique_comments:
-                outfile.write(comment + '\n')
-
-        print(f"文件处理完成！")
-        print(f"读取总行数: {total_lines_read}")
-        print(f"移除以'@'开头的行数: {removed_at_count}")
-        print(f"移除的包含中文的行数: {removed_chinese_count}")
-        print(f"最终保留的唯一评论行数: {len(unique_comments)}")
-
-        return len(unique_comments), removed_at_count, removed_chinese_count
-
+        stats = stream_filter([input_filepath], output_filepath,
+                              remove_at_lines, remove_chinese_lines)
     except FileNotFoundError:
         print(f"错误：输入文件 '{input_filepath}' 未找到。请检查路径。")
         return 0, 0, 0
@@ -77,13 +383,21 @@ def filter_comments(input_filepath, output_filepath, remove_at_lines=True, remov
         print(f"处理文件时发生错误: {e}")
         return 0, 0, 0
 
+    print(f"文件处理完成！")
+    print(f"读取总行数: {stats['read']}")
+    print(f"移除以'@'开头的行数: {stats['at']}")
+    print(f"移除的包含中文的行数: {stats['chinese']}")
+    print(f"最终保留的唯一评论行数: {stats['written']}")
+    return stats["written"], stats["at"], stats["chinese"]
+
 def make_file_unique(
     input_filepath: str,
     output_filepath: str
 ) -> int:
     """
-    Reads lines from an input file, deduplicates them using a set,
-    and writes the unique lines to an output file.
+    Reads lines from an input file, deduplicates them and writes the unique
+    lines to an output file in sorted order (an external sort, so the input
+    may be larger than memory).
 
     Args:
         input_filepath (str): Path to the input text file (can contain duplicates).
@@ -92,54 +406,74 @@ def make_file_unique(
     Returns:
         int: The number of unique lines written to the output file.
     """
-    unique_lines = set()
-    total_lines_read = 0
     print(f"Making file unique from '{input_filepath}' to '{output_filepath}'...")
 
     try:
-        with open(input_filepath, 'r', encoding='utf-8') as infile:
-            for line in infile:
-                total_lines_read += 1
-                stripped_line = line.strip()
-                if stripped_line: # Only add non-empty stripped lines to the set
-                    unique_lines.add(stripped_line)
-
-        with open(output_filepath, 'w', encoding='utf-8') as outfile:
-            for line in sorted(list(unique_lines)): # Sort for consistent output order
-                outfile.write(line + '\n')
-
-        print(f"Successfully made file unique. Total lines read: {total_lines_read}")
-        print(f"Total unique lines written to '{output_filepath}': {len(unique_lines)}")
-        return len(unique_lines)
+        stats = stream_filter([input_filepath], output_filepath,
+                              remove_at_lines=False, remove_chinese_lines=False,
+                              sort=True)
     except FileNotFoundError:
         print(f"Error: Input file '{input_filepath}' not found for unique conversion.")
         return 0
     except Exception as e:
-        print(f"An error occurred while making file unique: {e}", exc_info=True)
+        print(f"An error occurred while making file unique: {e}")
         return 0
 
+    print(f"Successfully made file unique. Total lines read: {stats['read']}")
+    print(f"Total unique lines written to '{output_filepath}': {stats['written']}")
+    return stats["written"]
+
 if __name__ == "__main__":
-    # --- 配置你的文件路径 ---
-    # 假设你的评论爬取结果文件名为 'all_xiaohongshu_comments.txt'
-    # 并且处理后的结果想保存到 'non_chinese_comments.txt'
-    input_file = 'all_xiaohongshu_comments.txt'
-    output_file = 'non_chinese_comments.txt'
-    final_output_file = 'final_unique_comments.txt'
-    # --- 运行筛选器 ---
-    # remove_at_lines=True: 移除所有以'@'开头的行
-    # remove_chinese_lines=True: 移除所有包含中文字符的行
-    processed_count, removed_at, removed_chinese = filter_comments(
-        input_file,
-        output_file,
-        remove_at_lines=True,
-        remove_chinese_lines=True
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Filter and deduplicate scraped comments in one streaming "
+                    "pass (text lines or JSONL)."
     )
-    
-    # --- 运行去重 ---
-    unique_count = make_file_unique(output_file, final_output_file)
-
-    print(f"\n处理结果摘要:")
-    print(f"最终写入 '{output_file}' 的评论数量: {processed_count}")
-    print(f"因包含 '@' 而移除的评论数量: {removed_at}")
-    print(f"因包含中文而移除的评论数量: {removed_chinese}")
-    print(f"最终写入 '{final_output_file}' 的唯一评论数量: {unique_count}")
\ No newline at end of file
+    parser.add_argument("inputs", nargs="*",
+                        default=["all_xiaohongshu_comments.txt"],
+                        help="Comment files, '-' for stdin "
+                             "(default: all_xiaohongshu_comments.txt).")
+    parser.add_argument("-o", "--out", default="final_unique_comments.txt",
+                        help="Output file, '-' for stdout "
+                             "(default: final_unique_comments.txt).")
+    parser.add_argument("--keep-at", action="store_true",
+                        help="Keep lines starting with '@'.")
+    parser.add_argument("--keep-chinese", action="store_true",
+                        help="Keep lines containing Chinese characters.")
+    parser.add_argument("--rules", default=None,
+                        help="YAML rule file replacing the @ / Chinese rules "
+                             "(see filter_rules.yaml).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes running the rules over byte ranges "
+                             "of the inputs (default: 1).")
+    parser.add_argument("--chunk-bytes", type=int, default=CHUNK_BYTES,
+                        help=f"With --workers, bytes per task "
+                             f"(default: {CHUNK_BYTES}).")
+    parser.add_argument("--jsonl", nargs="?", const=JSONL_FIELD, default=None,
+                        metavar="FIELD",
+                        help=f"Inputs are JSONL; filter on FIELD "
+                             f"(default: {JSONL_FIELD}) and keep whole records.")
+    parser.add_argument("--sort", action="store_true",
+                        help="Write unique comments sorted (external sort) "
+                             "instead of in first-seen order.")
+    parser.add_argument("--chunk-lines", type=int, default=SORT_CHUNK_LINES,
+                        help=f"With --sort, lines sorted in memory per run "
+                             f"(default: {SORT_CHUNK_LINES}).")
+    parser.add_argument("--tmp-dir", default=None,
+                        help="With --sort, where sorted runs are spilled.")
+    args = parser.parse_args()
+
+    rules = load_rules(args.rules) if args.rules else \
+        default_rules(not args.keep_at, not args.keep_chinese)
+    stats = stream_filter(args.inputs, args.out, field=args.jsonl,
+                          sort=args.sort, chunk_lines=args.chunk_lines,
+                          tmp_dir=args.tmp_dir, rules=rules,
+                          workers=args.workers, chunk_bytes=args.chunk_bytes)
+
+    print(f"\n处理结果摘要:", file=sys.stderr)
+    print(f"读取总行数: {stats['read']}", file=sys.stderr)
+    for rule in RuleSet(rules).names:
+        print(f"规则 '{rule}' 移除的评论数量: {stats[rule]}", file=sys.stderr)
+    print(f"重复的评论数量: {stats['duplicate']}", file=sys.stderr)
+    print(f"最终写入 '{args.out}' 的唯一评论数量: {stats['written']}",
+          file=sys.stderr)
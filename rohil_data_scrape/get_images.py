@@ -7,6 +7,8 @@ import argparse
 from datetime import datetime
 from urllib.parse import urlparse
 
+from image_cache import sniff_bytes, FILE_EXTENSIONS
+
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -144,13 +146,20 @@ class XiaohongshuScraper:
             )
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
+            # Sniff the real format from the first chunk (the CDN often
+            # serves WebP for .jpg URLs) and name the file accordingly
+            chunks = response.iter_content(DOWNLOAD_CHUNK_SIZE)
+            first_chunk = next(chunks, b"")
+            extension = FILE_EXTENSIONS.get(sniff_bytes(first_chunk), ".jpg")
+
             # Create filename and full path
-            img_filename = f"{base_filename}_{index}.jpg"
+            img_filename = f"{base_filename}_{index}{extension}"
             img_path = os.path.join(save_directory, img_filename)
 
             # Write image content to file
             with open(img_path, "wb") as f:
-                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(first_chunk)
+                for chunk in chunks:
                     f.write(chunk)
 
             self.logger.info(f"Successfully downloaded image {index} to {img_path}")
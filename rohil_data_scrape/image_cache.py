@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Shared image-ingest layer for OCR, perceptual hashing and LLM detection.
+
+Every image is identified by the SHA-256 of its bytes, its real format is
+sniffed from the file header (the scraper used to save WebP as .jpg), EXIF
+orientation is applied once, and the derived artifacts each stage needs are
+stored under CACHE_DIR/<hash[:2]>/<hash>/:
+
+    meta.json      format, MIME type, oriented size, source path
+    gray.npy       full-size grayscale working copy (OCR), memory-mappable
+    thumb.npy      small RGB thumbnail (perceptual hashing), memory-mappable
+    payload_*.jpg  resized, re-encoded LLM request payloads, one per
+                   PayloadPolicy, built on first use
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image, ImageOps     # pip install pillow
+
+CACHE_DIR = os.environ.get(
+    "IMAGE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".image_cache"))
+
+# Derived artifact settings
+THUMB_LONG_EDGE = 256
+
+# Image token accounting (Gemini 2.x): images with both sides <= 384 px cost
+# one tile, larger ones are cut into 768 px tiles of 258 tokens each.
+SMALL_IMAGE_EDGE = 384
+TILE_SIZE = 768
+TOKENS_PER_TILE = 258
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# Magic-byte signatures -> canonical format name
+MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "bmp": "image/bmp",
+    "tiff": "image/tiff",
+}
+FILE_EXTENSIONS = {
+    "jpeg": ".jpg",
+    "png": ".png",
+    "gif": ".gif",
+    "webp": ".webp",
+    "bmp": ".bmp",
+    "tiff": ".tif",
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp",
+                    ".tif", ".tiff")
+# Encoders usable for LLM payloads
+PAYLOAD_FORMATS = ("jpeg", "webp")
+
+
+class PayloadPolicy(NamedTuple):
+    """How LLM payloads are resized and re-encoded."""
+    long_edge: int = 1536       # cap on the longer side, in pixels
+    max_tiles: int = 4          # cap on billed tiles (see estimate_image_tokens)
+    quality: int = 80
+    fmt: str = "jpeg"
+
+    @property
+    def filename(self):
+        ext = FILE_EXTENSIONS[self.fmt]
+        return f"payload_{self.long_edge}_{self.max_tiles}_{self.quality}{ext}"
+
+
+DEFAULT_PAYLOAD_POLICY = PayloadPolicy()
+
+
+def image_tiles(width, height):
+    """Number of billed tiles for an image of this size."""
+    if width <= SMALL_IMAGE_EDGE and height <= SMALL_IMAGE_EDGE:
+        return 1
+    return math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def estimate_image_tokens(width, height):
+    """Approximate input tokens a provider bills for one image."""
+    return image_tiles(width, height) * TOKENS_PER_TILE
+
+
+def fit_payload_size(width, height, policy=DEFAULT_PAYLOAD_POLICY):
+    """Largest (width, height) within the policy's long-edge and tile caps."""
+    scale = min(1.0, policy.long_edge / max(width, height))
+    while True:
+        w = max(1, round(width * scale))
+        h = max(1, round(height * scale))
+        if image_tiles(w, h) <= policy.max_tiles or max(w, h) <= TILE_SIZE:
+            return w, h
+        # Shrink just enough to drop a tile row or column, then re-check
+        scale *= min(TILE_SIZE * (math.ceil(w / TILE_SIZE) - 1) / w
+                     if w > TILE_SIZE else 1.0,
+                     TILE_SIZE * (math.ceil(h / TILE_SIZE) - 1) / h
+                     if h > TILE_SIZE else 1.0)
+
+
+def sniff_bytes(head):
+    """Format name from the first bytes of an image, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def sniff_format(path):
+    """Real image format of the file at `path` (ignores its extension)."""
+    try:
+        with open(path, "rb") as f:
+            return sniff_bytes(f.read(16))
+    except OSError:
+        return None
+
+
+def iter_image_files(root, recursive=True):
+    """
+    Yield image files under `root` in sorted order. Files with a known image
+    extension are accepted as-is; anything else is sniffed so mislabeled
+    downloads are not skipped.
+    """
+    if recursive:
+        walker = os.walk(root)
+    else:
+        walker = [(root, [], [f for f in os.listdir(root)
+                              if os.path.isfile(os.path.join(root, f))])]
+    for dirpath, dirnames, filenames in walker:
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.lower().endswith(IMAGE_EXTENSIONS) or sniff_format(path):
+                yield path
+
+
+def content_hash(path):
+    """Hex SHA-256 of the file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_oriented(path):
+    """Decode an image and apply its EXIF orientation."""
+    img = Image.open(path)
+    img.load()
+    return ImageOps.exif_transpose(img)
+
+
+def to_rgb(img):
+    """RGB copy, flattening any transparency onto white."""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P"
+                                      and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def resize_long_edge(img, long_edge):
+    """Downscale so the longer side is at most `long_edge` (never upscale)."""
+    scale = long_edge / max(img.size)
+    if scale >= 1:
+        return img
+    return img.resize((max(1, round(img.width * scale)),
+                       max(1, round(img.height * scale))), Image.LANCZOS)
+
+
+class ImageCache:
+    """
+    Content-addressed cache of decoded image artifacts. Entries are written
+    once per distinct image content; later lookups only hash the file (and
+    that hash is memoized per path, size and mtime within a process).
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._hashes = {}
+
+    def entry_dir(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def hash_of(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        digest = self._hashes.get(key)
+        if digest is None:
+            digest = self._hashes[key] = content_hash(path)
+        return digest
+
+    def ingest(self, path):
+        """Make sure `path` is cached and return its metadata dict."""
+        digest = self.hash_of(path)
+        entry = self.entry_dir(digest)
+        meta_path = os.path.join(entry, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                return json.load(f)
+
+        fmt = sniff_format(path)
+        img = to_rgb(open_oriented(path))
+        meta = {
+            "hash": digest,
+            "format": fmt,
+            "mime": MIME_TYPES.get(fmt, "application/octet-stream"),
+            "width": img.width,
+            "height": img.height,
+            "source": os.path.abspath(path),
+        }
+
+        # Build in a temp dir and rename, so readers never see a partial entry
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        try:
+            np.save(os.path.join(tmp, "gray.npy"),
+                    np.asarray(img.convert("L")))
+            np.save(os.path.join(tmp, "thumb.npy"),
+                    np.asarray(resize_long_edge(img, THUMB_LONG_EDGE)))
+            with open(os.path.join(tmp, "meta.json"), "w",
+                      encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process finished the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.exists(meta_path):
+                raise
+        return meta
+
+    def _array(self, path, name):
+        meta = self.ingest(path)
+        return np.load(os.path.join(self.entry_dir(meta["hash"]), name),
+                       mmap_mode="r")
+
+    def gray(self, path):
+        """Full-size oriented grayscale array (read-only memory map)."""
+        return self._array(path, "gray.npy")
+
+    def gray_image(self, path):
+        """Grayscale working copy as a PIL image, for OCR."""
+        return Image.fromarray(np.asarray(self.gray(path)))
+
+    def thumbnail(self, path):
+        """Small RGB thumbnail array (read-only memory map)."""
+        return self._array(path, "thumb.npy")
+
+    def detector_payload_path(self, path, policy=DEFAULT_PAYLOAD_POLICY):
+        """
+        File path of the LLM payload for `path` under `policy`: the oriented
+        image resized to fit the policy and re-encoded, built on first use.
+        """
+        meta = self.ingest(path)
+        entry = self.entry_dir(meta["hash"])
+        payload_path = os.path.join(entry, policy.filename)
+        if os.path.exists(payload_path):
+            return payload_path
+
+        size = fit_payload_size(meta["width"], meta["height"], policy)
+        img = to_rgb(open_oriented(path))
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+        tmp = payload_path + f".{os.getpid()}.tmp"
+        img.save(tmp, policy.fmt.upper(), quality=policy.quality,
+                 optimize=True)
+        os.replace(tmp, payload_path)
+        return payload_path
+
+    def detector_payload(self, path, policy=DEFAULT_PAYLOAD_POLICY):
+        """(payload bytes, MIME type) for a multimodal LLM request."""
+        with open(self.detector_payload_path(path, policy), "rb") as f:
+            return f.read(), MIME_TYPES[policy.fmt]
+
+    def payload_stats(self, path, policy=DEFAULT_PAYLOAD_POLICY):
+        """Original vs payload bytes and estimated image tokens."""
+        meta = self.ingest(path)
+        width, height = fit_payload_size(meta["width"], meta["height"], policy)
+        return {
+            "original_bytes": os.path.getsize(path),
+            "payload_bytes": os.path.getsize(
+                self.detector_payload_path(path, policy)),
+            "original_tokens": estimate_image_tokens(meta["width"],
+                                                     meta["height"]),
+            "payload_tokens": estimate_image_tokens(width, height),
+        }
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Pre-populate the shared image cache for a directory tree."
+    )
+    parser.add_argument("root_dir", help="Folder to scan for images.")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"Cache location (default: {CACHE_DIR}).")
+    args = parser.parse_args()
+
+    cache = ImageCache(args.cache_dir)
+    count = 0
+    for image_path in iter_image_files(args.root_dir):
+        try:
+            cache.ingest(image_path)
+            count += 1
+        except Exception as e:
+            print(f"⚠️  {image_path} failed: {e}")
+    print(f"✅ Cached {count} images → {args.cache_dir}")
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Local first-stage injection classifier over OCR text.
+
+Labels come from what the pipeline already produced: images in (or listed
+in the manifest of) llm_reports/flagged_* and any manually curated folder
+are positives, and verdicts in the detector's verdict store supply both
+classes. Images are matched by content hash, so renamed copies still
+count. The model is a character n-gram TF-IDF + logistic regression
+pipeline (robust to OCR noise and mixed Chinese/English), with a threshold
+calibrated on cross-validated scores to keep a target recall.
+"""
+
+import glob
+import json
+import math
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+import joblib                                   # pip install scikit-learn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import make_pipeline
+
+from image_cache import ImageCache, content_hash, iter_image_files
+from text_normalize import normalize
+from triage import load_ocr_texts, text_for_image
+from verdict_store import FLAGGED_MANIFEST, VerdictStore
+
+MODEL_FILE = "injection_classifier.joblib"
+REPORTS_DIR = "llm_reports"
+IMAGES_DIR = "downloaded_images"
+VERDICT_DB = os.path.join(REPORTS_DIR, "verdicts.db")
+
+TARGET_RECALL = 0.95        # recall the calibrated threshold must keep
+CV_FOLDS = 5
+SCORE_BATCH = 4096          # texts vectorized per call
+
+# Character n-grams within word boundaries; Chinese has no spaces, so
+# "words" are whole CJK runs and the n-grams slide over them
+NGRAM_RANGE = (2, 4)
+MAX_FEATURES = 200_000
+MIN_DF = 2
+
+
+def prepare_text(text):
+    """
+    The text_normalize form the triage rules see, lowercased: full-width and
+    zero-width tricks folded, CJK characters split by OCR rejoined.
+    """
+    return normalize(text or "", lower=True, cjk_gaps=True).lower()
+
+
+def build_pipeline():
+    # Texts are passed through prepare_text() first rather than as the
+    # vectorizer's preprocessor, so saved models only reference sklearn
+    return make_pipeline(
+        TfidfVectorizer(analyzer="char_wb", ngram_range=NGRAM_RANGE,
+                        min_df=MIN_DF, max_features=MAX_FEATURES,
+                        sublinear_tf=True, dtype=np.float32),
+        LogisticRegression(class_weight="balanced", max_iter=1000),
+    )
+
+
+# ---- labels ------------------------------------------------------------
+def flagged_hashes(reports_dir=REPORTS_DIR, curated_dirs=()):
+    """Content hashes of flagged sets (images or manifests) and curated
+    positives."""
+    dirs = sorted(glob.glob(os.path.join(reports_dir, "flagged_*")))
+    hashes = set()
+    for folder in [*dirs, *curated_dirs]:
+        manifest = os.path.join(folder, FLAGGED_MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                hashes.update(json.loads(line)["image_hash"]
+                              for line in f if line.strip())
+        for path in iter_image_files(folder):
+            hashes.add(content_hash(path))
+    return hashes
+
+
+def build_training_set(ocr_file, images_dir=IMAGES_DIR,
+                       reports_dir=REPORTS_DIR, verdict_db=VERDICT_DB,
+                       curated_dirs=(), cache=None):
+    """
+    Return (texts, labels, keys): one sample per OCR entry (image, or post
+    directory for results.csv) that has at least one labeled image. An
+    entry is positive if any of its images is.
+    """
+    cache = cache or ImageCache()
+    ocr_texts = load_ocr_texts(ocr_file)
+    positives = flagged_hashes(reports_dir, curated_dirs)
+    verdicts = {}
+    if verdict_db and os.path.exists(verdict_db):
+        store = VerdictStore(verdict_db)
+        verdicts = store.image_labels()
+        store.close()
+
+    labels = defaultdict(bool)
+    for path in iter_image_files(images_dir):
+        text = text_for_image(path, ocr_texts)
+        if text is None:
+            continue
+        digest = cache.hash_of(path)
+        if digest in positives:
+            label = True
+        elif digest in verdicts:
+            label = verdicts[digest]
+        else:
+            continue
+        key = (os.path.abspath(path) if os.path.abspath(path) in ocr_texts
+               else os.path.basename(os.path.dirname(path)))
+        labels[key] = labels[key] or label
+
+    keys = sorted(labels)
+    return ([ocr_texts[key] for key in keys],
+            np.array([labels[key] for key in keys], dtype=np.int8), keys)
+
+
+# ---- training ----------------------------------------------------------
+def calibrate_threshold(labels, scores, target_recall=TARGET_RECALL):
+    """Highest threshold that still passes `target_recall` of the positives."""
+    positive = np.sort(np.asarray(scores)[np.asarray(labels) == 1])[::-1]
+    if not len(positive):
+        raise ValueError("No positive samples to calibrate on")
+    needed = max(1, math.ceil(target_recall * len(positive)))
+    return float(positive[needed - 1])
+
+
+def screen_metrics(labels, scores, threshold):
+    labels, passed = np.asarray(labels) == 1, np.asarray(scores) >= threshold
+    hits = int((labels & passed).sum())
+    return {
+        "threshold": threshold,
+        "recall": hits / max(1, labels.sum()),
+        "precision": hits / max(1, passed.sum()),
+        "pass_rate": float(passed.mean()) if len(passed) else 0.0,
+        "samples": int(len(labels)),
+        "positives": int(labels.sum()),
+    }
+
+
+def train(texts, labels, target_recall=TARGET_RECALL, folds=CV_FOLDS):
+    """
+    Fit the pipeline on all samples and calibrate the threshold on
+    out-of-fold scores, so it reflects unseen data. Returns the model dict
+    saved by save_model().
+    """
+    texts = [prepare_text(text) for text in texts]
+    labels = np.asarray(labels)
+    n_pos = int(labels.sum())
+    folds = min(folds, n_pos, len(labels) - n_pos)
+    if folds < 2:
+        raise ValueError(f"Need at least 2 samples of each class, "
+                         f"got {n_pos} positive / {len(labels) - n_pos} "
+                         f"negative")
+    cv = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+    oof = cross_val_predict(build_pipeline(), texts, labels, cv=cv,
+                            method="predict_proba")[:, 1]
+    threshold = calibrate_threshold(labels, oof, target_recall)
+
+    pipeline = build_pipeline().fit(texts, labels)
+    return {
+        "pipeline": pipeline,
+        "threshold": threshold,
+        "target_recall": target_recall,
+        "metrics": screen_metrics(labels, oof, threshold),
+        "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def save_model(model, path=MODEL_FILE):
+    joblib.dump(model, path)
+
+
+# ---- inference ---------------------------------------------------------
+class InjectionClassifier:
+    """
+    A trained model. `score` is vectorized over batches of texts; pass it
+    to triage.triage_images(score_batch=...) with `threshold` to screen
+    images.
+    """
+
+    def __init__(self, path=MODEL_FILE):
+        model = joblib.load(path)
+        self.pipeline = model["pipeline"]
+        self.threshold = model["threshold"]
+        self.metrics = model.get("metrics", {})
+
+    def score(self, texts, batch_size=SCORE_BATCH):
+        """Injection probability for each text."""
+        texts = [prepare_text(text) for text in texts]
+        scores = np.empty(len(texts), dtype=np.float32)
+        for i in range(0, len(texts), batch_size):
+            scores[i:i + batch_size] = self.pipeline.predict_proba(
+                texts[i:i + batch_size])[:, 1]
+        return scores
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Train or apply the local injection classifier."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_train = sub.add_parser("train", help="Fit on flagged/verdict labels.")
+    p_train.add_argument("ocr_file",
+                         help="OCR output: results.csv, .jsonl or .parquet.")
+    p_train.add_argument("--images-dir", default=IMAGES_DIR)
+    p_train.add_argument("--reports-dir", default=REPORTS_DIR)
+    p_train.add_argument("--verdict-db", default=VERDICT_DB)
+    p_train.add_argument("--curated", nargs="*", default=[],
+                         help="Folders of manually confirmed injections.")
+    p_train.add_argument("--target-recall", type=float,
+                         default=TARGET_RECALL)
+    p_train.add_argument("-o", "--out", default=MODEL_FILE)
+
+    p_score = sub.add_parser("score", help="Score OCR output.")
+    p_score.add_argument("ocr_file")
+    p_score.add_argument("--model", default=MODEL_FILE)
+    p_score.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        texts, labels, _ = build_training_set(
+            args.ocr_file, args.images_dir, args.reports_dir,
+            args.verdict_db, args.curated)
+        print(f"Training on {len(texts)} samples "
+              f"({int(labels.sum())} positive)...")
+        model = train(texts, labels, args.target_recall)
+        save_model(model, args.out)
+        m = model["metrics"]
+        print(f"✅ Saved → {args.out}: threshold {m['threshold']:.3f}, "
+              f"cross-validated recall {m['recall']:.1%}, precision "
+              f"{m['precision']:.1%}, pass rate {m['pass_rate']:.1%}")
+    else:
+        classifier = InjectionClassifier(args.model)
+        ocr_texts = load_ocr_texts(args.ocr_file)
+        keys = list(ocr_texts)
+        start = time.perf_counter()
+        scores = classifier.score(ocr_texts[key] for key in keys)
+        elapsed = time.perf_counter() - start
+        passing = int((scores >= classifier.threshold).sum())
+        print(f"{passing} / {len(keys)} entries score >= "
+              f"{classifier.threshold:.3f} "
+              f"({len(keys) / max(elapsed, 1e-9):.0f} texts/s)")
+        for i in np.argsort(-scores)[:args.top]:
+            print(f"{scores[i]:.3f}  {keys[i]}")
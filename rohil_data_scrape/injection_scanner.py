@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Injection phrase scanner for comments and OCR text.
+
+Every phrase of a pattern library (injection_patterns.txt: categories of
+English and Chinese phrases) goes into one Aho-Corasick automaton, so a
+text is checked against all of them in a single pass over its characters,
+and every occurrence is reported, overlapping ones included.
+
+Text and phrases are normalized the same way first, with text_normalize's
+strictest folds: full-width and other compatibility forms (𝐢𝐠𝐧𝐨𝐫𝐞, ⓘ) fold
+to ASCII, Cyrillic and Greek look-alikes fold to the Latin letters they
+imitate, zero-width characters are dropped, case is folded, whitespace runs
+become one space and spaces OCR puts between Chinese characters are
+removed. Matches are mapped back to offsets in the original text.
+
+Lines are scanned in batches: the automaton is a dense transition table and
+the batch one array of symbols, walked by a numba-compiled loop, so only
+the rare lines with a hit need any further Python work.
+"""
+
+import os
+import sys
+import json
+import time
+from collections import Counter
+
+import numpy as np
+from numba import njit                  # pip install numba
+
+from filter import comment_text
+from text_normalize import CJK_GAP_RE, SPACE_RUN_RE, fold_table
+
+PATTERN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "injection_patterns.txt")
+BATCH_LINES = 8192          # texts joined per automaton run
+# Joins a batch: a noncharacter, left alone by normalization and in no phrase
+SEPARATOR = "\uffff"
+
+# ---- normalization -----------------------------------------------------
+FOLD_TABLE = fold_table(lower=True, homoglyphs=True, compat=True)
+SQUEEZE = [(SPACE_RUN_RE, " "), (CJK_GAP_RE, "")]
+
+
+def normalize(text):
+    """Scanning form of a text (see the module docstring)."""
+    text = text.translate(FOLD_TABLE)
+    for regex, repl in SQUEEZE:
+        text = regex.sub(repl, text)
+    return text
+
+
+def normalize_with_offsets(text):
+    """normalize(text) plus the original index of each of its characters."""
+    origin, chars = [], []
+    for i, char in enumerate(text):
+        folded = char.translate(FOLD_TABLE)
+        if folded:
+            origin.append(i)
+            chars.append(folded)
+    norm = "".join(chars)
+    for regex, repl in SQUEEZE:
+        pieces, positions, last = [], [], 0
+        for match in regex.finditer(norm):
+            start = match.start()
+            pieces.append(norm[last:start] + repl)
+            positions += origin[last:start + len(repl)]
+            last = match.end()
+        pieces.append(norm[last:])
+        positions += origin[last:]
+        norm, origin = "".join(pieces), positions
+    return norm, origin
+
+
+# ---- pattern library ---------------------------------------------------
+def load_patterns(path=PATTERN_FILE):
+    """[(phrase, category)] from a library file of [category] sections."""
+    patterns, category = [], "default"
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line.startswith("[") and line.endswith("]"):
+                category = line[1:-1].strip()
+            elif line:
+                patterns.append((line, category))
+    return patterns
+
+
+# ---- automaton ---------------------------------------------------------
+@njit(cache=True)
+def _walk(symbols, delta, accepting):
+    """Positions and states of every accepting step of the automaton."""
+    positions = np.empty(symbols.shape[0], dtype=np.int64)
+    states = np.empty(symbols.shape[0], dtype=np.int32)
+    state, k = 0, 0
+    for i in range(symbols.shape[0]):
+        state = delta[state, symbols[i]]
+        if accepting[state]:
+            positions[k] = i
+            states[k] = state
+            k += 1
+    return positions[:k], states[:k]
+
+
+class PhraseScanner:
+    """
+    Aho-Corasick automaton over normalized phrases. `scan(text)` and
+    `scan_batch(texts)` return matches as (start, end, phrase, category)
+    with offsets into the original text, in order of their end.
+    """
+
+    def __init__(self, patterns=None):
+        if patterns is None:
+            patterns = load_patterns()
+        self.phrases, self.categories, keys = [], [], []
+        for phrase, category in patterns:
+            key = normalize(phrase)
+            if key:
+                self.phrases.append(phrase)
+                self.categories.append(category)
+                keys.append(key)
+        self.lengths = [len(key) for key in keys]
+
+        # Symbol 0 stands for every character no phrase contains; `lookup`
+        # maps codepoints to symbols, its last entry catching larger ones
+        alphabet = sorted({char for key in keys for char in key})
+        symbol = {char: i + 1 for i, char in enumerate(alphabet)}
+        self.lookup = np.zeros(max(map(ord, alphabet), default=0) + 2,
+                               dtype=np.int32)
+        for char, sym in symbol.items():
+            self.lookup[ord(char)] = sym
+
+        # Trie, then failure links breadth-first, filling in the full
+        # transition table and each state's output phrases
+        goto, outputs = [{}], [[]]
+        for index, key in enumerate(keys):
+            state = 0
+            for char in key:
+                if symbol[char] not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][symbol[char]] = len(goto) - 1
+                state = goto[state][symbol[char]]
+            outputs[state].append(index)
+        delta = np.zeros((len(goto), len(alphabet) + 1), dtype=np.int32)
+        for sym, child in goto[0].items():
+            delta[0, sym] = child
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for sym, child in goto[state].items():
+                fail[child] = delta[fail[state], sym]
+                outputs[child] = outputs[child] + outputs[fail[child]]
+                queue.append(child)
+            delta[state] = delta[fail[state]]
+            for sym, child in goto[state].items():
+                delta[state, sym] = child
+        self.delta = delta
+        self.outputs = outputs
+        self.accepting = np.array([bool(out) for out in outputs])
+
+    def find_batch(self, texts):
+        """
+        {index: matches} for the texts of a batch that have any. The batch
+        is normalized and walked as one string; the separator between texts
+        is not in the alphabet, so the automaton restarts at each text.
+        """
+        if not texts or not self.phrases:
+            return {}
+        joined = SEPARATOR.join(texts)
+        if joined.count(SEPARATOR) != len(texts) - 1:
+            # A text holds the separator itself; blank it (same length, so
+            # offsets still hold)
+            texts = [text.replace(SEPARATOR, " ") for text in texts]
+            joined = SEPARATOR.join(texts)
+        codes = np.frombuffer(normalize(joined).encode("utf-32-le"),
+                              dtype=np.uint32)
+        starts = np.concatenate(
+            ([0], np.flatnonzero(codes == ord(SEPARATOR)) + 1))
+        symbols = self.lookup[np.minimum(codes, len(self.lookup) - 1)]
+        positions, states = _walk(symbols, self.delta, self.accepting)
+        owners = np.searchsorted(starts, positions, side="right") - 1
+
+        found, origins = {}, {}
+        for position, state, owner in zip(positions.tolist(), states.tolist(),
+                                          owners.tolist()):
+            if owner not in origins:
+                origins[owner] = normalize_with_offsets(texts[owner])[1]
+                found[owner] = []
+            origin = origins[owner]
+            end = position - int(starts[owner])
+            for index in self.outputs[state]:
+                start = end - self.lengths[index] + 1
+                found[owner].append((origin[start], origin[end] + 1,
+                                     self.phrases[index],
+                                     self.categories[index]))
+        return found
+
+    def scan_batch(self, texts):
+        """Matches per text, from one automaton run over the whole batch."""
+        texts = list(texts)
+        found = self.find_batch(texts)
+        return [found.get(i, []) for i in range(len(texts))]
+
+    def scan(self, text):
+        return self.scan_batch([text])[0]
+
+
+# ---- corpus scanning ---------------------------------------------------
+def iter_sources(input_paths=(), field=None, ocr_path=None):
+    """(source, id, text) for comment lines (id = line number) and OCR."""
+    for path in input_paths:
+        infile = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            for number, line in enumerate(infile, 1):
+                text = comment_text(line, field)
+                if text:
+                    yield path, number, text
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+    if ocr_path:
+        from triage import load_ocr_texts
+        for key, text in load_ocr_texts(ocr_path).items():
+            if text:
+                yield ocr_path, key, text
+
+
+def scan_sources(sources, output_path, scanner=None,
+                 batch_lines=BATCH_LINES):
+    """
+    Write one JSONL record per text with matches (source, id, text and
+    matches with offsets, phrase and category). Returns a Counter of texts
+    scanned, texts matched, and matches per category.
+    """
+    scanner = scanner or PhraseScanner()
+    stats = Counter()
+    out = sys.stdout if output_path == "-" else \
+        open(output_path, "w", encoding="utf-8")
+
+    def flush(batch):
+        found = scanner.find_batch([text for _, _, text in batch])
+        stats["scanned"] += len(batch)
+        stats["matched"] += len(found)
+        for i, matches in sorted(found.items()):
+            source, key, text = batch[i]
+            stats.update(category for _, _, _, category in matches)
+            out.write(json.dumps({
+                "source": source, "id": key, "text": text,
+                "matches": [{"start": start, "end": end, "phrase": phrase,
+                             "category": category,
+                             "found": text[start:end]}
+                            for start, end, phrase, category in matches],
+            }, ensure_ascii=False) + "\n")
+
+    try:
+        batch = []
+        for item in sources:
+            batch.append(item)
+            if len(batch) >= batch_lines:
+                flush(batch)
+                batch = []
+        flush(batch)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return stats
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Find injection phrases in comments and OCR text "
+                    "(Aho-Corasick over a phrase library)."
+    )
+    parser.add_argument("inputs", nargs="*",
+                        help="Comment files (text lines, or JSONL with "
+                             "--jsonl); '-' reads stdin.")
+    parser.add_argument("--ocr", default=None,
+                        help="OCR output to scan too: results.csv, .jsonl "
+                             "or .parquet.")
+    parser.add_argument("--jsonl", nargs="?", const="text", default=None,
+                        metavar="FIELD",
+                        help="Inputs are JSONL; scan FIELD (default: text).")
+    parser.add_argument("--patterns", default=PATTERN_FILE,
+                        help="Phrase library (default: injection_patterns.txt).")
+    parser.add_argument("-o", "--out", default="injection_matches.jsonl",
+                        help="JSONL of texts with matches; '-' for stdout "
+                             "(default: injection_matches.jsonl).")
+    args = parser.parse_args()
+    if not args.inputs and not args.ocr:
+        parser.error("give comment files and/or --ocr")
+
+    start = time.perf_counter()
+    scanner = PhraseScanner(load_patterns(args.patterns))
+    stats = scan_sources(iter_sources(args.inputs, args.jsonl, args.ocr),
+                         args.out, scanner)
+    elapsed = time.perf_counter() - start
+    print(f"✅ {stats['scanned']} texts scanned in {elapsed:.1f}s "
+          f"({stats['scanned'] / max(elapsed, 1e-9) * 60:,.0f} / min), "
+          f"{stats['matched']} with matches → {args.out}", file=sys.stderr)
+    for category in sorted(set(scanner.categories)):
+        print(f"   {category}: {stats[category]}", file=sys.stderr)
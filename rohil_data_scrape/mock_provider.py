@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the LLM providers, for load tests and offline runs.
+
+Serves the OpenAI-compatible chat completions endpoint (/v1/chat/completions,
+used by llm_detector.py) and the DashScope multimodal generation endpoint
+(/api/v1/services/aigc/multimodal-generation/generation, used by
+model_pipeline.py). Answers are synthetic but well-formed: one verdict per
+image in the detector's JSON format, a suspicious verdict for a fixed share
+of images (decided by a hash of the image data, so repeat requests agree).
+
+Provider conditions are configurable through MockConfig: a log-normal
+latency distribution, fixed request windows answered with 429 and
+Retry-After once full, 5xx errors, stalls longer than the client timeout,
+answers truncated mid-JSON and response bodies that are not JSON at all.
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+from providers import DASHSCOPE_PATH
+
+OPENAI_PATH = "/v1/chat/completions"
+DASHSCOPE_ROOT = "/api/v1"
+IMAGE_TOKENS = 258              # prompt tokens charged per image
+
+
+class MockConfig(NamedTuple):
+    latency_ms: float = 300.0       # median latency per request
+    latency_sigma: float = 0.3      # log-normal shape; 0 = constant
+    per_image_ms: float = 0.0       # added per image in the request
+    window_requests: int = 0        # requests admitted per window; 0 = no limit
+    window_seconds: float = 60.0
+    error_rate: float = 0.0         # share answered with HTTP 500
+    stall_rate: float = 0.0         # share stalled for stall_seconds
+    stall_seconds: float = 30.0
+    malformed_rate: float = 0.0     # share whose answer is cut off mid-JSON
+    bad_body_rate: float = 0.0      # share whose HTTP body is not JSON
+    suspicious_rate: float = 0.1    # share of images judged suspicious
+
+
+# Named provider conditions for the benchmark
+SCENARIOS = {
+    "ideal": MockConfig(latency_ms=300, latency_sigma=0.2),
+    "realistic": MockConfig(latency_ms=800, latency_sigma=0.5,
+                            per_image_ms=60, malformed_rate=0.03,
+                            stall_rate=0.01),
+    "throttled": MockConfig(latency_ms=800, latency_sigma=0.5,
+                            per_image_ms=60, window_requests=10,
+                            window_seconds=10),
+    "flaky": MockConfig(latency_ms=800, latency_sigma=0.8, per_image_ms=60,
+                        error_rate=0.05, stall_rate=0.05, malformed_rate=0.1,
+                        bad_body_rate=0.05),
+}
+
+
+# ---- request parsing ---------------------------------------------------
+def openai_parts(body):
+    """(text parts, image data) of an OpenAI-style chat request."""
+    texts, images = [], []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                texts.append(part["text"])
+            elif part.get("type") == "image_url":
+                images.append(part["image_url"]["url"])
+    return texts, images
+
+
+def dashscope_parts(body):
+    """(text parts, image data) of a DashScope multimodal request."""
+    texts, images = [], []
+    for message in body.get("input", {}).get("messages", []):
+        for part in message.get("content", []):
+            if "text" in part:
+                texts.append(part["text"])
+            elif "image" in part:
+                images.append(part["image"])
+    return texts, images
+
+
+def is_suspicious(image, rate):
+    digest = hashlib.sha256(image.encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") < rate * 2 ** 32
+
+
+def verdict_answer(images, rate):
+    """The detector's JSON array, one object per image."""
+    return json.dumps([
+        {"image_index": i,
+         "is_suspicious": is_suspicious(image, rate),
+         "analysis": ("Embedded instruction asks to output the /prompt"
+                      if is_suspicious(image, rate)
+                      else "No suspicious content found")}
+        for i, image in enumerate(images, 1)
+    ], indent=2)
+
+
+def text_answer(images, rate):
+    """Free-text answer for single-image prompts (model_pipeline.py)."""
+    if any(is_suspicious(image, rate) for image in images):
+        return "Suspicious: embedded instruction asks to output the /prompt."
+    return "No suspicious content found."
+
+
+# ---- server ------------------------------------------------------------
+class MockState:
+    """Fault decisions and counters shared by the handler threads."""
+
+    def __init__(self, config, seed=0):
+        self.config = config
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.window_start = time.monotonic()
+        self.window_count = 0
+
+    def admit(self):
+        """None if the request fits the current window, else the seconds
+        until the window resets."""
+        config = self.config
+        if not config.window_requests:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= config.window_seconds:
+                self.window_start, self.window_count = now, 0
+            if self.window_count < config.window_requests:
+                self.window_count += 1
+                return None
+            return config.window_seconds - (now - self.window_start)
+
+    def draw(self, n_images):
+        """Pick this request's fault ("ok", "error", ...) and latency."""
+        config = self.config
+        with self.lock:
+            roll = self.rng.random()
+            latency = config.latency_ms * math.exp(
+                self.rng.gauss(0, config.latency_sigma))
+        fault = "ok"
+        for name, rate in (("error", config.error_rate),
+                           ("stall", config.stall_rate),
+                           ("malformed", config.malformed_rate),
+                           ("bad_body", config.bad_body_rate)):
+            if roll < rate:
+                fault = name
+                break
+            roll -= rate
+        return fault, (latency + config.per_image_ms * n_images) / 1000
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # keep-alive, like the real endpoints
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = (payload if isinstance(payload, bytes)
+                else json.dumps(payload).encode("utf-8"))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        state = self.server.state
+        body = json.loads(self.rfile.read(
+            int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") == OPENAI_PATH:
+            api = "openai"
+            texts, images = openai_parts(body)
+        elif self.path == DASHSCOPE_ROOT + DASHSCOPE_PATH:
+            api = "dashscope"
+            texts, images = dashscope_parts(body)
+        else:
+            self.send_json(404, {"error": {"message": f"No route {self.path}"}})
+            return
+        state.count("requests")
+
+        wait = state.admit()
+        if wait is not None:
+            state.count("throttled")
+            self.send_json(429, {"error": {"message": "Rate limit exceeded",
+                                           "type": "rate_limit_error"},
+                                 "code": "Throttling.RateQuota"},
+                           {"Retry-After": str(max(1, math.ceil(wait)))})
+            return
+
+        fault, latency = state.draw(len(images))
+        if fault == "stall":
+            state.count("stalled")
+            latency = state.config.stall_seconds
+        time.sleep(latency)
+        if fault == "error":
+            state.count("errors")
+            self.send_json(500, {"error": {"message": "Internal error",
+                                           "type": "server_error"}})
+            return
+        if fault == "bad_body":
+            state.count("bad_body")
+            self.send_json(200, b'{"choices": [{"message": ')
+            return
+
+        prompt = "\n".join(texts)
+        if "image_index" in prompt:
+            answer = verdict_answer(images, state.config.suspicious_rate)
+        else:
+            answer = text_answer(images, state.config.suspicious_rate)
+        if fault == "malformed":
+            state.count("malformed")
+            answer = answer[:len(answer) // 2]
+        state.count("answered")
+        state.count("images", len(images))
+
+        input_tokens = IMAGE_TOKENS * len(images) + len(prompt) // 4
+        output_tokens = len(answer) // 4
+        model = body.get("model", "mock")
+        if api == "openai":
+            self.send_json(200, {
+                "id": f"chatcmpl-mock{state.counts['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant",
+                                         "content": answer}}],
+                "usage": {"prompt_tokens": input_tokens,
+                          "completion_tokens": output_tokens,
+                          "total_tokens": input_tokens + output_tokens},
+            })
+        else:
+            self.send_json(200, {
+                "request_id": f"mock-{state.counts['requests']}",
+                "output": {"choices": [{"finish_reason": "stop",
+                                        "message": {"role": "assistant",
+                                                    "content": [
+                                                        {"text": answer}]}}]},
+                "usage": {"input_tokens": input_tokens,
+                          "output_tokens": output_tokens},
+            })
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a stalled request
+            self.close_connection = True
+
+
+class MockServer:
+    """
+    The mock provider on a background thread. Use as a context manager;
+    `openai_url` and `dashscope_url` are the base URLs for the providers.
+    """
+
+    def __init__(self, config=MockConfig(), host="127.0.0.1", port=0, seed=0):
+        self.state = MockState(config, seed)
+        self.httpd = ThreadingHTTPServer((host, port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        host, port = self.httpd.server_address[:2]
+        self.openai_url = f"http://{host}:{port}/v1/"
+        self.dashscope_url = f"http://{host}:{port}{DASHSCOPE_ROOT}"
+        self.thread = None
+
+    @property
+    def counts(self):
+        return dict(self.state.counts)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Serve a simulated OpenAI-compatible / DashScope API."
+    )
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS),
+                        default="realistic")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockServer(SCENARIOS[args.scenario], port=args.port,
+                        seed=args.seed)
+    print(f"Mock provider ({args.scenario}) on {server.openai_url} "
+          f"and {server.dashscope_url}; Ctrl+C to stop")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n{server.counts}")
+        server.httpd.server_close()
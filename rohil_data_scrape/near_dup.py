@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate clustering for the comment corpus: MinHash signatures over
+character shingles, LSH banding for candidates, Jaccard check, union-find.
+
+Comments are normalized (text_normalize with case and compatibility folds,
+then punctuation / emoji / whitespace dropped) so copy-pasted spam that
+differs only in those still matches, then
+cut into SHINGLE_SIZE-character shingles. Shingle hashes and their minimum
+under NUM_PERM multiply-shift permutations are computed for whole batches
+of comments at once in NumPy.
+
+Signatures are split into BANDS bands of ROWS values; comments sharing any
+band key are candidates, kept if their estimated Jaccard similarity reaches
+JACCARD_THRESHOLD. Band keys and 8-bit signatures are spilled to disk one
+file per band, and each band is sorted on its own, so memory stays at a
+few columns of n values however large the corpus. Each cluster keeps its
+first comment as the representative, plus a count.
+"""
+
+import os
+import re
+import json
+import tempfile
+
+import numpy as np
+
+from filter import iter_comment_lines
+from phash import _union_find
+from text_normalize import normalize as normalize_text
+
+# Signature geometry: BANDS * ROWS = NUM_PERM; candidates are likely above
+# a similarity of about (1 / BANDS) ** (1 / ROWS) (~0.42 here)
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+JACCARD_THRESHOLD = 0.7     # estimated similarity for a near-duplicate
+
+BATCH_SHINGLES = 1 << 15    # shingles hashed per vectorized batch
+VERIFY_CHUNK = 1 << 16      # candidate pairs checked at a time
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+_rng = np.random.default_rng(0x5EED)
+PERM_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+PERM_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+SHINGLE_MULT = _rng.integers(1, 2 ** 63, SHINGLE_SIZE, dtype=np.uint64) \
+    | np.uint64(1)
+BAND_MULT = _rng.integers(1, 2 ** 63, ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+# ---- signatures --------------------------------------------------------
+def normalize(text):
+    """Comparison form of a comment; the stripped text if nothing is left."""
+    folded = NON_WORD_RE.sub("", normalize_text(text, lower=True, compat=True))
+    return folded or text.strip()
+
+
+def _mix(x):
+    """splitmix64 finalizer: spreads codepoint sums over all 64 bits."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash(texts):
+    """(n, NUM_PERM) uint32 MinHash signatures of normalized texts."""
+    k = SHINGLE_SIZE
+    # Short texts are padded so every text has at least one shingle
+    texts = [t.ljust(k, "\0") for t in texts]
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"),
+                          dtype=np.uint32).astype(np.uint64)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # Hash of the shingle starting at every position, then keep positions
+    # whose shingle lies inside one text
+    h = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+    for j in range(k):
+        h += codes[j:len(codes) - k + 1 + j] * SHINGLE_MULT[j]
+    counts = lengths - k + 1
+    owner = np.repeat(np.arange(len(texts)), counts)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    positions = starts[owner] + np.arange(counts.sum()) - first[owner]
+    shingles = _mix(h[positions])
+
+    # Multiply-shift permutations: top 32 bits of a * x + b (mod 2 ** 64),
+    # laid out (NUM_PERM, shingles) so the per-text minimum runs along rows
+    with np.errstate(over="ignore"):
+        values = np.multiply.outer(PERM_A, shingles)
+        values += PERM_B[:, None]
+    values >>= np.uint64(32)
+    return np.minimum.reduceat(values, first, axis=1).T.astype(np.uint32)
+
+
+def band_keys(signatures):
+    """(n, BANDS) uint64: one hash per band of ROWS signature values."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return _mix((bands * BAND_MULT).sum(axis=2, dtype=np.uint64))
+
+
+def iter_batches(texts):
+    """Lists of texts holding about BATCH_SHINGLES shingles each."""
+    batch, size = [], 0
+    for text in texts:
+        batch.append(text)
+        size += max(len(text), SHINGLE_SIZE)
+        if size >= BATCH_SHINGLES:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+# ---- clustering --------------------------------------------------------
+def estimated_jaccard(sig8, left, right):
+    """Similarity from 8-bit signatures, corrected for 1/256 chance hits."""
+    matches = (sig8[left] == sig8[right]).mean(axis=1)
+    return (matches - 1 / 256) / (1 - 1 / 256)
+
+
+def cluster_store(store_dir, n, threshold=JACCARD_THRESHOLD):
+    """
+    Cluster label per comment (the index of its first member) from the band
+    key files and signature memmap that write_store left in `store_dir`.
+    """
+    labels = np.arange(n)
+    if n < 2:
+        return labels
+    sig8 = np.memmap(os.path.join(store_dir, "sig8.u8"), dtype=np.uint8,
+                     mode="r", shape=(n, NUM_PERM))
+    for band in range(BANDS):
+        keys = np.fromfile(os.path.join(store_dir, f"band_{band:02d}.u64"),
+                           dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        same = keys[order[1:]] == keys[order[:-1]]
+        del keys
+        left, right = order[:-1][same], order[1:][same]
+        # Pairs already joined by an earlier band need no check
+        pending = labels[left] != labels[right]
+        left, right = left[pending], right[pending]
+        keep = np.zeros(len(left), dtype=bool)
+        for start in range(0, len(left), VERIFY_CHUNK):
+            chunk = slice(start, start + VERIFY_CHUNK)
+            keep[chunk] = estimated_jaccard(sig8, left[chunk],
+                                            right[chunk]) >= threshold
+        if keep.any():
+            parent = _union_find(n, labels[left[keep]], labels[right[keep]])
+            labels = parent[labels]
+    return labels
+
+
+def write_store(texts, store_dir):
+    """Signatures of normalized `texts`, spilled band by band; returns n."""
+    band_files = [open(os.path.join(store_dir, f"band_{b:02d}.u64"), "wb")
+                  for b in range(BANDS)]
+    n = 0
+    try:
+        with open(os.path.join(store_dir, "sig8.u8"), "wb") as sig_file:
+            for batch in iter_batches(normalize(t) for t in texts):
+                signatures = minhash(batch)
+                keys = band_keys(signatures)
+                for band, f in enumerate(band_files):
+                    keys[:, band].tofile(f)
+                (signatures & 0xFF).astype(np.uint8).tofile(sig_file)
+                n += len(batch)
+    finally:
+        for f in band_files:
+            f.close()
+    return n
+
+
+def cluster_texts(texts, threshold=JACCARD_THRESHOLD, tmp_dir=None):
+    """Cluster label per text (the index of its cluster's first text)."""
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as store_dir:
+        n = write_store(texts, store_dir)
+        return cluster_store(store_dir, n, threshold)
+
+
+def dedup_files(input_paths, output_path, field=None,
+                threshold=JACCARD_THRESHOLD, tmp_dir=None):
+    """
+    Two streaming passes over comment files (text lines, or JSONL records
+    filtered on `field`): cluster, then write each cluster's first comment,
+    as it appears in the input, as a JSONL record with its "dup_count".
+    Returns (comments, clusters). Stdin ("-") cannot be read twice, so it
+    is rejected; save it to a file first.
+    """
+    if "-" in input_paths:
+        raise ValueError("stdin cannot be read twice; pass a file instead")
+
+    def comments():
+        return ((key, line) for key, line in
+                iter_comment_lines(input_paths, field) if key)
+
+    labels = cluster_texts((key for key, _ in comments()), threshold, tmp_dir)
+    sizes = np.bincount(labels, minlength=len(labels))
+    written = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        for i, (key, line) in enumerate(comments()):
+            if labels[i] != i:
+                continue
+            record = json.loads(line) if field else {"text": line}
+            record["dup_count"] = int(sizes[i])
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+    return len(labels), written
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(
+        description="Collapse near-duplicate comments into one representative "
+                    "plus a count (MinHash / LSH)."
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="Comment files (text lines, or JSONL with "
+                             "--jsonl); not stdin, which is read twice.")
+    parser.add_argument("-o", "--out", default="comment_clusters.jsonl",
+                        help="JSONL of representatives with dup_count "
+                             "(default: comment_clusters.jsonl).")
+    parser.add_argument("--jsonl", nargs="?", const="text", default=None,
+                        metavar="FIELD",
+                        help="Inputs are JSONL; compare FIELD (default: text).")
+    parser.add_argument("--threshold", type=float, default=JACCARD_THRESHOLD,
+                        help=f"Estimated Jaccard similarity of near-duplicates "
+                             f"(default: {JACCARD_THRESHOLD}).")
+    parser.add_argument("--tmp-dir", default=None,
+                        help="Where signatures are spilled.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    n, clusters = dedup_files(args.inputs, args.out, args.jsonl,
+                              args.threshold, args.tmp_dir)
+    print(f"✅ {n} comments → {clusters} clusters "
+          f"({n - clusters} near-duplicates, "
+          f"{time.perf_counter() - start:.1f}s) → {args.out}")
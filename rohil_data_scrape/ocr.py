@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 """
 Batch-OCR for a tree of image folders.
-Each CSV row = one sub-directory of images.
+Each CSV row = one sub-directory of images; with a .jsonl / .parquet output
+the tree is streamed instead as one record per image and per text line.
 """
 
 import os
 import csv
+import json
 from pathlib import Path
 
 from PIL import Image       # pip install pillow
+from image_cache import ImageCache, iter_image_files
 #import pytesseract          # pip install pytesseract
 import pytesseract, platform
 if platform.system() == "Windows":
@@ -17,35 +20,75 @@ if platform.system() == "Windows":
 # macOS:   brew install tesseract
 # Ubuntu:  sudo apt-get install tesseract-ocr
 LANGS = "eng+chi_sim"
+PSM = 6
+# clean() variants, benchmarked by ocr_benchmark.py
+PREPROCESS_MODES = ("none", "gray", "clean", "invert")
+# Streaming record output: one "image" record plus one "line" record per
+# text line, all sharing this flat schema so they load column-wise. An
+# image that could not be read or OCRed still gets its image record, with
+# empty text and the reason in "error".
+RECORD_FIELDS = ["directory", "image", "record_type", "line_num", "text",
+                 "confidence", "left", "top", "width", "height", "error"]
+RECORD_FORMATS = ("jsonl", "parquet")
+FLUSH_EVERY = 500           # records buffered between writes to disk
+# Pluggable OCR backends; "onnx" lives in ocr_onnx.py
+OCR_ENGINES = ("tesseract", "onnx")
+ENGINE_BATCH = 8            # images per engine.recognize() call
 # ---- core --------------------------------------------------------------
-def clean(img):
-    """Simple Pillow pipeline: grayscale → autocontrast → denoise."""
+def clean(img, mode="clean", scale=1.0):
+    """Simple Pillow pipeline: grayscale → autocontrast → denoise.
+
+    `mode` selects a variant: "none" (untouched RGB), "gray" (grayscale only),
+    "clean" (the full pipeline) or "invert" (full pipeline, then inverted so
+    dark-mode screenshots become dark text on white). `scale` resizes first.
+    """
     from PIL import ImageOps, ImageFilter
+    if mode not in PREPROCESS_MODES:
+        raise ValueError(f"Unknown preprocess mode: {mode!r}")
+    if scale != 1.0:
+        img = img.resize((max(1, round(img.width * scale)),
+                          max(1, round(img.height * scale))),
+                         Image.LANCZOS)
+    if mode == "none":
+        return img.convert("RGB")
     img = img.convert("L")
+    if mode == "gray":
+        return img
     img = ImageOps.autocontrast(img)
-    return img.filter(ImageFilter.MedianFilter())
+    img = img.filter(ImageFilter.MedianFilter())
+    if mode == "invert":
+        img = ImageOps.invert(img)
+    return img
 
 
 def ocr_images_in_tree(root_dir: str,
                        output_csv: str = "ocr_output.csv",
-                       img_exts = (".png", ".jpg", ".jpeg",
-                                   ".tif", ".tiff", ".bmp", ".gif")
+                       img_exts = None,
+                       cache: ImageCache = None
                       ) -> None:
     """
     Run OCR on every image inside each *immediate* sub-directory of `root_dir`
-    and write results to `output_csv`.
+    and write results to `output_csv`. Images of any format are picked up
+    (or only those ending in one of `img_exts`, if given) and read through
+    the shared image cache's grayscale copy.
     """
     root = Path(root_dir).expanduser().resolve()
+    cache = cache or ImageCache()
+    if img_exts is not None:
+        img_exts = tuple(ext.lower() for ext in img_exts)
 
     rows = []
     for subdir in [d for d in root.iterdir() if d.is_dir()]:
         texts = []
 
-        for img_path in subdir.rglob("*.[jJ][pP][gG]"):   # catches .jpg .JPG
+        for img_path in iter_image_files(subdir):
+            if img_exts is not None and \
+                    not img_path.lower().endswith(img_exts):
+                continue
             try:
-                img = clean(Image.open(img_path))
+                img = clean(cache.gray_image(img_path))
                 txt = pytesseract.image_to_string(
-                        img, lang=LANGS, config="--psm 6").strip()
+                        img, lang=LANGS, config=f"--psm {PSM}").strip()
                 if txt: texts.append(txt)
             except Exception as e:
                 print(f"⚠️  {img_path} failed: {e}")
@@ -70,17 +113,412 @@ def ocr_images_in_tree(root_dir: str,
 
     print(f"✅ Saved OCR for {len(rows)} sub-directories → {output_csv}")
 
+# ---- streaming per-image / per-line records ----------------------------
+def ocr_line_records(img, lang=LANGS, psm=PSM):
+    """
+    OCR an already-cleaned image with tesseract's data output and group the
+    words into lines. Returns a list of dicts with text, mean word confidence
+    and the line's bounding box in pixels of `img`.
+    """
+    data = pytesseract.image_to_data(img, lang=lang, config=f"--psm {psm}",
+                                     output_type=pytesseract.Output.DICT)
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():    # layout rows carry conf == -1
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        left, top = data["left"][i], data["top"][i]
+        right, bottom = left + data["width"][i], top + data["height"][i]
+        line = lines.get(key)
+        if line is None:
+            lines[key] = {"words": [word], "confs": [conf], "box":
+                          [left, top, right, bottom]}
+        else:
+            line["words"].append(word)
+            line["confs"].append(conf)
+            box = line["box"]
+            box[0], box[1] = min(box[0], left), min(box[1], top)
+            box[2], box[3] = max(box[2], right), max(box[3], bottom)
+
+    records = []
+    for line_num, key in enumerate(sorted(lines)):
+        line = lines[key]
+        left, top, right, bottom = line["box"]
+        records.append({
+            "line_num": line_num,
+            "text": " ".join(line["words"]),
+            "confidence": sum(line["confs"]) / len(line["confs"]),
+            "left": left, "top": top,
+            "width": right - left, "height": bottom - top,
+        })
+    return records
+
+
+# ---- OCR engines -------------------------------------------------------
+class OcrEngine:
+    """
+    Backend interface: recognize() takes a list of PIL images and returns,
+    per image, a list of line records with the ocr_line_records schema
+    (line_num, text, confidence 0-100, left, top, width, height) in pixel
+    coordinates of the original image.
+    """
+
+    name = "base"
+
+    def recognize(self, images):
+        raise NotImplementedError
+
+
+class TesseractEngine(OcrEngine):
+    """One tesseract call per image, after clean() preprocessing."""
+
+    name = "tesseract"
+
+    def __init__(self, lang=LANGS, psm=PSM, preprocess="clean", scale=1.0):
+        self.lang = lang
+        self.psm = psm
+        self.preprocess = preprocess
+        self.scale = scale
+
+    def recognize(self, images):
+        results = []
+        for img in images:
+            lines = ocr_line_records(clean(img, self.preprocess, self.scale),
+                                     lang=self.lang, psm=self.psm)
+            if self.scale != 1.0:
+                for line in lines:
+                    for key in ("left", "top", "width", "height"):
+                        line[key] = round(line[key] / self.scale)
+            results.append(lines)
+        return results
+
+
+def get_engine(name="tesseract", **options):
+    """Build an OCR engine by name (see OCR_ENGINES)."""
+    if name == "tesseract":
+        return TesseractEngine(**options)
+    if name == "onnx":
+        from ocr_onnx import OnnxOcrEngine
+        return OnnxOcrEngine(**options)
+    raise ValueError(f"Unknown OCR engine: {name!r}")
+
+
+def build_image_records(img_path, directory, size, lines, error=None):
+    """Image summary record followed by its line records."""
+    base = {"directory": directory, "image": str(img_path), "error": None}
+    confidences = [line["confidence"] for line in lines]
+    summary = {**base, "record_type": "image", "line_num": None,
+               "text": "\n".join(line["text"] for line in lines),
+               "confidence": (sum(confidences) / len(confidences)
+                              if confidences else None),
+               "left": 0, "top": 0, "width": size[0], "height": size[1],
+               "error": error}
+    return [summary] + [{**base, "record_type": "line", **line}
+                        for line in lines]
+
+
+def image_records(img_path, directory, engine=None, cache=None):
+    """All records (image summary first, then its lines) for one image."""
+    engine = engine or TesseractEngine()
+    img = (cache or ImageCache()).gray_image(img_path)
+    lines = engine.recognize([img])[0]
+    return build_image_records(img_path, directory, img.size, lines)
+
+
+class OcrRecordWriter:
+    """
+    Buffered writer for OCR records in JSONL or Parquet. Records are flushed
+    every `flush_every` rows (one Parquet row group per flush), so a crash
+    loses at most one buffer and memory stays flat on large trees.
+    `on_flush` is called after every flush, once the buffer is on disk.
+    """
+
+    def __init__(self, path, fmt=None, flush_every=FLUSH_EVERY, append=False,
+                 on_flush=None):
+        self.path = Path(path)
+        self.fmt = fmt or self.path.suffix.lstrip(".").lower()
+        if self.fmt not in RECORD_FORMATS:
+            raise ValueError(f"Unsupported record format: {self.fmt!r}")
+        if append and self.fmt != "jsonl":
+            raise ValueError("Only jsonl record output can be appended to")
+        self.append = append
+        self.on_flush = on_flush
+        self.flush_every = flush_every
+        self.buffer = []
+        self.count = 0
+        self._file = None
+        self._parquet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._write_buffer()
+            self.count += len(self.buffer)
+            self.buffer = []
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def _write_buffer(self):
+        if self.fmt == "jsonl":
+            if self._file is None:
+                self._file = open(self.path, "a" if self.append else "w",
+                                  encoding="utf-8")
+            for record in self.buffer:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+        else:
+            import pyarrow as pa                # pip install pyarrow
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pylist(self.buffer, schema=record_schema())
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._parquet is not None:
+            self._parquet.close()
+            self._parquet = None
+
+
+def record_schema():
+    """Arrow schema matching RECORD_FIELDS."""
+    import pyarrow as pa
+    return pa.schema([
+        ("directory", pa.string()), ("image", pa.string()),
+        ("record_type", pa.string()), ("line_num", pa.int32()),
+        ("text", pa.string()), ("confidence", pa.float32()),
+        ("left", pa.int32()), ("top", pa.int32()),
+        ("width", pa.int32()), ("height", pa.int32()),
+        ("error", pa.string()),
+    ])
+
+
+def ocr_items_to_records(items, output_path, fmt=None,
+                         flush_every=FLUSH_EVERY, engine=None,
+                         batch_size=ENGINE_BATCH, cache=None, append=False,
+                         on_done=None):
+    """
+    OCR `(img_path, directory)` items into records at `output_path`, handing
+    images to the engine `batch_size` at a time. A None item runs the partial
+    batch and flushes the writer, so a slow trickle of images (watch mode)
+    still reaches disk promptly. `on_done` receives the paths of images
+    whose records have all been flushed, after each flush.
+
+    If a batch call fails, its images are retried one at a time, so one bad
+    image costs only itself; images that still fail get an error record
+    and are not passed to `on_done`.
+    """
+    engine = engine or TesseractEngine()
+    cache = cache or ImageCache()
+    n_images = 0
+    batch = []
+    written = []                # images with every record handed to writer
+
+    def flushed():
+        if on_done is not None and written:
+            on_done(list(written))
+        written.clear()
+
+    def write_failed(writer, img_path, directory, size, error):
+        print(f"⚠️  {img_path} failed: {error}")
+        for record in build_image_records(img_path, directory, size, [],
+                                          error=str(error)):
+            writer.write(record)
+
+    def recognize_each(imgs):
+        results = []
+        for img in imgs:
+            try:
+                results.append(engine.recognize([img])[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def run_batch(writer):
+        nonlocal n_images
+        imgs = [img for _, _, img in batch]
+        try:
+            results = engine.recognize(imgs)
+        except Exception as e:
+            print(f"⚠️  batch of {len(batch)} starting at "
+                  f"{batch[0][0]} failed: {e}; retrying one by one")
+            results = recognize_each(imgs)
+        for (img_path, directory, img), lines in zip(batch, results):
+            if isinstance(lines, Exception):
+                write_failed(writer, img_path, directory, img.size, lines)
+                continue
+            for record in build_image_records(img_path, directory,
+                                              img.size, lines):
+                writer.write(record)
+            written.append(img_path)
+            n_images += 1
+        batch.clear()
+
+    with OcrRecordWriter(output_path, fmt, flush_every, append,
+                         on_flush=flushed) as writer:
+        for item in items:
+            if item is None:
+                if batch:
+                    run_batch(writer)
+                writer.flush()
+                continue
+            img_path, directory = item
+            try:
+                img = cache.gray_image(img_path)
+            except Exception as e:
+                write_failed(writer, img_path, directory, (0, 0), e)
+                continue
+            batch.append((img_path, directory, img))
+            if len(batch) >= batch_size:
+                run_batch(writer)
+        if batch:
+            run_batch(writer)
+    print(f"✅ Saved {writer.count} OCR records for {n_images} images "
+          f"→ {output_path}")
+
+
+def ocr_tree_to_records(root_dir, output_path, fmt=None,
+                        flush_every=FLUSH_EVERY, engine=None,
+                        batch_size=ENGINE_BATCH, cache=None):
+    """
+    Streaming counterpart of ocr_images_in_tree: OCR every image under each
+    immediate sub-directory of `root_dir` and write one record per image and
+    per line to `output_path` (.jsonl or .parquet).
+    """
+    root = Path(root_dir).expanduser().resolve()
+    items = ((img_path, subdir.name)
+             for subdir in sorted(d for d in root.iterdir() if d.is_dir())
+             for img_path in iter_image_files(subdir))
+    ocr_items_to_records(items, output_path, fmt, flush_every, engine,
+                         batch_size, cache)
+
+
+def ocr_watch_to_records(root_dir, output_path, fmt=None,
+                         flush_every=FLUSH_EVERY, engine=None,
+                         batch_size=ENGINE_BATCH, cache=None,
+                         idle_timeout=None, manifest=None, **watch_options):
+    """
+    ocr_tree_to_records while the scraper is still writing: images are OCRed
+    as they finish landing under `root_dir` (see watcher.py) until nothing new
+    arrives for `idle_timeout` seconds, or forever if None. With a manifest,
+    a restart skips images already done and appends to a .jsonl output; an
+    image counts as done once its records are flushed to `output_path`.
+    """
+    from watcher import DirectoryWatcher
+    root = Path(root_dir).expanduser().resolve()
+    watcher = DirectoryWatcher(str(root), manifest=manifest, **watch_options)
+
+    def items():
+        for path in watcher.stream(idle_timeout=idle_timeout, idle_ticks=True):
+            if path is None:
+                yield None
+                continue
+            parts = Path(path).relative_to(root).parts
+            # Like tree mode, only images inside a post directory count
+            if len(parts) >= 2:
+                yield path, parts[0]
+
+    try:
+        ocr_items_to_records(items(), output_path, fmt, flush_every, engine,
+                             batch_size, cache, append=bool(manifest),
+                             on_done=watcher.mark_done)
+    finally:
+        watcher.stop()
+
+
+def read_ocr_records(path, columns=None, record_type=None):
+    """
+    Load OCR records as a DataFrame, reading only `columns` and, if given,
+    only rows of `record_type` ("image" or "line"). Parquet applies both at
+    scan time; JSONL is filtered while streaming. Columns missing from
+    older files (e.g. "error") come back empty.
+    """
+    import pandas as pd
+    path = Path(path)
+    if path.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+        filters = [("record_type", "=", record_type)] if record_type else None
+        present = pq.read_schema(path).names
+        frame = pq.read_table(
+            path, filters=filters,
+            columns=[c for c in columns if c in present] if columns else None,
+        ).to_pandas()
+        return frame.reindex(columns=columns) if columns else frame
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record_type and record["record_type"] != record_type:
+                continue
+            rows.append({k: record.get(k) for k in columns} if columns
+                        else record)
+    return pd.DataFrame(rows, columns=columns or RECORD_FIELDS)
+
 # ---- CLI wrapper -------------------------------------------------------
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(
-        description="Extract text from images in sub-directories and write to CSV."
+        description="Extract text from images in sub-directories and write to "
+                    "CSV, or stream per-image/per-line records to JSONL/Parquet."
     )
     parser.add_argument("root_dir",
                         help="Folder whose sub-directories contain images.")
     parser.add_argument("-o", "--out", default="ocr_output.csv",
-                        help="Output CSV filename (default: ocr_output.csv).")
+                        help="Output filename (default: ocr_output.csv).")
+    parser.add_argument("--format", choices=("csv",) + RECORD_FORMATS,
+                        default=None,
+                        help="Output format (default: from --out extension).")
+    parser.add_argument("--engine", choices=OCR_ENGINES, default="tesseract",
+                        help="OCR backend for jsonl/parquet output "
+                             "(default: tesseract).")
+    parser.add_argument("--flush-every", type=int, default=FLUSH_EVERY,
+                        help=f"Records per flush for jsonl/parquet "
+                             f"(default: {FLUSH_EVERY}).")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep OCRing images as they land under root_dir "
+                             "(jsonl/parquet output only).")
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="With --watch, stop after this many seconds "
+                             "without new images (default: run until Ctrl+C).")
+    parser.add_argument("--manifest", default=None,
+                        help="With --watch, JSONL of images already done; "
+                             "a restart skips them and appends to --out "
+                             "(jsonl output only).")
     args = parser.parse_args()
 
-    ocr_images_in_tree(args.root_dir, args.out)
+    fmt = args.format or Path(args.out).suffix.lstrip(".").lower()
+    if args.watch:
+        if fmt not in RECORD_FORMATS:
+            parser.error("--watch needs jsonl or parquet output")
+        if args.manifest and fmt != "jsonl":
+            parser.error("--manifest resumes by appending to --out, which "
+                         "needs jsonl output")
+        try:
+            ocr_watch_to_records(args.root_dir, args.out, fmt,
+                                 args.flush_every,
+                                 engine=get_engine(args.engine),
+                                 idle_timeout=args.idle_timeout,
+                                 manifest=args.manifest)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+    elif fmt in RECORD_FORMATS:
+        ocr_tree_to_records(args.root_dir, args.out, fmt, args.flush_every,
+                            engine=get_engine(args.engine))
+    else:
+        ocr_images_in_tree(args.root_dir, args.out)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+OCR benchmark over the labeled images in ocr_benchmark_data/.
+Sweeps OCR engines and, for tesseract, preprocessing (clean() mode, scale),
+PSM and language settings in parallel and reports CER / WER, images per
+second and p50 / p95 latency for every configuration.
+"""
+
+import csv
+import itertools
+import json
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from PIL import Image       # pip install pillow
+
+from ocr import (get_engine, LANGS, PSM, PREPROCESS_MODES, ENGINE_BATCH,
+                 OCR_ENGINES)
+
+DATA_DIR = Path(__file__).resolve().parent / "ocr_benchmark_data"
+GROUND_TRUTH_FILE = "ground_truth.json"
+
+# Default sweep
+SCALES = (1.0, 2.0)
+PSMS = (3, 6, 11)
+SWEEP_LANGS = ("eng", "chi_sim", "eng+chi_sim")
+ENGINES = ("tesseract",)
+
+REPORT_FIELDS = ["engine", "preprocess", "scale", "psm", "lang", "images",
+                 "cer", "wer", "images_per_sec", "p50_ms", "p95_ms", "errors"]
+
+
+class OcrConfig(NamedTuple):
+    preprocess: str = "clean"
+    scale: float = 1.0
+    psm: int = PSM
+    lang: str = LANGS
+    engine: str = "tesseract"
+
+
+# ---- metrics -----------------------------------------------------------
+def normalize_text(text):
+    """Collapse all whitespace runs to single spaces for a fair comparison."""
+    return " ".join(text.split())
+
+
+def edit_distance(ref, hyp):
+    """Levenshtein distance between two sequences (chars or tokens)."""
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i]
+        for j, h in enumerate(hyp, 1):
+            cur.append(min(prev[j] + 1,            # deletion
+                           cur[j - 1] + 1,         # insertion
+                           prev[j - 1] + (r != h)))  # substitution
+        prev = cur
+    return prev[-1]
+
+
+def cer(ref, hyp):
+    """Character error rate of `hyp` against `ref` (whitespace-normalized)."""
+    ref, hyp = normalize_text(ref), normalize_text(hyp)
+    if not ref:
+        return float(bool(hyp))
+    return edit_distance(ref, hyp) / len(ref)
+
+
+def wer(ref, hyp):
+    """Word error rate over whitespace tokens.
+
+    Chinese has no spaces, so a CJK run counts as one "word"; CER is the
+    more meaningful number for chi_sim.
+    """
+    ref, hyp = ref.split(), hyp.split()
+    if not ref:
+        return float(bool(hyp))
+    return edit_distance(ref, hyp) / len(ref)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+# ---- benchmark ---------------------------------------------------------
+def load_ground_truth(data_dir=DATA_DIR):
+    """Return [(image_path, expected_text), ...] sorted by file name."""
+    data_dir = Path(data_dir)
+    with open(data_dir / GROUND_TRUTH_FILE, encoding="utf-8") as f:
+        labels = json.load(f)
+    return [(data_dir / name, text) for name, text in sorted(labels.items())]
+
+
+def build_engine(config):
+    """OCR engine for `config`; preprocess/scale/psm/lang are tesseract-only."""
+    if config.engine == "tesseract":
+        return get_engine("tesseract", lang=config.lang, psm=config.psm,
+                          preprocess=config.preprocess, scale=config.scale)
+    return get_engine(config.engine)
+
+
+def lines_to_text(lines):
+    return "\n".join(line["text"] for line in lines)
+
+
+def run_config(config, samples):
+    """
+    OCR every sample with `config` and return one report row. Tesseract runs
+    one image per call; batched engines get ENGINE_BATCH images per call and
+    each image in a batch is charged the batch's mean latency.
+    """
+    latencies, cers, wers, errors = [], [], [], 0
+    images = [(Image.open(path), text) for path, text in samples]
+    for img, _ in images:
+        img.load()   # decode outside the timed region
+    engine = build_engine(config)   # model loading is not timed either
+    batch_size = 1 if config.engine == "tesseract" else ENGINE_BATCH
+
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        batch = images[i:i + batch_size]
+        t0 = time.perf_counter()
+        try:
+            results = [lines_to_text(lines) for lines in
+                       engine.recognize([img for img, _ in batch])]
+        except Exception as e:
+            print(f"⚠️  {config} failed: {e}")
+            errors += len(batch)
+            results = [""] * len(batch)
+        per_image = (time.perf_counter() - t0) / len(batch)
+        for (_, expected), got in zip(batch, results):
+            latencies.append(per_image)
+            cers.append(cer(expected, got))
+            wers.append(wer(expected, got))
+    elapsed = time.perf_counter() - start
+
+    return {
+        **config._asdict(),
+        "images": len(images),
+        "cer": statistics.fmean(cers) if cers else 0.0,
+        "wer": statistics.fmean(wers) if wers else 0.0,
+        "images_per_sec": len(images) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "errors": errors,
+    }
+
+
+def sweep_configs(preprocess=PREPROCESS_MODES, scales=SCALES, psms=PSMS,
+                  langs=SWEEP_LANGS, engines=ENGINES):
+    """
+    Cartesian product of the sweep axes for tesseract, plus one config per
+    other engine (those take raw images and pick their own languages).
+    """
+    configs = []
+    for engine in engines:
+        if engine == "tesseract":
+            configs += [OcrConfig(*combo) for combo in
+                        itertools.product(preprocess, scales, psms, langs)]
+        else:
+            configs.append(OcrConfig("none", 1.0, 0, "-", engine))
+    return configs
+
+
+def run_benchmark(configs, samples, workers=None):
+    """Run every config over `samples` in a process pool, best CER first.
+
+    Each config runs in its own worker, so per-config throughput is
+    single-process throughput; `workers` only controls how many configs
+    are measured at once.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(run_config, configs,
+                             itertools.repeat(samples)))
+    return sorted(rows, key=lambda r: (r["cer"], -r["images_per_sec"]))
+
+
+def print_report(rows):
+    print(f"{'engine':<10} {'preprocess':<10} {'scale':>5} {'psm':>3} "
+          f"{'lang':<12} {'CER':>6} {'WER':>6} {'img/s':>7} {'p50ms':>8} {'p95ms':>8}")
+    for r in rows:
+        print(f"{r['engine']:<10} {r['preprocess']:<10} {r['scale']:>5.2f} "
+              f"{r['psm']:>3} {r['lang']:<12} {r['cer']:>6.3f} {r['wer']:>6.3f} "
+              f"{r['images_per_sec']:>7.2f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f}")
+
+
+def write_report(rows, output_csv):
+    with open(output_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"✅ Saved benchmark for {len(rows)} configurations → {output_csv}")
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Benchmark OCR settings against labeled images."
+    )
+    parser.add_argument("--data-dir", default=str(DATA_DIR),
+                        help="Folder with images and ground_truth.json.")
+    parser.add_argument("--engines", nargs="+", default=ENGINES,
+                        choices=OCR_ENGINES,
+                        help="OCR backends to compare (default: tesseract).")
+    parser.add_argument("--preprocess", nargs="+", default=PREPROCESS_MODES,
+                        choices=PREPROCESS_MODES)
+    parser.add_argument("--scales", nargs="+", type=float, default=SCALES)
+    parser.add_argument("--psm", nargs="+", type=int, default=PSMS)
+    parser.add_argument("--langs", nargs="+", default=SWEEP_LANGS)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Parallel configurations (default: CPU count).")
+    parser.add_argument("-o", "--out", default=None,
+                        help="Optional CSV file for the full report.")
+    args = parser.parse_args()
+
+    samples = load_ground_truth(args.data_dir)
+    configs = sweep_configs(args.preprocess, args.scales, args.psm, args.langs,
+                            args.engines)
+    print(f"Benchmarking {len(configs)} configurations "
+          f"over {len(samples)} images...")
+    rows = run_benchmark(configs, samples, args.workers)
+    print_report(rows)
+    if args.out:
+        write_report(rows, args.out)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Neural OCR backend for ocr.py: a DB text detector plus a CTC line
+recognizer (PaddleOCR PP-OCR family, exported to ONNX) run on CPU with
+onnxruntime. Detection is batched per group of images and recognition is
+batched across every text line of the group, so one session call covers
+many images instead of one tesseract process per image.
+"""
+
+import math
+import os
+
+import numpy as np
+from PIL import Image       # pip install pillow
+
+from ocr import OcrEngine
+
+# ONNX models, e.g. ch_PP-OCRv4_{det,rec}_infer.onnx as shipped with
+# RapidOCR / PaddleOCR. Override the locations with the env variables.
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+DET_MODEL = os.environ.get(
+    "OCR_ONNX_DET", os.path.join(MODELS_DIR, "ch_PP-OCRv4_det_infer.onnx"))
+REC_MODEL = os.environ.get(
+    "OCR_ONNX_REC", os.path.join(MODELS_DIR, "ch_PP-OCRv4_rec_infer.onnx"))
+# Character list, one per line. Not needed when the rec model carries it in
+# its "character" metadata (RapidOCR exports do).
+REC_KEYS = os.environ.get("OCR_ONNX_KEYS")
+
+# Detection
+DET_LIMIT_SIDE = 960        # long side cap before detection
+DET_THRESH = 0.3            # probability-map binarization threshold
+DET_BOX_THRESH = 0.5        # min mean probability inside a kept box
+DET_UNCLIP_RATIO = 1.6      # DB box expansion (area * ratio / perimeter)
+DET_MIN_SIZE = 3            # drop boxes thinner than this (pixels)
+DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Recognition
+REC_HEIGHT = 48
+REC_MAX_WIDTH = 1600
+REC_BATCH_SIZE = 32         # text lines per recognizer call
+
+
+class OnnxOcrEngine(OcrEngine):
+    """
+    Batched detection + recognition OCR engine. recognize() takes a list of
+    PIL images and returns, per image, line records in the same schema as
+    ocr.ocr_line_records (text, confidence 0-100, left/top/width/height).
+    """
+
+    name = "onnx"
+
+    def __init__(self, det_model=DET_MODEL, rec_model=REC_MODEL,
+                 rec_keys=REC_KEYS, threads=None):
+        import onnxruntime as ort   # pip install onnxruntime
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        providers = ["CPUExecutionProvider"]
+        self.det = ort.InferenceSession(det_model, options, providers=providers)
+        self.rec = ort.InferenceSession(rec_model, options, providers=providers)
+        self.det_input = self.det.get_inputs()[0].name
+        self.rec_input = self.rec.get_inputs()[0].name
+        self.characters = self._load_characters(rec_keys)
+
+    def _load_characters(self, rec_keys):
+        if rec_keys:
+            with open(rec_keys, encoding="utf-8") as f:
+                chars = [line.rstrip("\r\n") for line in f]
+        else:
+            meta = self.rec.get_modelmeta().custom_metadata_map
+            if "character" not in meta:
+                raise ValueError("Recognition model has no character list; "
+                                 "set OCR_ONNX_KEYS to the keys file.")
+            chars = meta["character"].splitlines()
+        # CTC blank first, trailing space last (PaddleOCR convention)
+        return ["", *chars, " "]
+
+    # ---- detection -----------------------------------------------------
+    def _det_input(self, img):
+        w, h = img.size
+        ratio = min(1.0, DET_LIMIT_SIDE / max(w, h))
+        rw = max(32, int(round(w * ratio / 32)) * 32)
+        rh = max(32, int(round(h * ratio / 32)) * 32)
+        arr = np.asarray(img.resize((rw, rh), Image.BILINEAR),
+                         dtype=np.float32) / 255.0
+        arr = (arr - DET_MEAN) / DET_STD
+        return arr.transpose(2, 0, 1), (w / rw, h / rh)
+
+    def detect(self, images):
+        """Axis-aligned text boxes (left, top, right, bottom) per image."""
+        from scipy import ndimage
+        inputs = [self._det_input(img) for img in images]
+        max_h = max(arr.shape[1] for arr, _ in inputs)
+        max_w = max(arr.shape[2] for arr, _ in inputs)
+        batch = np.zeros((len(inputs), 3, max_h, max_w), dtype=np.float32)
+        for i, (arr, _) in enumerate(inputs):
+            batch[i, :, :arr.shape[1], :arr.shape[2]] = arr
+        probs = self.det.run(None, {self.det_input: batch})[0][:, 0]
+
+        all_boxes = []
+        for (arr, (sx, sy)), img, prob in zip(inputs, images, probs):
+            prob = prob[:arr.shape[1], :arr.shape[2]]
+            labels, _ = ndimage.label(prob > DET_THRESH)
+            boxes = []
+            for idx, sl in enumerate(ndimage.find_objects(labels), 1):
+                if sl is None:
+                    continue
+                h = sl[0].stop - sl[0].start
+                w = sl[1].stop - sl[1].start
+                if min(h, w) < DET_MIN_SIZE:
+                    continue
+                if prob[sl][labels[sl] == idx].mean() < DET_BOX_THRESH:
+                    continue
+                pad = w * h * DET_UNCLIP_RATIO / (2 * (w + h))
+                left = max(0, int((sl[1].start - pad) * sx))
+                top = max(0, int((sl[0].start - pad) * sy))
+                right = min(img.width, int(math.ceil((sl[1].stop + pad) * sx)))
+                bottom = min(img.height, int(math.ceil((sl[0].stop + pad) * sy)))
+                boxes.append((left, top, right, bottom))
+            boxes.sort(key=lambda b: (b[1], b[0]))
+            all_boxes.append(boxes)
+        return all_boxes
+
+    # ---- recognition ---------------------------------------------------
+    def _rec_input(self, crop, width):
+        w = min(width, max(1, int(math.ceil(REC_HEIGHT * crop.width
+                                            / crop.height))))
+        arr = np.asarray(crop.resize((w, REC_HEIGHT), Image.BILINEAR),
+                         dtype=np.float32) / 255.0
+        out = np.zeros((3, REC_HEIGHT, width), dtype=np.float32)
+        out[:, :, :w] = ((arr - 0.5) / 0.5).transpose(2, 0, 1)
+        return out
+
+    def _ctc_decode(self, probs):
+        """Greedy CTC decode -> (text, mean char probability)."""
+        best = probs.argmax(axis=1)
+        scores = probs.max(axis=1)
+        chars, confs, prev = [], [], 0
+        for idx, score in zip(best, scores):
+            if idx != 0 and idx != prev:
+                chars.append(self.characters[idx])
+                confs.append(score)
+            prev = idx
+        return "".join(chars), float(np.mean(confs)) if confs else 0.0
+
+    def recognize_crops(self, crops):
+        """Recognize text-line crops in width-sorted batches."""
+        order = sorted(range(len(crops)),
+                       key=lambda i: crops[i].width / crops[i].height)
+        results = [None] * len(crops)
+        for start in range(0, len(order), REC_BATCH_SIZE):
+            chunk = order[start:start + REC_BATCH_SIZE]
+            width = min(REC_MAX_WIDTH, max(
+                int(math.ceil(REC_HEIGHT * crops[i].width / crops[i].height))
+                for i in chunk))
+            batch = np.stack([self._rec_input(crops[i], width) for i in chunk])
+            probs = self.rec.run(None, {self.rec_input: batch})[0]
+            for i, p in zip(chunk, probs):
+                results[i] = self._ctc_decode(p)
+        return results
+
+    # ---- engine API ----------------------------------------------------
+    def recognize(self, images):
+        if not images:
+            return []
+        images = [img.convert("RGB") for img in images]
+        boxes = self.detect(images)
+        crops, owners = [], []
+        for i, (img, img_boxes) in enumerate(zip(images, boxes)):
+            for box in img_boxes:
+                crops.append(img.crop(box))
+                owners.append((i, box))
+        texts = self.recognize_crops(crops) if crops else []
+
+        results = [[] for _ in images]
+        for (i, (left, top, right, bottom)), (text, conf) in zip(owners, texts):
+            if not text.strip():
+                continue
+            results[i].append({
+                "line_num": len(results[i]),
+                "text": text,
+                "confidence": conf * 100,
+                "left": left, "top": top,
+                "width": right - left, "height": bottom - top,
+            })
+        return results
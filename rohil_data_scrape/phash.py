@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Perceptual hashing and near-duplicate clustering over the shared thumbnails.
+
+Each image gets a 64-bit pHash (sign of the low-frequency DCT coefficients
+against their median) and a 64-bit dHash (horizontal gradient signs), both
+from the ImageCache thumbnail. Near-duplicates are pairs within
+PHASH_RADIUS bits of pHash, confirmed by dHash within DHASH_RADIUS.
+
+Pairs are found with multi-index hashing: the pHash is split into four
+16-bit chunks, and by the pigeonhole principle two hashes within r bits
+agree to within r // 4 bits on at least one chunk, so only the buckets of
+nearby chunk values are scanned instead of all pairs. The scan, the
+popcounts and the union-find run as numba-compiled loops.
+
+Clusters let the detector analyze one representative per group of reposts
+and copy its verdict to the rest; a saved HashIndex of known injection
+images finds new reposts of them in later crawls.
+"""
+
+import os
+
+import numpy as np
+from numba import njit                  # pip install numba
+from PIL import Image                   # pip install pillow
+from scipy.fft import dctn              # pip install scipy
+
+from image_cache import ImageCache, iter_image_files
+
+# Hash geometry
+PHASH_SIZE = 32             # grayscale side the DCT runs on
+PHASH_LOW = 8               # low-frequency block kept (8 x 8 = 64 bits)
+N_CHUNKS = 4                # 16-bit chunks for multi-index search
+CHUNK_BITS = 16
+
+# Near-duplicate thresholds (bits out of 64)
+PHASH_RADIUS = 8
+DHASH_RADIUS = 12
+
+# Thumbnails flatter than this (gray std) hash to ~0 and would all collide
+FLAT_STD = 2.0
+
+INDEX_FILE = "known_injections.npz"
+
+CHUNK_MASK = np.uint64((1 << CHUNK_BITS) - 1)
+CHUNK_SHIFTS = np.array([CHUNK_BITS * c for c in range(N_CHUNKS)],
+                        dtype=np.uint64)
+
+
+# ---- hashing -----------------------------------------------------------
+def pack_bits(bits):
+    """(n, 64) booleans -> (n,) uint64, first bit most significant."""
+    return np.packbits(bits.astype(np.uint8), axis=1).view(">u8") \
+        .ravel().astype(np.uint64)
+
+
+def hash_arrays(thumbs):
+    """
+    pHash, dHash and a usable flag for RGB thumbnail arrays. Flat images
+    are not usable: their hashes carry no information.
+    """
+    n = len(thumbs)
+    squares = np.empty((n, PHASH_SIZE, PHASH_SIZE), dtype=np.float32)
+    strips = np.empty((n, 8, 9), dtype=np.float32)
+    for i, thumb in enumerate(thumbs):
+        gray = Image.fromarray(np.asarray(thumb)).convert("L")
+        squares[i] = np.asarray(gray.resize((PHASH_SIZE, PHASH_SIZE),
+                                            Image.LANCZOS))
+        strips[i] = np.asarray(gray.resize((9, 8), Image.LANCZOS))
+
+    # One batched 2-D DCT; the DC term is left out of the median
+    coeffs = dctn(squares, axes=(1, 2), norm="ortho")[:, :PHASH_LOW,
+                                                      :PHASH_LOW]
+    coeffs = coeffs.reshape(n, -1)
+    median = np.median(coeffs[:, 1:], axis=1, keepdims=True)
+    phashes = pack_bits(coeffs > median)
+    dhashes = pack_bits((strips[:, :, 1:] > strips[:, :, :-1])
+                        .reshape(n, -1))
+    usable = squares.reshape(n, -1).std(axis=1) >= FLAT_STD
+    return phashes, dhashes, usable
+
+
+def image_hashes(paths, cache=None):
+    """(phashes, dhashes, usable) for image files, from cached thumbnails."""
+    cache = cache or ImageCache()
+    if not paths:
+        empty = np.empty(0, dtype=np.uint64)
+        return empty, empty, np.empty(0, dtype=bool)
+    return hash_arrays([cache.thumbnail(path) for path in paths])
+
+
+# ---- multi-index Hamming search ----------------------------------------
+@njit(cache=True)
+def popcount64(x):
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + \
+        ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+@njit(cache=True)
+def hamming(a, b):
+    """Elementwise Hamming distance of two uint64 arrays."""
+    out = np.empty(a.shape[0], dtype=np.int64)
+    for i in range(a.shape[0]):
+        out[i] = popcount64(a[i] ^ b[i])
+    return out
+
+
+@njit(cache=True)
+def _found_earlier(x, chunk, sub):
+    """Whether a chunk before `chunk` already matches within `sub` bits,
+    in which case that chunk's scan reports the pair."""
+    for c in range(chunk):
+        if popcount64((x >> CHUNK_SHIFTS[c]) & CHUNK_MASK) <= sub:
+            return True
+    return False
+
+
+@njit(cache=True)
+def _mih_search(queries, hashes, offsets, members, masks, radius, sub,
+                self_join):
+    """
+    (query index, index, distance) arrays for every hash within `radius`
+    of a query. With `self_join`, queries are the indexed hashes and each
+    unordered pair is reported once.
+    """
+    out_q, out_i, out_d = [], [], []
+    for q in range(queries.shape[0]):
+        h = queries[q]
+        for c in range(N_CHUNKS):
+            value = (h >> CHUNK_SHIFTS[c]) & CHUNK_MASK
+            for m in range(masks.shape[0]):
+                bucket = np.int64(value ^ masks[m])
+                for k in range(offsets[c, bucket], offsets[c, bucket + 1]):
+                    i = members[c, k]
+                    if self_join and i <= q:
+                        continue
+                    x = h ^ hashes[i]
+                    if _found_earlier(x, c, sub):
+                        continue
+                    d = popcount64(x)
+                    if d <= radius:
+                        out_q.append(q)
+                        out_i.append(i)
+                        out_d.append(np.int64(d))
+    return out_q, out_i, out_d
+
+
+def flip_masks(bits, max_flips):
+    """All `bits`-wide masks with at most `max_flips` bits set."""
+    masks = [0]
+    for _ in range(max_flips):
+        masks = sorted({m | (1 << b) for m in masks for b in range(bits)}
+                       | set(masks))
+    return np.array(masks, dtype=np.uint64)
+
+
+class HammingIndex:
+    """Multi-index over 64-bit hashes: one bucket table per 16-bit chunk."""
+
+    def __init__(self, hashes):
+        self.hashes = np.ascontiguousarray(hashes, dtype=np.uint64)
+        n = len(self.hashes)
+        self.offsets = np.zeros((N_CHUNKS, (1 << CHUNK_BITS) + 1),
+                                dtype=np.int64)
+        self.members = np.empty((N_CHUNKS, n), dtype=np.int64)
+        for c in range(N_CHUNKS):
+            values = ((self.hashes >> CHUNK_SHIFTS[c]) & CHUNK_MASK) \
+                .astype(np.int64)
+            self.members[c] = np.argsort(values, kind="stable")
+            self.offsets[c, 1:] = np.cumsum(
+                np.bincount(values, minlength=1 << CHUNK_BITS))
+
+    def _search(self, queries, radius, self_join):
+        sub = radius // N_CHUNKS
+        q, i, d = _mih_search(
+            np.ascontiguousarray(queries, dtype=np.uint64), self.hashes,
+            self.offsets, self.members, flip_masks(CHUNK_BITS, sub),
+            radius, sub, self_join)
+        return (np.array(q, dtype=np.int64), np.array(i, dtype=np.int64),
+                np.array(d, dtype=np.int64))
+
+    def pairs(self, radius=PHASH_RADIUS):
+        """(i, j, distance) for every indexed pair i < j within `radius`."""
+        return self._search(self.hashes, radius, True)
+
+    def query(self, queries, radius=PHASH_RADIUS):
+        """(query index, indexed index, distance) within `radius`."""
+        return self._search(queries, radius, False)
+
+
+# ---- clustering --------------------------------------------------------
+@njit(cache=True)
+def _union_find(n, left, right):
+    parent = np.arange(n)
+    for k in range(left.shape[0]):
+        a, b = left[k], right[k]
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    for k in range(n):
+        root = k
+        while parent[root] != root:
+            root = parent[root]
+        parent[k] = root
+    return parent
+
+
+def cluster_hashes(phashes, dhashes, usable=None, p_radius=PHASH_RADIUS,
+                   d_radius=DHASH_RADIUS):
+    """
+    Cluster label per hash (the smallest member index): connected
+    components of pairs within `p_radius` pHash and `d_radius` dHash bits.
+    Unusable (flat) images stay singletons.
+    """
+    n = len(phashes)
+    if usable is None:
+        usable = np.ones(n, dtype=bool)
+    idx = np.flatnonzero(usable)
+    left, right, _ = HammingIndex(phashes[idx]).pairs(p_radius)
+    left, right = idx[left], idx[right]
+    keep = hamming(dhashes[left], dhashes[right]) <= d_radius
+    return _union_find(n, left[keep], right[keep])
+
+
+def cluster_images(paths, cache=None, p_radius=PHASH_RADIUS,
+                   d_radius=DHASH_RADIUS):
+    """
+    Group image files into near-duplicate clusters: lists of paths, largest
+    image first (the representative to analyze), in order of first
+    appearance.
+    """
+    cache = cache or ImageCache()
+    paths = list(paths)
+    phashes, dhashes, usable = image_hashes(paths, cache)
+    labels = cluster_hashes(phashes, dhashes, usable, p_radius, d_radius)
+    groups = {}
+    for path, label in zip(paths, labels):
+        groups.setdefault(label, []).append(path)
+
+    def area(path):
+        meta = cache.ingest(path)
+        return meta["width"] * meta["height"]
+    return [sorted(group, key=area, reverse=True) if len(group) > 1
+            else group for group in groups.values()]
+
+
+# ---- known-image index -------------------------------------------------
+class HashIndex:
+    """Hashes of known images (e.g. confirmed injections), saved as .npz."""
+
+    def __init__(self, phashes, dhashes, keys):
+        self.phashes = np.asarray(phashes, dtype=np.uint64)
+        self.dhashes = np.asarray(dhashes, dtype=np.uint64)
+        self.keys = np.asarray(keys, dtype=str)
+        self.index = HammingIndex(self.phashes)
+
+    @classmethod
+    def build(cls, paths, cache=None):
+        paths = list(paths)
+        phashes, dhashes, usable = image_hashes(paths, cache)
+        return cls(phashes[usable], dhashes[usable],
+                   [path for path, ok in zip(paths, usable) if ok])
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        data = np.load(path)
+        return cls(data["phashes"], data["dhashes"], data["keys"])
+
+    def save(self, path=INDEX_FILE):
+        np.savez(path, phashes=self.phashes, dhashes=self.dhashes,
+                 keys=self.keys)
+
+    def match(self, paths, cache=None, p_radius=PHASH_RADIUS,
+              d_radius=DHASH_RADIUS):
+        """[(path, known key, pHash distance)] for images near a known one."""
+        paths = list(paths)
+        phashes, dhashes, usable = image_hashes(paths, cache)
+        q, i, d = self.index.query(phashes, p_radius)
+        keep = usable[q] & (hamming(dhashes[q], self.dhashes[i]) <= d_radius)
+        return [(paths[a], str(self.keys[b]), int(c))
+                for a, b, c in zip(q[keep], i[keep], d[keep])]
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(
+        description="Near-duplicate image clustering and repost search."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_cluster = sub.add_parser("cluster", help="Cluster near-duplicates.")
+    p_cluster.add_argument("root_dir")
+    p_cluster.add_argument("--radius", type=int, default=PHASH_RADIUS)
+    p_cluster.add_argument("--top", type=int, default=10)
+
+    p_index = sub.add_parser("index", help="Index known injection images.")
+    p_index.add_argument("dirs", nargs="+",
+                         help="Folders of known images, e.g. "
+                              "llm_reports/flagged_*")
+    p_index.add_argument("-o", "--out", default=INDEX_FILE)
+
+    p_match = sub.add_parser("match", help="Find reposts of indexed images.")
+    p_match.add_argument("root_dir")
+    p_match.add_argument("--index", default=INDEX_FILE)
+    p_match.add_argument("--radius", type=int, default=PHASH_RADIUS)
+    args = parser.parse_args()
+
+    if args.command == "cluster":
+        paths = list(iter_image_files(args.root_dir))
+        start = time.perf_counter()
+        clusters = cluster_images(paths, p_radius=args.radius)
+        elapsed = time.perf_counter() - start
+        dupes = sum(len(c) - 1 for c in clusters)
+        print(f"✅ {len(paths)} images → {len(clusters)} clusters, "
+              f"{dupes} near-duplicates ({elapsed:.1f}s)")
+        for cluster in sorted(clusters, key=len, reverse=True)[:args.top]:
+            if len(cluster) > 1:
+                print(f"{len(cluster):>4}  {cluster[0]}")
+    elif args.command == "index":
+        paths = [p for d in args.dirs if os.path.isdir(d)
+                 for p in iter_image_files(d)]
+        index = HashIndex.build(paths)
+        index.save(args.out)
+        print(f"✅ Indexed {len(index.keys)} images → {args.out}")
+    else:
+        index = HashIndex.load(args.index)
+        matches = index.match(iter_image_files(args.root_dir),
+                              p_radius=args.radius)
+        for path, known, distance in matches:
+            print(f"{distance:>2}  {path}  ~  {known}")
+        print(f"✅ {len(matches)} reposts of {len(index.keys)} known images")
@@ -0,0 +1,498 @@
+"""
+LLM provider backends behind one interface.
+
+Every backend takes OpenAI-style chat messages (text parts and data-URI
+image parts) and returns a Completion with the text, token counts and
+latency. The base class owns what the backends share: the rate limiter,
+the retry policy (rate_limit.backoff_delay, honoring Retry-After) and
+per-model accounting. HTTP backends keep one pooled httpx client.
+
+    openai     any OpenAI-compatible endpoint (Gemini's compatibility
+               layer by default, a local stand-in server, DashScope's
+               compatible mode, ...)
+    gemini     Gemini's native generateContent API
+    dashscope  DashScope / Qwen multimodal generation API
+    replay     serves responses recorded by RecordingProvider, so runs
+               can be repeated and benchmarked without network access
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import time
+from collections import defaultdict
+from typing import NamedTuple
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from rate_limit import MAX_RETRIES, RateLimiter, backoff_delay
+
+OPENAI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+DASHSCOPE_PATH = "/services/aigc/multimodal-generation/generation"
+
+REQUEST_TIMEOUT = 120  # Seconds per request
+POOL_CONNECTIONS = 20  # Open connections per provider
+POOL_KEEPALIVE = 10  # Idle connections kept for reuse
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+
+PROVIDERS = ("openai", "gemini", "dashscope", "replay")
+
+
+class Completion(NamedTuple):
+    text: str
+    input_tokens: int
+    output_tokens: int
+    latency: float  # Seconds for the successful attempt
+    model: str
+
+
+class ProviderError(Exception):
+    """A failed request; `retryable` errors are retried by Provider."""
+
+    def __init__(self, message, retryable=False, retry_after=None, status=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.status = status
+
+
+def retry_after_header(headers):
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def split_data_uri(url):
+    """(mime type, base64 data) of a data: URI."""
+    header, _, data = url.partition(",")
+    return header[len("data:") :].split(";")[0], data
+
+
+def iter_parts(messages):
+    """Yield ("text", str) and ("image", data URI) parts of each message."""
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            yield message["role"], "text", content
+            continue
+        for part in content:
+            if part["type"] == "text":
+                yield message["role"], "text", part["text"]
+            elif part["type"] == "image_url":
+                yield message["role"], "image", part["image_url"]["url"]
+
+
+def request_key(model, messages, max_tokens):
+    """Stable hash of a request, used to match recordings."""
+    body = json.dumps(
+        {"model": model, "messages": messages, "max_tokens": max_tokens},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class Provider:
+    """
+    Base class: subclasses implement `_request`, raising ProviderError for
+    failures. `complete` adds rate limiting, retries and accounting.
+    """
+
+    name = "provider"
+
+    def __init__(self, rate_limiter=None, max_retries=MAX_RETRIES):
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.retry_count = 0
+        self.stats = defaultdict(
+            lambda: {
+                "requests": 0,
+                "errors": 0,
+                "latencies": [],
+                "input_tokens": 0,
+                "output_tokens": 0,
+            }
+        )
+
+    async def _request(self, model, messages, max_tokens):
+        raise NotImplementedError
+
+    async def complete(self, model, messages, max_tokens, tokens=0, on_retry=None):
+        """
+        Send one chat request. `tokens` is the estimate reserved from the
+        tokens-per-minute bucket; `on_retry(error, delay, attempt)` is called
+        before each retry. Raises ProviderError once retries are exhausted.
+        """
+        stats = self.stats[model]
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire_async(tokens)
+            try:
+                result = await self._request(model, messages, max_tokens)
+            except ProviderError as e:
+                if not e.retryable or attempt == self.max_retries:
+                    stats["errors"] += 1
+                    raise
+                delay = backoff_delay(attempt, e.retry_after)
+                self.retry_count += 1
+                if on_retry:
+                    on_retry(e, delay, attempt)
+                await asyncio.sleep(delay)
+                continue
+            stats["requests"] += 1
+            stats["latencies"].append(result.latency)
+            stats["input_tokens"] += result.input_tokens
+            stats["output_tokens"] += result.output_tokens
+            return result
+
+    def summary(self):
+        """{model: requests, errors, p50/p95 latency, token totals}."""
+        summary = {}
+        for model, stats in self.stats.items():
+            latencies = stats["latencies"]
+            summary[model] = {
+                "requests": stats["requests"],
+                "errors": stats["errors"],
+                "p50_s": statistics.median(latencies) if latencies else 0.0,
+                "p95_s": (
+                    statistics.quantiles(latencies, n=20)[-1]
+                    if len(latencies) > 1
+                    else (latencies[0] if latencies else 0.0)
+                ),
+                "input_tokens": stats["input_tokens"],
+                "output_tokens": stats["output_tokens"],
+            }
+        return summary
+
+    async def aclose(self):
+        pass
+
+
+class HttpProvider(Provider):
+    """Provider with a pooled httpx client, recreated per event loop."""
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT, transport=None, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.transport = transport
+        self._client = self._loop = None
+
+    def http(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=POOL_CONNECTIONS,
+                    max_keepalive_connections=POOL_KEEPALIVE,
+                ),
+                transport=self.transport,
+            )
+            self._loop = loop
+        return self._client
+
+    async def post_json(self, url, body, headers=None):
+        """POST `body`; return (parsed JSON, latency) or raise ProviderError."""
+        started = time.monotonic()
+        try:
+            response = await self.http().post(url, json=body, headers=headers)
+        except httpx.TimeoutException as e:
+            raise ProviderError(f"Timeout: {e}", retryable=True)
+        except httpx.TransportError as e:
+            raise ProviderError(f"Connection error: {e}", retryable=True)
+        latency = time.monotonic() - started
+        if response.status_code != 200:
+            raise ProviderError(
+                f"HTTP {response.status_code}: {response.text[:200]}",
+                retryable=response.status_code in RETRYABLE_STATUS,
+                retry_after=retry_after_header(response.headers),
+                status=response.status_code,
+            )
+        try:
+            return response.json(), latency
+        except ValueError as e:
+            raise ProviderError(f"Malformed JSON response: {e}", retryable=True)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class OpenAIProvider(Provider):
+    """OpenAI-compatible chat completions through the official SDK."""
+
+    name = "openai"
+    RETRYABLE_ERRORS = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+    def __init__(
+        self,
+        api_key,
+        base_url=OPENAI_BASE_URL,
+        timeout=REQUEST_TIMEOUT,
+        transport=None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.transport = transport
+        self._client = self._loop = None
+        self._injected = None
+
+    @property
+    def client(self):
+        """SDK client with a pooled httpx client, recreated per event loop."""
+        if self._injected is not None:
+            return self._injected
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self._client is None or self._loop is not loop:
+            # Retries are handled by Provider.complete, not by the SDK
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=POOL_CONNECTIONS,
+                        max_keepalive_connections=POOL_KEEPALIVE,
+                    ),
+                    transport=self.transport,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        # A client set from outside (e.g. a test double) is used on every loop
+        self._injected = client
+
+    async def _request(self, model, messages, max_tokens):
+        started = time.monotonic()
+        try:
+            response = await self.client.chat.completions.create(
+                model=model, messages=messages, max_tokens=max_tokens
+            )
+        except self.RETRYABLE_ERRORS as e:
+            response = getattr(e, "response", None)
+            raise ProviderError(
+                f"{type(e).__name__}: {e}",
+                retryable=True,
+                retry_after=retry_after_header(
+                    response.headers if response is not None else None
+                ),
+                status=getattr(e, "status_code", None),
+            )
+        except openai.OpenAIError as e:
+            raise ProviderError(f"{type(e).__name__}: {e}")
+        except ValueError as e:
+            # The SDK does not wrap a body that fails to decode
+            raise ProviderError(f"Malformed JSON response: {e}", retryable=True)
+        latency = time.monotonic() - started
+        try:
+            text = response.choices[0].message.content or ""
+        except (AttributeError, IndexError, TypeError) as e:
+            raise ProviderError(f"Malformed response: {e}", retryable=True)
+        usage = getattr(response, "usage", None)
+        return Completion(
+            text,
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+            latency,
+            model,
+        )
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class GeminiProvider(HttpProvider):
+    """Gemini's native generateContent API."""
+
+    name = "gemini"
+
+    def __init__(self, api_key, base_url=GEMINI_BASE_URL, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.api_key = api_key
+
+    def build_body(self, messages, max_tokens):
+        contents = []
+        for role, kind, value in iter_parts(messages):
+            role = "model" if role == "assistant" else "user"
+            if not contents or contents[-1]["role"] != role:
+                contents.append({"role": role, "parts": []})
+            if kind == "text":
+                contents[-1]["parts"].append({"text": value})
+            else:
+                mime, data = split_data_uri(value)
+                contents[-1]["parts"].append(
+                    {"inline_data": {"mime_type": mime, "data": data}}
+                )
+        return {
+            "contents": contents,
+            "generationConfig": {"maxOutputTokens": max_tokens},
+        }
+
+    async def _request(self, model, messages, max_tokens):
+        data, latency = await self.post_json(
+            f"{self.base_url}/models/{model}:generateContent",
+            self.build_body(messages, max_tokens),
+            headers={"x-goog-api-key": self.api_key},
+        )
+        try:
+            parts = data["candidates"][0]["content"]["parts"]
+            text = "".join(part.get("text", "") for part in parts)
+        except (KeyError, IndexError, TypeError):
+            raise ProviderError(f"Unexpected response format: {str(data)[:200]}")
+        usage = data.get("usageMetadata", {})
+        return Completion(
+            text,
+            usage.get("promptTokenCount", 0),
+            usage.get("candidatesTokenCount", 0),
+            latency,
+            model,
+        )
+
+
+class DashScopeProvider(HttpProvider):
+    """DashScope multimodal generation API (Qwen-VL models)."""
+
+    name = "dashscope"
+
+    def __init__(self, api_key, base_url=DASHSCOPE_BASE_URL, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self.api_key = api_key
+
+    def build_body(self, model, messages, max_tokens):
+        converted = []
+        for role, kind, value in iter_parts(messages):
+            if not converted or converted[-1]["role"] != role:
+                converted.append({"role": role, "content": []})
+            # DashScope accepts images as data URIs in the "image" field
+            converted[-1]["content"].append(
+                {"text": value} if kind == "text" else {"image": value}
+            )
+        return {
+            "model": model,
+            "input": {"messages": converted},
+            "parameters": {"max_tokens": max_tokens},
+        }
+
+    async def _request(self, model, messages, max_tokens):
+        data, latency = await self.post_json(
+            self.base_url + DASHSCOPE_PATH,
+            self.build_body(model, messages, max_tokens),
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        try:
+            content = data["output"]["choices"][0]["message"]["content"]
+            text = "".join(part.get("text", "") for part in content)
+        except (KeyError, IndexError, TypeError):
+            raise ProviderError(
+                f"Unexpected response format (request {data.get('request_id')}): "
+                f"{str(data)[:200]}"
+            )
+        usage = data.get("usage", {})
+        return Completion(
+            text,
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+            latency,
+            model,
+        )
+
+
+class RecordingProvider:
+    """
+    Wraps a provider and appends every successful response to a JSONL
+    cassette for ReplayProvider; everything else is the inner provider's.
+    """
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.path = path
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    async def complete(self, model, messages, max_tokens, **kwargs):
+        result = await self.inner.complete(model, messages, max_tokens, **kwargs)
+        entry = {"key": request_key(model, messages, max_tokens), **result._asdict()}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return result
+
+
+class ReplayProvider(Provider):
+    """
+    Serves responses from a cassette written by RecordingProvider. Repeated
+    requests get their recordings in order (the last one repeats); unknown
+    requests fail. With `replay_latency`, recorded latencies are slept.
+    """
+
+    name = "replay"
+
+    def __init__(self, path, replay_latency=False, **kwargs):
+        super().__init__(**kwargs)
+        self.replay_latency = replay_latency
+        self.recordings = defaultdict(list)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.recordings[entry.pop("key")].append(Completion(**entry))
+        self.served = defaultdict(int)
+
+    async def _request(self, model, messages, max_tokens):
+        key = request_key(model, messages, max_tokens)
+        recordings = self.recordings.get(key)
+        if not recordings:
+            raise ProviderError(f"No recorded response for request {key[:12]}")
+        result = recordings[min(self.served[key], len(recordings) - 1)]
+        self.served[key] += 1
+        if self.replay_latency:
+            await asyncio.sleep(result.latency)
+        return result
+
+
+def get_provider(name, api_key=None, record=None, **options):
+    """
+    Provider by name; `record` wraps it in a RecordingProvider writing to
+    that path. Options are passed to the backend's constructor.
+    """
+    if name == "openai":
+        provider = OpenAIProvider(api_key, **options)
+    elif name == "gemini":
+        provider = GeminiProvider(api_key, **options)
+    elif name == "dashscope":
+        provider = DashScopeProvider(
+            api_key or os.environ.get("DASHSCOPE_API_KEY"), **options
+        )
+    elif name == "replay":
+        provider = ReplayProvider(**options)
+    else:
+        raise ValueError(f"Unknown provider {name!r}; choose from {PROVIDERS}")
+    if record:
+        provider = RecordingProvider(provider, record)
+    return provider
@@ -0,0 +1,88 @@
+"""
+Request and token rate limiting shared by the LLM detectors.
+
+A RateLimiter combines a requests-per-minute and a tokens-per-minute token
+bucket. Callers reserve capacity up front and sleep for the returned delay,
+so concurrent callers are admitted in arrival order instead of all retrying
+at once. Both a blocking (threads) and an async (asyncio) API are provided.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+# Retry policy for rate-limit (429) and timeout errors
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2.0      # seconds, doubled every attempt
+RETRY_MAX_DELAY = 60.0
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute / 60` tokens per second,
+    holding at most `capacity` tokens (default: one minute's worth). The
+    balance may go negative; the debt is the caller's wait time.
+    """
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take `amount` tokens now; return seconds to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """Requests-per-minute plus tokens-per-minute limits; None disables one."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = self.token_bucket = None
+        if requests_per_minute:
+            self.request_bucket = TokenBucket(requests_per_minute)
+        if tokens_per_minute:
+            self.token_bucket = TokenBucket(tokens_per_minute)
+
+    def reserve(self, tokens=0):
+        """Reserve one request and `tokens` tokens; return the wait in seconds."""
+        wait = 0.0
+        if self.request_bucket:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket and tokens:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        return wait
+
+    def acquire(self, tokens=0):
+        """Blocking acquire for thread-based callers."""
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=0):
+        """Non-blocking acquire for asyncio callers."""
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def backoff_delay(attempt, retry_after=None, base=RETRY_BASE_DELAY,
+                  cap=RETRY_MAX_DELAY):
+    """
+    Seconds to wait before retry number `attempt` (0-based): the server's
+    Retry-After when given, else exponential backoff with full jitter.
+    """
+    if retry_after is not None:
+        return min(cap, max(0.0, retry_after))
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
@@ -0,0 +1,177 @@
+# test_detector_benchmark.py
+"""
+Checks for the mock provider and the detector load test: both detectors
+complete against it, 429 windows and malformed answers show up as retries
+and batch splits, and the Qwen pipeline batches post folders, resumes
+from its results log and gets past unreadable images.
+"""
+
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from detector_benchmark import (REPO_ROOT, make_synthetic_images,
+                                run_detector, run_pipeline)
+from image_cache import ImageCache
+from mock_provider import SCENARIOS, MockConfig, MockServer
+from providers import get_provider
+from rate_limit import RateLimiter
+
+TEST_SCENARIOS = {
+    "fast": MockConfig(latency_ms=5, latency_sigma=0),
+    "throttled": MockConfig(latency_ms=5, latency_sigma=0,
+                            window_requests=2, window_seconds=1),
+    "malformed": MockConfig(latency_ms=5, latency_sigma=0,
+                            malformed_rate=0.5),
+}
+
+
+class TestDetectorBenchmark(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.images_dir = os.path.join(cls.tmp.name, "images")
+        make_synthetic_images(cls.images_dir, n_images=8, n_posts=2)
+        cls.cache = ImageCache(os.path.join(cls.tmp.name, "cache"))
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        patcher = mock.patch.dict(SCENARIOS, TEST_SCENARIOS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_detector_completes(self):
+        row = run_detector("fast", self.images_dir, self.cache,
+                           concurrency=4, batch_images=3)
+        self.assertEqual(row["images"], 8)
+        self.assertEqual(row["requests"], 3)
+        self.assertEqual(row["complete"], 1.0)
+        self.assertGreater(row["p50_ms"], 0)
+
+    def test_throttling_is_retried(self):
+        # Retries wait out the window (Retry-After: 1)
+        row = run_detector("throttled", self.images_dir, self.cache,
+                           concurrency=4, batch_images=2)
+        self.assertGreater(row["throttled"], 0)
+        self.assertEqual(row["retries"], row["throttled"])
+        self.assertEqual(row["complete"], 1.0)
+
+    def test_malformed_answers_split_batches(self):
+        row = run_detector("malformed", self.images_dir, self.cache,
+                           concurrency=1, batch_images=4)
+        self.assertGreater(row["malformed"], 0)
+        self.assertGreater(row["splits"], 0)
+        self.assertEqual(row["requests"], 2 + 2 * row["splits"])
+
+    def test_pipeline_completes(self):
+        row = run_pipeline("fast", self.images_dir, self.cache, concurrency=4)
+        self.assertEqual(row["images"], 8)
+        self.assertEqual(row["requests"], 8)
+        self.assertEqual(row["complete"], 1.0)
+
+    def test_pipeline_batches_post_folders(self):
+        row = run_pipeline("fast", self.images_dir, self.cache, concurrency=2,
+                           batch_images=3)
+        self.assertEqual(row["requests"], 4)    # 4 images per post: 3 + 1
+        self.assertEqual(row["complete"], 1.0)
+
+        # Cut-off answers: the missing images are re-sent one at a time
+        row = run_pipeline("malformed", self.images_dir, self.cache,
+                           batch_images=4)
+        self.assertGreater(row["malformed"], 0)
+        self.assertGreater(row["requests"], 2)
+        self.assertEqual(row["images"], 8)
+        self.assertEqual(row["complete"], 1.0)
+
+    def test_pipeline_resumes_from_log(self):
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        import model_pipeline
+        model_pipeline.image_cache = self.cache
+        log_path = os.path.join(self.tmp.name, "qwen_results.jsonl")
+
+        def analyze(server, model=model_pipeline.QWEN_MODEL_NAME):
+            provider = get_provider("dashscope", api_key="mock",
+                                    base_url=server.dashscope_url,
+                                    rate_limiter=RateLimiter(6000))
+            results_log = model_pipeline.ResultsLog(log_path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = asyncio.run(model_pipeline.analyze_post_folders(
+                    provider, self.images_dir, model=model, concurrency=4,
+                    results_log=results_log))
+            results_log.close()
+            return results
+
+        with MockServer(TEST_SCENARIOS["fast"]) as server:
+            self.assertEqual(len(analyze(server)), 8)
+            # Crash mid-write: five whole lines and a torn sixth
+            with open(log_path) as f:
+                lines = f.readlines()
+            with open(log_path, "w") as f:
+                f.writelines(lines[:5])
+                f.write(lines[5][:20])
+            self.assertEqual(len(analyze(server)), 3)
+            self.assertEqual(server.counts["requests"], 11)
+            # Another model's answers do not count as done for this one
+            self.assertEqual(len(analyze(server, model="qwen-vl-max")), 8)
+            self.assertEqual(len(analyze(server, model="qwen-vl-max")), 0)
+
+        results_log = model_pipeline.ResultsLog(log_path)
+        entries = list(results_log.entries())
+        results_log.close()
+        self.assertEqual(len(entries), 16)
+        self.assertEqual(len({(e["image_hash"], e["model"]) for e in entries}), 16)
+        summary_path = os.path.join(self.tmp.name, "summary.txt")
+        self.assertEqual(model_pipeline.write_summary(results_log, summary_path), 16)
+
+    def test_pipeline_skips_unreadable_images(self):
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        import model_pipeline
+        model_pipeline.image_cache = self.cache
+        images_dir = os.path.join(self.tmp.name, "truncated")
+        shutil.copytree(self.images_dir, images_dir)
+        post = sorted(os.listdir(images_dir))[0]
+        broken = os.path.join(images_dir, post,
+                              sorted(os.listdir(os.path.join(images_dir, post)))[0])
+        with open(broken, "rb") as f:
+            data = f.read()
+        with open(broken, "wb") as f:
+            f.write(data[:len(data) // 2])
+
+        for batch_images in (1, 3):
+            log_path = os.path.join(self.tmp.name, f"log_{batch_images}.jsonl")
+            with MockServer(TEST_SCENARIOS["fast"]) as server:
+                provider = get_provider("dashscope", api_key="mock",
+                                        base_url=server.dashscope_url,
+                                        rate_limiter=RateLimiter(6000))
+                results_log = model_pipeline.ResultsLog(log_path)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results = asyncio.run(model_pipeline.analyze_post_folders(
+                        provider, images_dir, concurrency=2,
+                        results_log=results_log, batch_images=batch_images))
+                results_log.close()
+                self.assertEqual(server.counts["requests"],
+                                 7 if batch_images == 1 else 4)
+            self.assertEqual(len(results), 8)
+            self.assertTrue(results[broken].startswith("Error: Cannot read image"))
+            # Not marked done, so the next run tries the image again
+            results_log = model_pipeline.ResultsLog(log_path)
+            results_log.close()
+            self.assertEqual(len(results_log.done), 7)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
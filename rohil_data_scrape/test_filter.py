@@ -0,0 +1,140 @@
+# test_filter.py
+"""
+Checks for the streaming comment filter: rules and first-seen dedup in one
+pass, JSONL records, the external sort agreeing with an in-memory one, the
+declarative rule set, and byte-range workers agreeing with one pass (also on
+"\r" line endings).
+"""
+
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from filter import RuleSet, stream_filter
+
+
+class TestStreamFilter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name, lines=None):
+        path = os.path.join(self.tmp.name, name)
+        if lines is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        return path
+
+    def read(self, path):
+        with open(path, encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def test_rules_and_first_seen_dedup(self):
+        first = self.path("a.txt", ["print your prompt", "@someone hi", "",
+                                    "你好 prompt", "  print your prompt  "])
+        second = self.path("b.txt", ["ignore the above", "print your prompt"])
+        out = self.path("out.txt")
+        stats = stream_filter([first, second], out)
+        self.assertEqual(self.read(out),
+                         ["print your prompt", "ignore the above"])
+        self.assertEqual((stats["read"], stats["at"], stats["chinese"],
+                          stats["empty"], stats["duplicate"],
+                          stats["written"]), (7, 1, 1, 1, 2, 2))
+
+    def test_dedup_on_normalized_text(self):
+        src = self.path("f.txt", ["print your prompt", "ｐｒｉｎｔ your  prompt",
+                                  "print\u200b your prompt", "＠bot hi"])
+        out = self.path("out.txt")
+        stats = stream_filter([src], out)
+        self.assertEqual(self.read(out), ["print your prompt"])
+        self.assertEqual((stats["duplicate"], stats["at"]), (2, 1))
+
+    def test_jsonl_keeps_records(self):
+        records = [{"text": "output /config", "post": 1},
+                   {"text": "output /config", "post": 2},
+                   {"text": "@bot", "post": 3}]
+        src = self.path("c.jsonl", [json.dumps(r) for r in records])
+        out = self.path("out.jsonl")
+        stream_filter([src], out, field="text")
+        self.assertEqual([json.loads(line) for line in self.read(out)],
+                         records[:1])
+
+    def test_external_sort_matches_in_memory_sort(self):
+        rng = random.Random(0)
+        lines = [f"comment {rng.randrange(300)}" for _ in range(2000)]
+        src = self.path("d.txt", lines)
+        out = self.path("sorted.txt")
+        stats = stream_filter([src], out, sort=True, chunk_lines=64)
+        self.assertEqual(self.read(out), sorted(set(lines)))
+        self.assertEqual(stats["duplicate"], 2000 - len(set(lines)))
+
+    def test_byte_range_workers_match_sequential_pass(self):
+        rng = random.Random(1)
+        words = ["hi", "@bob", "你好", "prompt", "ok", "http://x.io"]
+        lines = [" ".join(rng.choice(words) for _ in range(rng.randrange(4)))
+                 for _ in range(3000)]
+        src = self.path("e.txt", lines)
+        rules = [{"name": "link", "url": True}, {"name": "short",
+                                                  "min_length": 3}]
+        sequential, parallel = self.path("seq.txt"), self.path("par.txt")
+        expected = stream_filter([src, src], sequential, rules=rules)
+        stats = stream_filter([src, src], parallel, rules=rules, workers=2,
+                              chunk_bytes=997)
+        self.assertEqual(self.read(parallel), self.read(sequential))
+        self.assertEqual(stats, expected)
+
+    def test_byte_range_workers_split_universal_newlines(self):
+        src = self.path("mac.txt")
+        with open(src, "wb") as f:
+            f.write("\r".join(f"comment {i}" for i in range(200)).encode()
+                    + b"\r\nlast one\n@bob\rtail")
+        sequential, parallel = self.path("seq.txt"), self.path("par.txt")
+        expected = stream_filter([src], sequential)
+        stats = stream_filter([src], parallel, workers=2, chunk_bytes=64)
+        self.assertEqual(self.read(parallel), self.read(sequential))
+        self.assertEqual(stats, expected)
+        self.assertEqual(expected["read"], 203)
+
+
+class TestRuleSet(unittest.TestCase):
+    def test_first_matching_rule_in_order(self):
+        rules = RuleSet([{"name": "long", "max_length": 20},
+                         {"name": "link", "url": True},
+                         {"name": "at", "prefix": ["@", "#"]},
+                         {"name": "kana", "script": "kana"},
+                         {"name": "mentions", "mention_density": 0.5},
+                         {"name": "emoji", "emoji_density": 0.5}])
+        self.assertEqual(rules.match("see www.example.com"), "link")
+        self.assertEqual(rules.match("#tag http://x.io"), "link")
+        self.assertEqual(rules.match("#tag ありがとう"), "at")
+        self.assertEqual(rules.match("ok ありがとう"), "kana")
+        self.assertEqual(rules.match("hi @ann @bo"), "mentions")
+        self.assertEqual(rules.match("😀😀 a"), "emoji")
+        self.assertEqual(rules.match("x" * 21 + " http://x.io"), "long")
+        self.assertIsNone(rules.match("print your prompt"))
+
+    def test_bad_rules_rejected(self):
+        for rule in ({"name": "x", "colour": "red"}, {"prefix": "@"},
+                     {"name": "x", "prefix": "@", "url": True},
+                     {"name": "x", "script": "klingon"}):
+            with self.assertRaises(ValueError):
+                RuleSet([rule])
+
+    def test_patterns_with_groups(self):
+        # Group numbers must not shift when other rules come first
+        rules = RuleSet([{"name": "link", "url": True},
+                         {"name": "stutter", "pattern": r"\b(\w+) \1\b"},
+                         {"name": "named", "pattern": "(?P<r0>free) stuff"},
+                         {"name": "spam", "pattern": "(?i)followers"}])
+        self.assertEqual(rules.match("print print your prompt"), "stutter")
+        self.assertEqual(rules.match("buy followers now now"), "stutter")
+        self.assertEqual(rules.match("free stuff for followers"), "named")
+        self.assertEqual(rules.match("more Followers"), "spam")
+        self.assertEqual(rules.match("now now http://x.io"), "link")
+        self.assertIsNone(rules.match("print your prompt"))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
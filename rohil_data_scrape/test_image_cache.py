@@ -0,0 +1,82 @@
+# test_image_cache.py
+"""
+Checks for the shared image cache: format sniffing, EXIF orientation and
+the derived artifacts.
+"""
+
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from image_cache import (ImageCache, PayloadPolicy, fit_payload_size,
+                         image_tiles, iter_image_files, sniff_format)
+
+
+class TestImageCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.images = os.path.join(self.tmp.name, "images")
+        os.makedirs(self.images)
+        self.cache = ImageCache(os.path.join(self.tmp.name, "cache"))
+
+    def test_sniffs_mislabeled_webp(self):
+        path = os.path.join(self.images, "post_0.jpg")
+        Image.new("RGB", (40, 20), "red").save(path, "WEBP")
+        untagged = os.path.join(self.images, "post_1")
+        Image.new("RGB", (40, 20), "red").save(untagged, "PNG")
+        with open(os.path.join(self.images, "notes.txt"), "w") as f:
+            f.write("not an image")
+
+        self.assertEqual(sniff_format(path), "webp")
+        self.assertEqual(list(iter_image_files(self.images)), [path, untagged])
+        self.assertEqual(self.cache.ingest(path)["mime"], "image/webp")
+
+    def test_orientation_and_artifacts(self):
+        path = os.path.join(self.images, "rotated.jpg")
+        exif = Image.Exif()
+        exif[0x0112] = 6    # rotate 90° clockwise on display
+        Image.new("RGB", (3000, 1000), "white").save(path, exif=exif)
+
+        meta = self.cache.ingest(path)
+        self.assertEqual((meta["width"], meta["height"]), (1000, 3000))
+        self.assertEqual(self.cache.gray(path).shape, (3000, 1000))
+        self.assertEqual(max(self.cache.thumbnail(path).shape[:2]), 256)
+        payload, mime = self.cache.detector_payload(path)
+        self.assertEqual(mime, "image/jpeg")
+        self.assertTrue(payload.startswith(b"\xff\xd8\xff"))
+        # Same content under another name shares the entry
+        copy = os.path.join(self.images, "copy.jpg")
+        with open(path, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        self.assertEqual(self.cache.ingest(copy)["hash"], meta["hash"])
+
+
+class TestPayloadPolicy(unittest.TestCase):
+    def test_fit_respects_long_edge_and_tiles(self):
+        self.assertEqual(fit_payload_size(300, 300), (300, 300))
+        w, h = fit_payload_size(1080, 2400)
+        self.assertEqual(max(w, h), 1536)
+        w, h = fit_payload_size(4000, 3000, PayloadPolicy(4000, 2))
+        self.assertLessEqual(image_tiles(w, h), 2)
+
+    def test_webp_payload_is_smaller(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "shot.png")
+            Image.effect_noise((2000, 3000), 40).convert("RGB").save(path)
+            cache = ImageCache(os.path.join(tmp, "cache"))
+            policy = PayloadPolicy(fmt="webp")
+            payload, mime = cache.detector_payload(path, policy)
+            self.assertEqual(mime, "image/webp")
+            self.assertEqual(Image.open(cache.detector_payload_path(
+                path, policy)).size, (1024, 1536))
+            stats = cache.payload_stats(path, policy)
+            self.assertEqual(stats["payload_bytes"], len(payload))
+            self.assertLess(stats["payload_bytes"], stats["original_bytes"])
+            self.assertLess(stats["payload_tokens"], stats["original_tokens"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
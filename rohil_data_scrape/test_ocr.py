@@ -0,0 +1,180 @@
+# test_ocr.py
+"""
+Checks for the streaming OCR record output. Tesseract itself is patched
+out, so these run without the engine installed.
+"""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+import ocr
+from image_cache import ImageCache
+
+# Two words on line 1 and one on line 2, plus a layout row (conf -1).
+FAKE_DATA = {
+    "text": ["", "Thank", "u", "翻译"],
+    "conf": ["-1", "91.5", "88.5", "70"],
+    "block_num": [1, 1, 1, 1],
+    "par_num": [1, 1, 1, 1],
+    "line_num": [0, 1, 1, 2],
+    "left": [0, 10, 80, 12],
+    "top": [0, 5, 7, 40],
+    "width": [200, 60, 15, 40],
+    "height": [60, 20, 18, 22],
+}
+
+
+class TestOcrRecords(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ocr.pytesseract, "image_to_data",
+                                    return_value=FAKE_DATA)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.img_path = Path(self.tmp.name) / "post" / "post_0.jpg"
+        self.img_path.parent.mkdir()
+        Image.new("RGB", (200, 60), "white").save(self.img_path)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = ImageCache(cache_dir.name)
+
+    def test_line_grouping(self):
+        lines = ocr.ocr_line_records(Image.open(self.img_path))
+        self.assertEqual([l["text"] for l in lines], ["Thank u", "翻译"])
+        self.assertAlmostEqual(lines[0]["confidence"], 90.0)
+        self.assertEqual((lines[0]["left"], lines[0]["top"],
+                          lines[0]["width"], lines[0]["height"]),
+                         (10, 5, 85, 20))
+
+    def test_roundtrip(self):
+        for fmt in ocr.RECORD_FORMATS:
+            out = Path(self.tmp.name) / f"records.{fmt}"
+            ocr.ocr_tree_to_records(self.tmp.name, out, flush_every=2,
+                                    cache=self.cache)
+            images = ocr.read_ocr_records(out, record_type="image")
+            lines = ocr.read_ocr_records(out, columns=["text", "confidence"],
+                                         record_type="line")
+            self.assertEqual(images["text"].tolist(), ["Thank u\n翻译"])
+            self.assertEqual(list(lines.columns), ["text", "confidence"])
+            self.assertEqual(len(lines), 2)
+
+    def test_csv_img_exts_filter(self):
+        Image.new("RGB", (200, 60), "white").save(
+            self.img_path.with_name("post_1.png"))
+        out = Path(self.tmp.name) / "out.csv"
+        with mock.patch.object(ocr.pytesseract, "image_to_string",
+                               return_value="hi") as to_string, \
+                mock.patch("builtins.print"):
+            ocr.ocr_images_in_tree(self.tmp.name, out, img_exts=(".PNG",),
+                                   cache=self.cache)
+        self.assertEqual(to_string.call_count, 1)
+        with mock.patch.object(ocr.pytesseract, "image_to_string",
+                               return_value="hi") as to_string, \
+                mock.patch("builtins.print"):
+            ocr.ocr_images_in_tree(self.tmp.name, out, cache=self.cache)
+        self.assertEqual(to_string.call_count, 2)
+
+
+class InterruptingEngine:
+    """Recognizes one fixed line per image, then is killed on call `stop_at`."""
+
+    def __init__(self, stop_at=None):
+        self.stop_at = stop_at
+        self.calls = 0
+
+    def recognize(self, imgs):
+        self.calls += 1
+        if self.calls == self.stop_at:
+            raise KeyboardInterrupt
+        return [[{"line_num": 1, "text": "hi", "confidence": 90.0,
+                  "left": 0, "top": 0, "width": 8, "height": 8}]
+                for _ in imgs]
+
+
+class PickyEngine(InterruptingEngine):
+    """Fails any call that includes an image of width `bad_width`."""
+
+    def __init__(self, bad_width):
+        super().__init__()
+        self.bad_width = bad_width
+
+    def recognize(self, imgs):
+        if any(img.width == self.bad_width for img in imgs):
+            raise RuntimeError("cannot read image")
+        return super().recognize(imgs)
+
+
+class TestOcrBatchFailure(unittest.TestCase):
+    def test_one_bad_image_costs_only_itself(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i, width in enumerate([32, 33, 32, 32]):
+                path = Path(tmp) / f"img_{i}.png"
+                Image.new("RGB", (width, 32), "white").save(path)
+                paths.append(str(path))
+            out = Path(tmp) / "records.jsonl"
+            done = []
+            with mock.patch("builtins.print"):
+                ocr.ocr_items_to_records(
+                    ((p, "post") for p in paths), out,
+                    engine=PickyEngine(bad_width=33), batch_size=4,
+                    cache=ImageCache(str(Path(tmp) / "cache")),
+                    on_done=done.extend)
+            images = ocr.read_ocr_records(out, record_type="image")
+        self.assertEqual(list(images["image"]), paths)
+        self.assertEqual(list(images["text"]), ["hi", "", "hi", "hi"])
+        self.assertIn("cannot read image", images["error"][1])
+        self.assertTrue(images["error"].drop(1).isna().all())
+        # The failed image is not marked done, so a restart retries it
+        self.assertEqual(done, [paths[0], paths[2], paths[3]])
+
+
+class TestOcrWatchRestart(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = Path(self.tmp.name) / "downloads"
+        self.images = []
+        for i in range(6):
+            path = self.root / f"post_{i % 2}" / f"post_{i}.png"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            Image.new("RGB", (32, 32), "white").save(path)
+            self.images.append(str(path))
+        # Not inside a post directory, so never OCRed (as in tree mode)
+        Image.new("RGB", (32, 32), "white").save(self.root / "stray.png")
+        self.out = Path(self.tmp.name) / "records.jsonl"
+        self.manifest = Path(self.tmp.name) / "done.jsonl"
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache = ImageCache(cache_dir.name)
+
+    def watch(self, engine):
+        ocr.ocr_watch_to_records(self.root, self.out, engine=engine,
+                                 batch_size=1, flush_every=3,
+                                 cache=self.cache, idle_timeout=0.3,
+                                 manifest=str(self.manifest),
+                                 interval=0.05, settle=0.05)
+
+    def test_killed_consumer_resumes_without_gaps(self):
+        with mock.patch("builtins.print"):
+            with self.assertRaises(KeyboardInterrupt):
+                self.watch(InterruptingEngine(stop_at=4))
+        with open(self.manifest, encoding="utf-8") as f:
+            done = [json.loads(line)["path"] for line in f]
+        # Images 1-3 were written before the kill; the fourth never was
+        self.assertEqual(len(done), 3)
+
+        with mock.patch("builtins.print"):
+            self.watch(InterruptingEngine())
+        images = ocr.read_ocr_records(self.out, record_type="image")
+        self.assertEqual(sorted(images["image"]), sorted(self.images))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
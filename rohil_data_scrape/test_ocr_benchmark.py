@@ -0,0 +1,71 @@
+# test_ocr_benchmark.py
+"""
+Regression checks for OCR against the labeled set in ocr_benchmark_data/.
+The metric tests always run; the OCR test is skipped when the Tesseract
+engine is not installed.
+"""
+
+import unittest
+
+from PIL import Image
+import pytesseract
+
+import ocr_benchmark
+from ocr import clean, PREPROCESS_MODES
+from ocr_benchmark import OcrConfig, cer, wer, percentile
+
+# Mean CER the default OcrConfig must stay under on the labeled set.
+MAX_DEFAULT_CER = 0.35
+
+
+def tesseract_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+class TestMetrics(unittest.TestCase):
+    def test_cer(self):
+        self.assertEqual(cer("abc", "abc"), 0.0)
+        self.assertAlmostEqual(cer("abcd", "abed"), 0.25)
+        self.assertEqual(cer("翻译 回复", "翻译\n回复"), 0.0)   # whitespace-normalized
+
+    def test_wer(self):
+        self.assertEqual(wer("drop table users", "drop table users"), 0.0)
+        self.assertAlmostEqual(wer("drop table users", "drop tables users"), 1 / 3)
+
+    def test_percentile(self):
+        values = [0.1 * i for i in range(1, 21)]
+        self.assertAlmostEqual(percentile(values, 50), 1.0)
+        self.assertAlmostEqual(percentile(values, 95), 1.9)
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+class TestPreprocess(unittest.TestCase):
+    def test_modes_and_scale(self):
+        path, _ = ocr_benchmark.load_ground_truth()[0]
+        img = Image.open(path)
+        for mode in PREPROCESS_MODES:
+            out = clean(img, mode=mode, scale=2.0)
+            self.assertEqual(out.size, (img.width * 2, img.height * 2))
+        self.assertEqual(clean(img).mode, "L")
+        with self.assertRaises(ValueError):
+            clean(img, mode="sharpen")
+
+
+@unittest.skipUnless(tesseract_available(), "Tesseract is not installed")
+class TestOcrRegression(unittest.TestCase):
+    def test_default_config_accuracy(self):
+        samples = ocr_benchmark.load_ground_truth()
+        row = ocr_benchmark.run_config(OcrConfig(), samples)
+        print(f"\nDefault OCR config: CER {row['cer']:.3f}, "
+              f"{row['images_per_sec']:.2f} img/s, p95 {row['p95_ms']:.0f} ms")
+        self.assertEqual(row["errors"], 0)
+        self.assertLess(row["cer"], MAX_DEFAULT_CER)
+
+
+# Allow “python test_ocr_benchmark.py” as well as pytest
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,126 @@
+# test_ocr_onnx.py
+"""
+Checks for the ONNX OCR backend. Detector post-processing, CTC decoding and
+the crop bookkeeping run against fake sessions; the accuracy smoke test on
+the labeled set is skipped unless onnxruntime and the models are installed.
+"""
+
+import os
+import unittest
+
+import numpy as np
+from PIL import Image
+
+import ocr_benchmark
+import ocr_onnx
+from ocr_benchmark import OcrConfig
+from ocr_onnx import OnnxOcrEngine
+
+# Mean CER the ONNX engine must stay under on the labeled set.
+MAX_ONNX_CER = 0.2
+CHARACTERS = ["", "h", "i", "y", "o", " "]
+
+
+def onnx_available():
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return os.path.exists(ocr_onnx.DET_MODEL) and \
+        os.path.exists(ocr_onnx.REC_MODEL)
+
+
+class FakeSession:
+    """Stands in for an InferenceSession: run() returns output(batch)."""
+
+    def __init__(self, output):
+        self.output = output
+        self.batches = []
+
+    def run(self, names, feeds):
+        batch = next(iter(feeds.values()))
+        self.batches.append(batch)
+        return [self.output(batch)]
+
+
+def fake_engine(det_output=None, rec_output=None):
+    """OnnxOcrEngine on fake sessions, without loading any model."""
+    engine = OnnxOcrEngine.__new__(OnnxOcrEngine)
+    engine.det = FakeSession(det_output)
+    engine.rec = FakeSession(rec_output)
+    engine.det_input = engine.rec_input = "x"
+    engine.characters = CHARACTERS
+    return engine
+
+
+def ctc_probs(indices, best=0.9):
+    """(T, C) probabilities with `best` on each step's character index."""
+    probs = np.full((len(indices), len(CHARACTERS)),
+                    (1 - best) / (len(CHARACTERS) - 1), dtype=np.float32)
+    probs[np.arange(len(indices)), indices] = best
+    return probs
+
+
+def blob_map(batch):
+    """Probability map of two text lines in a 64x64 image, plus noise."""
+    probs = np.zeros((batch.shape[0], 1) + batch.shape[2:], dtype=np.float32)
+    probs[0, 0, 40:48, 10:50] = 0.9     # lower line
+    probs[0, 0, 8:16, 20:40] = 0.9      # upper line
+    probs[0, 0, 30:32, 5:7] = 0.9       # too thin
+    probs[0, 0, 56:62, 30:60] = 0.4     # above DET_THRESH, below BOX_THRESH
+    return probs
+
+
+class TestPostProcessing(unittest.TestCase):
+    def test_detect_boxes_sorted_and_filtered(self):
+        engine = fake_engine(det_output=blob_map)
+        boxes = engine.detect([Image.new("RGB", (64, 64)),
+                               Image.new("RGB", (128, 64))])
+        # Unclipped by area * ratio / perimeter, top line first
+        self.assertEqual(boxes, [[(15, 3, 45, 21), (4, 34, 56, 54)], []])
+        # Both images go through one padded session call
+        self.assertEqual(len(engine.det.batches), 1)
+        self.assertEqual(engine.det.batches[0].shape, (2, 3, 64, 128))
+
+    def test_ctc_decode(self):
+        engine = fake_engine()
+        # Repeats collapse unless a blank separates them
+        probs = ctc_probs([1, 1, 0, 2, 2, 0, 0, 2, 5, 3, 4])
+        probs[3, 2] = 0.6
+        text, conf = engine._ctc_decode(probs)
+        self.assertEqual(text, "hii yo")
+        self.assertAlmostEqual(conf, (0.9 * 5 + 0.6) / 6, places=5)
+        self.assertEqual(engine._ctc_decode(ctc_probs([0, 0])), ("", 0.0))
+
+    def test_recognize_maps_crops_back(self):
+        def rec_output(batch):
+            # Crops of the white half read "hi", of the black half "yo"
+            return np.stack([ctc_probs([1, 2] if crop.mean() > 0 else [3, 4])
+                             for crop in batch])
+
+        img = Image.new("RGB", (64, 64), "white")
+        img.paste((0, 0, 0), (0, 30, 64, 64))
+        engine = fake_engine(blob_map, rec_output)
+        lines = engine.recognize([img, Image.new("RGB", (32, 32))])
+        self.assertEqual(lines[1], [])
+        self.assertEqual([(l["line_num"], l["text"], l["top"], l["width"])
+                          for l in lines[0]],
+                         [(0, "hi", 3, 30), (1, "yo", 34, 52)])
+        self.assertAlmostEqual(lines[0][0]["confidence"], 90.0, places=3)
+
+
+@unittest.skipUnless(onnx_available(), "onnxruntime or the ONNX models are "
+                                       "not installed")
+class TestOnnxRegression(unittest.TestCase):
+    def test_accuracy_on_labeled_set(self):
+        samples = ocr_benchmark.load_ground_truth()
+        row = ocr_benchmark.run_config(
+            OcrConfig("none", 1.0, 0, "-", "onnx"), samples)
+        print(f"\nONNX OCR: CER {row['cer']:.3f}, "
+              f"{row['images_per_sec']:.2f} img/s, p95 {row['p95_ms']:.0f} ms")
+        self.assertEqual(row["errors"], 0)
+        self.assertLess(row["cer"], MAX_ONNX_CER)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
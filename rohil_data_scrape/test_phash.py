@@ -0,0 +1,74 @@
+# test_phash.py
+"""
+Checks for perceptual hashing: the multi-index search against brute force,
+clustering of resized/recompressed copies, and the known-image index.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from image_cache import ImageCache
+from phash import HammingIndex, HashIndex, cluster_images
+from test_llm_detector import textured_image
+
+
+def brute_force_pairs(hashes, radius):
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    dist = (bits[:, None, :] != bits[None, :, :]).sum(-1)
+    i, j = np.nonzero(np.triu(dist <= radius, 1))
+    return set(zip(i.tolist(), j.tolist()))
+
+
+class TestHammingIndex(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        hashes = rng.integers(0, 2 ** 63, size=800, dtype=np.uint64)
+        # Plant near neighbours at every distance up to 12 bits
+        for k in range(0, 400, 2):
+            flips = rng.choice(64, size=k % 13, replace=False)
+            hashes[k + 1] = hashes[k]
+            for bit in flips:
+                hashes[k + 1] ^= np.uint64(1) << np.uint64(bit)
+        index = HammingIndex(hashes)
+        for radius in (0, 5, 8, 12):
+            i, j, d = index.pairs(radius)
+            self.assertEqual(set(zip(i.tolist(), j.tolist())),
+                             brute_force_pairs(hashes, radius))
+            self.assertTrue((d <= radius).all())
+
+
+class TestClustering(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = ImageCache(os.path.join(self.tmp.name, "cache"))
+
+    def save(self, img, name, **kwargs):
+        path = os.path.join(self.tmp.name, name)
+        img.save(path, **kwargs)
+        return path
+
+    def test_copies_cluster_and_index_finds_reposts(self):
+        a = self.save(textured_image(0), "a.png")
+        a_small = self.save(textured_image(0).resize((200, 250)),
+                            "a_small.jpg", quality=50)
+        b = self.save(textured_image(1), "b.png")
+        flat = self.save(textured_image(2).resize((1, 1)).resize((300, 300)),
+                         "flat.png")
+        flat2 = self.save(textured_image(3).resize((1, 1)).resize((300, 300)),
+                          "flat2.png")
+        clusters = cluster_images([a_small, b, a, flat, flat2], self.cache)
+        self.assertEqual(clusters, [[a, a_small], [b], [flat], [flat2]])
+
+        index_path = os.path.join(self.tmp.name, "known.npz")
+        HashIndex.build([a], self.cache).save(index_path)
+        matches = HashIndex.load(index_path).match([b, a_small], self.cache)
+        self.assertEqual([(path, key) for path, key, _ in matches],
+                         [(a_small, a)])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
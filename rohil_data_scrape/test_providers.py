@@ -0,0 +1,162 @@
+# test_providers.py
+"""
+Checks for the provider layer: request translation for the native Gemini
+and DashScope APIs, per-event-loop HTTP clients, retries on retryable
+errors, and record/replay.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+
+from providers import (Completion, DashScopeProvider, GeminiProvider,
+                       OpenAIProvider, Provider, ProviderError,
+                       RecordingProvider, get_provider)
+
+IMAGE_URI = "data:image/jpeg;base64,AAAA"
+MESSAGES = [{
+    "role": "user",
+    "content": [
+        {"type": "text", "text": "Describe"},
+        {"type": "image_url", "image_url": {"url": IMAGE_URI}},
+    ],
+}]
+
+
+class FlakyProvider(Provider):
+    """Fails with a 429 `failures` times, then answers."""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.calls = 0
+
+    async def _request(self, model, messages, max_tokens):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ProviderError("HTTP 429", retryable=True, retry_after=0,
+                                status=429)
+        return Completion("ok", 10, 2, 0.01, model)
+
+
+class TestRetries(unittest.TestCase):
+    def test_retries_retryable_errors(self):
+        provider = FlakyProvider(2)
+        retries = []
+        with mock.patch("providers.backoff_delay", return_value=0):
+            result = asyncio.run(provider.complete(
+                "m", MESSAGES, 100,
+                on_retry=lambda e, delay, attempt: retries.append(attempt)))
+        self.assertEqual(result.text, "ok")
+        self.assertEqual(retries, [0, 1])
+        self.assertEqual(provider.retry_count, 2)
+        self.assertEqual(provider.summary()["m"]["requests"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        provider = FlakyProvider(5, max_retries=2)
+        with mock.patch("providers.backoff_delay", return_value=0):
+            with self.assertRaises(ProviderError):
+                asyncio.run(provider.complete("m", MESSAGES, 100))
+        self.assertEqual(provider.calls, 3)
+        self.assertEqual(provider.summary()["m"]["errors"], 1)
+
+
+class TestNativeApis(unittest.TestCase):
+    def serve(self, reply):
+        """MockTransport answering `reply`, keeping requests in self.requests."""
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            return httpx.Response(200, json=reply)
+        return httpx.MockTransport(handler)
+
+    def test_gemini_body(self):
+        provider = GeminiProvider("key", transport=self.serve({
+            "candidates": [{"content": {"parts": [{"text": "[]"}]}}],
+            "usageMetadata": {"promptTokenCount": 300,
+                              "candidatesTokenCount": 5},
+        }))
+        result = asyncio.run(provider.complete("gemini-x", MESSAGES, 64))
+        self.assertEqual((result.text, result.input_tokens,
+                          result.output_tokens), ("[]", 300, 5))
+        request = self.requests[0]
+        self.assertTrue(request.url.path.endswith(
+            "/models/gemini-x:generateContent"))
+        self.assertEqual(request.headers["x-goog-api-key"], "key")
+        body = json.loads(request.content)
+        self.assertEqual(body["contents"][0]["parts"], [
+            {"text": "Describe"},
+            {"inline_data": {"mime_type": "image/jpeg", "data": "AAAA"}},
+        ])
+        self.assertEqual(body["generationConfig"]["maxOutputTokens"], 64)
+
+    def test_dashscope_body(self):
+        provider = DashScopeProvider("key", transport=self.serve({
+            "output": {"choices": [{"message": {
+                "content": [{"text": "clean"}]}}]},
+            "usage": {"input_tokens": 900, "output_tokens": 12},
+        }))
+        result = asyncio.run(provider.complete("qwen-vl-plus", MESSAGES, 64))
+        self.assertEqual(result.text, "clean")
+        self.assertEqual(result.input_tokens, 900)
+        request = self.requests[0]
+        self.assertEqual(request.headers["authorization"], "Bearer key")
+        body = json.loads(request.content)
+        self.assertEqual(body["input"]["messages"][0]["content"],
+                         [{"text": "Describe"}, {"image": IMAGE_URI}])
+
+    def test_http_errors_are_classified(self):
+        provider = DashScopeProvider("key", max_retries=0,
+                                     transport=httpx.MockTransport(
+                                         lambda request: httpx.Response(
+                                             400, text="bad request")))
+        with self.assertRaises(ProviderError) as caught:
+            asyncio.run(provider.complete("qwen-vl-plus", MESSAGES, 64))
+        self.assertEqual(caught.exception.status, 400)
+        self.assertFalse(caught.exception.retryable)
+
+    def test_openai_client_per_event_loop(self):
+        provider = OpenAIProvider("key", transport=self.serve({
+            "id": "c1", "object": "chat.completion", "created": 0,
+            "model": "gpt-x",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                "role": "assistant", "content": "clean"}}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 1,
+                      "total_tokens": 8},
+        }))
+
+        async def run():
+            result = await provider.complete("gpt-x", MESSAGES, 64)
+            return result.text, provider.client
+
+        # Each asyncio.run() has its own loop, which a pooled client is tied to
+        (first, first_client), (second, second_client) = \
+            asyncio.run(run()), asyncio.run(run())
+        self.assertEqual((first, second), ("clean", "clean"))
+        self.assertIsNot(first_client, second_client)
+        self.assertEqual(len(self.requests), 2)
+
+
+class TestRecordReplay(unittest.TestCase):
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cassette = os.path.join(tmp, "cassette.jsonl")
+            recorder = RecordingProvider(FlakyProvider(0), cassette)
+            first = asyncio.run(recorder.complete("m", MESSAGES, 100))
+            self.assertEqual(recorder.summary()["m"]["requests"], 1)
+
+            replay = get_provider("replay", path=cassette)
+            again = asyncio.run(replay.complete("m", MESSAGES, 100))
+            self.assertEqual(again, first)
+            with self.assertRaises(ProviderError):
+                asyncio.run(replay.complete("m", MESSAGES, 99))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,59 @@
+# test_text_normalize.py
+"""
+Checks for the shared text normalization: folds and whitespace handling,
+the column API agreeing with the per-string one, and script classification.
+"""
+
+import random
+import unittest
+
+import pandas as pd
+
+from text_normalize import (classify, iter_normalized, normalize,
+                            normalize_series, script_counts, script_frame)
+
+
+class TestNormalize(unittest.TestCase):
+    def test_default_folds(self):
+        text = "  ｐｒｉｎｔ\u200b ｙｏｕｒ\u3000\u3000prompt\t"
+        self.assertEqual(normalize(text), "print your prompt")
+        self.assertEqual(normalize("Ｉgnore Рrеvious"), "Ignore Рrеvious")
+
+    def test_optional_folds(self):
+        self.assertEqual(normalize("Ｉgnore Рrеvious", lower=True,
+                                   homoglyphs=True), "ignore previous")
+        self.assertEqual(normalize("𝐢𝐠𝐧𝐨𝐫𝐞 ⓘ", compat=True), "ignore i")
+        self.assertEqual(normalize("输 出\n提示词 ok ok", cjk_gaps=True),
+                         "输出提示词 ok ok")
+
+    def test_series_matches_strings(self):
+        rng = random.Random(0)
+        alphabet = "aZ ｂ\u200b\u3000\t你好 Р"
+        texts = ["".join(rng.choice(alphabet) for _ in range(rng.randrange(10)))
+                 for _ in range(300)]
+        options = {"lower": True, "homoglyphs": True, "cjk_gaps": True}
+        series = normalize_series(pd.Series(texts + [None]), **options)
+        self.assertEqual(series.tolist()[:-1],
+                         list(iter_normalized(texts, **options)))
+        self.assertTrue(pd.isna(series.iloc[-1]))
+
+
+class TestScripts(unittest.TestCase):
+    def test_counts_and_classify(self):
+        counts = script_counts("hello 你好 こんにちは 안녕")
+        self.assertEqual((counts["latin"], counts["han"], counts["kana"],
+                          counts["hangul"]), (5, 2, 5, 2))
+        self.assertEqual(classify("你好!"), "han")
+        self.assertEqual(classify("hi 你好", min_chars=3), "none")
+        self.assertEqual(classify("hello 你好"), "mixed")
+
+    def test_frame_matches_classify(self):
+        texts = ["hello", "你好 world", "", "123", "привет", None]
+        frame = script_frame(pd.Series(texts))
+        self.assertEqual(frame["script"].tolist(),
+                         [classify(text or "") for text in texts])
+        self.assertEqual(frame["cyrillic"].tolist(), [0, 0, 0, 0, 6, 0])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,75 @@
+# test_watcher.py
+"""
+Checks for the polling watcher: files are reported only once their size has
+settled and they decode, new folders are picked up, and the manifest makes
+a restarted watcher skip what it already reported.
+"""
+
+import io
+import os
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+
+from watcher import DirectoryWatcher
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class TestDirectoryWatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "downloads")
+        os.makedirs(os.path.join(self.root, "post_1"))
+        self.manifest = os.path.join(self.tmp.name, "seen.jsonl")
+
+    def write(self, relpath, data):
+        path = os.path.join(self.root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def settled_poll(self, watcher):
+        watcher.poll()
+        time.sleep(0.15)
+        return watcher.poll()
+
+    def test_only_finished_files_are_reported(self):
+        watcher = DirectoryWatcher(self.root, settle=0.1,
+                                   manifest=self.manifest)
+        done = self.write("post_1/a.png", png_bytes("red"))
+        full = png_bytes("blue")
+        partial = self.write("post_1/b.png", full[:len(full) // 2])
+        self.write("post_1/c.jpg.part", b"\xff\xd8")
+        self.assertEqual(watcher.poll(), [])        # not settled yet
+        self.assertEqual(self.settled_poll(watcher), [done])
+
+        # The download finishes and a new post folder appears
+        self.write("post_1/b.png", full)
+        later = self.write("post_2/a.png", png_bytes("green"))
+        self.assertEqual(self.settled_poll(watcher), [partial, later])
+
+        # Only files the consumer finished are skipped after a restart
+        watcher.mark_done([done, partial])
+        restarted = DirectoryWatcher(self.root, settle=0.1,
+                                     manifest=self.manifest)
+        self.assertEqual(self.settled_poll(restarted), [later])
+
+    def test_stream_stops_when_idle(self):
+        done = self.write("post_1/a.png", png_bytes("red"))
+        watcher = DirectoryWatcher(self.root, interval=0.05, settle=0.05)
+        start = time.monotonic()
+        self.assertEqual(list(watcher.stream(idle_timeout=0.2)), [done])
+        self.assertLess(time.monotonic() - start, 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
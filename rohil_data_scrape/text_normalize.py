@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Shared text normalization for comments, OCR text and the keys built from
+them (filter dedup, triage keywords, the injection scanner).
+
+The per-character work is one str.translate over a precompiled table:
+full-width ASCII and the ideographic space fold to half-width, zero-width
+and other invisible format characters are dropped, and every Unicode
+space becomes a plain one. Runs of spaces are then squeezed and the ends
+stripped. Optional folds add ASCII case, look-alike Cyrillic / Greek
+letters, other compatibility forms (𝐢𝐠𝐧𝐨𝐫𝐞, ⓘ) and the spaces OCR puts
+between Chinese characters. Every table entry maps one character to at
+most one, so positions can be traced back (see injection_scanner).
+
+Scripts are counted the same way: a second table turns each character of
+a known script into that script's marker letter, and a count is then a
+str.count. Strings go through normalize() / script_counts() one at a time
+or iter_normalized() as a stream; pandas columns through normalize_series()
+and script_frame(), built on the vectorized .str methods.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+
+# Invisible format characters: soft hyphen, combining grapheme joiner,
+# Mongolian vowel separator, zero-width space / joiners, direction marks,
+# word joiner and invisible operators, byte order mark
+ZERO_WIDTH = "\u00ad\u034f\u180e\u200b\u200c\u200d\u200e\u200f" \
+             "\u2060\u2061\u2062\u2063\u2064\ufeff"
+# Cyrillic and Greek letters that pass for Latin ones
+HOMOGLYPHS = {
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j",
+    "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ӏ": "l",
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ı": "i", "ℓ": "l",
+}
+# Blocks holding compatibility forms of ASCII: Latin-1, general punctuation
+# and spaces, letterlike symbols, enclosed alphanumerics, mathematical
+# alphanumerics
+COMPAT_RANGES = [(0x00A0, 0x0100), (0x2000, 0x2150), (0x2460, 0x2500),
+                 (0x1D400, 0x1D800)]
+
+# Script name -> codepoint ranges (inclusive), and its marker letter
+SCRIPT_RANGES = {
+    "han": [(0x4E00, 0x9FFF), (0x3400, 0x4DBF)],
+    "kana": [(0x3040, 0x30FF)],
+    "hangul": [(0xAC00, 0xD7AF), (0x1100, 0x11FF)],
+    "latin": [(0x41, 0x5A), (0x61, 0x7A), (0xC0, 0xD6), (0xD8, 0xF6),
+              (0xF8, 0x24F)],
+    "cyrillic": [(0x0400, 0x04FF)],
+    "arabic": [(0x0600, 0x06FF)],
+    "thai": [(0x0E00, 0x0E7F)],
+}
+SCRIPT_MARKERS = {"han": "H", "kana": "K", "hangul": "G", "latin": "L",
+                  "cyrillic": "C", "arabic": "A", "thai": "T"}
+
+
+def script_class(names):
+    """Regex character class of the named scripts, e.g. "[\\u4e00-...]"."""
+    return "[" + "".join(f"\\U{low:08x}-\\U{high:08x}"
+                         for name in names
+                         for low, high in SCRIPT_RANGES[name]) + "]"
+
+
+HAN = script_class(["han"])
+SPACE_RUN_RE = re.compile(" {2,}")
+CJK_GAP_RE = re.compile(rf"(?<={HAN})\s+(?={HAN})")
+ZERO_WIDTH_RE = re.compile(f"[{ZERO_WIDTH}]")
+FULLWIDTH_LATIN_RE = re.compile("[\uff21-\uff3a\uff41-\uff5a]")
+
+
+# ---- tables ------------------------------------------------------------
+@lru_cache(maxsize=None)
+def fold_table(lower=False, homoglyphs=False, compat=False):
+    """str.translate table for the given folds (see the module docstring)."""
+    table = {0xFF01 + i: chr(0x21 + i) for i in range(94)}
+    if compat:
+        for low, high in COMPAT_RANGES:
+            for code in range(low, high):
+                folded = unicodedata.normalize("NFKC", chr(code))
+                if len(folded) == 1 and folded.isascii() \
+                        and folded != chr(code):
+                    table[code] = folded
+    if homoglyphs:
+        for glyph, letter in HOMOGLYPHS.items():
+            table[ord(glyph)] = letter
+            if len(glyph.upper()) == 1:
+                table[ord(glyph.upper())] = letter
+    if lower:
+        for code, value in table.items():
+            table[code] = value.lower()
+        for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+            table[ord(letter)] = letter.lower()
+    for code in range(0x3001):
+        if chr(code).isspace():
+            table[code] = " "
+    for char in ZERO_WIDTH:
+        table[ord(char)] = None
+    return table
+
+
+@lru_cache(maxsize=None)
+def fold_pattern(lower=False, homoglyphs=False, compat=False):
+    """
+    Regex of the characters fold_table() changes. Most text has none, and a
+    regex scan is far cheaper than a dict-driven str.translate, so
+    normalize() only translates strings this finds something in.
+    """
+    table = fold_table(lower, homoglyphs, compat)
+    changed = "".join(re.escape(chr(code)) for code in sorted(table)
+                      if table[code] != chr(code))
+    return re.compile(f"[{changed}]")
+
+
+def build_script_table():
+    table = {}
+    for name, ranges in SCRIPT_RANGES.items():
+        for low, high in ranges:
+            for code in range(low, high + 1):
+                table[code] = SCRIPT_MARKERS[name]
+    return table
+
+
+SCRIPT_TABLE = build_script_table()
+
+
+# ---- streaming API -----------------------------------------------------
+def normalize(text, lower=False, homoglyphs=False, compat=False,
+              cjk_gaps=False):
+    """Normalized form of one string (see the module docstring)."""
+    if fold_pattern(lower, homoglyphs, compat).search(text):
+        text = text.translate(fold_table(lower, homoglyphs, compat))
+    if "  " in text:
+        text = SPACE_RUN_RE.sub(" ", text)
+    if cjk_gaps:
+        text = CJK_GAP_RE.sub("", text)
+    return text.strip()
+
+
+def iter_normalized(lines, **options):
+    """normalize() over any iterable of strings, e.g. an open file."""
+    for line in lines:
+        yield normalize(line, **options)
+
+
+def script_counts(text):
+    """{script: number of its characters in `text`}."""
+    marked = text.translate(SCRIPT_TABLE)
+    return {name: marked.count(marker)
+            for name, marker in SCRIPT_MARKERS.items()}
+
+
+def classify(text, min_chars=1):
+    """
+    The script of `text`: its name if exactly one script has at least
+    `min_chars` characters, "mixed" if several do, "none" if none does.
+    """
+    present = [name for name, count in script_counts(text).items()
+               if count >= min_chars]
+    if not present:
+        return "none"
+    return present[0] if len(present) == 1 else "mixed"
+
+
+# ---- column API --------------------------------------------------------
+def normalize_series(series, lower=False, homoglyphs=False, compat=False,
+                     cjk_gaps=False):
+    """normalize() over a pandas Series of strings; missing values stay."""
+    series = series.str.translate(fold_table(lower, homoglyphs, compat))
+    series = series.str.replace(SPACE_RUN_RE, " ", regex=True)
+    if cjk_gaps:
+        series = series.str.replace(CJK_GAP_RE, "", regex=True)
+    return series.str.strip()
+
+
+def script_frame(series, min_chars=1):
+    """
+    One column of character counts per script for a Series of strings, and
+    a "script" column classifying each row like classify().
+    """
+    import pandas as pd
+    marked = series.fillna("").astype(str).str.translate(SCRIPT_TABLE)
+    frame = pd.DataFrame({name: marked.str.count(marker)
+                          for name, marker in SCRIPT_MARKERS.items()},
+                         index=series.index)
+    present = frame.to_numpy() >= min_chars
+    names = np.array(list(SCRIPT_MARKERS))
+    frame["script"] = np.where(
+        present.sum(axis=1) > 1, "mixed",
+        np.where(present.any(axis=1), names[present.argmax(axis=1)], "none"))
+    return frame
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(
+        description="Normalize text line by line (stdin to stdout by default)."
+    )
+    parser.add_argument("input", nargs="?", default="-")
+    parser.add_argument("-o", "--out", default="-")
+    parser.add_argument("--lower", action="store_true",
+                        help="Fold ASCII case.")
+    parser.add_argument("--homoglyphs", action="store_true",
+                        help="Fold Cyrillic / Greek look-alikes to Latin.")
+    parser.add_argument("--compat", action="store_true",
+                        help="Fold other compatibility forms of ASCII.")
+    parser.add_argument("--cjk-gaps", action="store_true",
+                        help="Remove spaces between Chinese characters.")
+    args = parser.parse_args()
+
+    infile = sys.stdin if args.input == "-" else \
+        open(args.input, encoding="utf-8")
+    outfile = sys.stdout if args.out == "-" else \
+        open(args.out, "w", encoding="utf-8")
+    try:
+        for line in iter_normalized(infile, lower=args.lower,
+                                    homoglyphs=args.homoglyphs,
+                                    compat=args.compat,
+                                    cjk_gaps=args.cjk_gaps):
+            outfile.write(line + "\n")
+    finally:
+        for f in (infile, outfile):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Cheap OCR-text triage in front of the LLM detector.
+
+Each image's OCR text is scored with fast rules: weighted injection keywords
+(English and Chinese), regex patterns for typical attack phrasing and code
+snippets, and mixed-script anomalies. Only images scoring at least the
+threshold go to the LLM; a random sample of the rejected ones is sent too,
+so every run measures how much the gate is missing.
+"""
+
+import csv
+import os
+import random
+import re
+import sys
+from collections import defaultdict
+
+from text_normalize import (FULLWIDTH_LATIN_RE, ZERO_WIDTH_RE, normalize,
+                            script_counts)
+
+TRIAGE_THRESHOLD = 3.0
+AUDIT_RATE = 0.02           # fraction of rejected images still sent to the LLM
+
+# Keyword -> weight. Matched case-insensitively on whitespace-compacted text.
+KEYWORDS_EN = {
+    "prompt": 1.5,
+    "system prompt": 3.0,
+    "jailbreak": 3.0,
+    "jailbreaked": 3.0,
+    "ignore": 1.0,
+    "previous instructions": 3.0,
+    "instruction": 1.0,
+    "config": 1.0,
+    "translate this": 1.5,
+    "you are": 0.5,
+    "output": 1.0,
+    "print": 1.0,
+    "simulate": 1.0,
+    "bio of your": 2.0,
+    "drop table": 2.5,
+    "chatgpt": 1.0,
+    "llm": 1.0,
+}
+KEYWORDS_ZH = {
+    "提示词": 2.0,
+    "指令": 1.5,
+    "忽略": 1.0,
+    "越狱": 3.0,
+    "注入": 2.0,
+    "输出": 1.0,
+    "大模型": 1.0,
+    "翻译": 0.5,
+    "系统": 0.5,
+    "你是": 0.5,
+    "扮演": 1.5,
+    "之前的": 1.0,
+}
+# Regex -> weight, for phrasing and code that keywords alone miss
+PATTERNS = {
+    (r"(output|print|show|reveal|tell)\b.{0,20}\b(your|the)\s*/?\s*"
+     r"(prompt|config|instructions?)"): 4.0,
+    r"ignore\s+(all\s+)?(previous|above|prior)": 4.0,
+    r"\bafter\s+that\b": 1.0,
+    r"\[\s*\w+\s+for\s+\w+\s+in\b": 3.0,           # list comprehension
+    r"\b(print|printf|eval|exec)\s*\(": 2.5,
+    r"__\w+__": 2.0,                                  # dunder names
+    r"/(prompt|config|system)\b": 2.0,
+    r";\s*--": 1.5,                                   # SQL comment
+    r"[{}<>]{2,}": 0.5,
+    r"忽略.{0,6}(指令|提示|以上|之前)": 4.0,
+    r"(输出|打印|显示).{0,8}(提示词|指令|配置)": 4.0,
+}
+COMPILED_PATTERNS = [(re.compile(p, re.IGNORECASE), w)
+                     for p, w in PATTERNS.items()]
+
+MIXED_LINE_MIN = 4          # letters of each script for a line to count as mixed
+
+
+def score_text(text):
+    """Return (score, reasons) for one image's OCR text."""
+    if not text:
+        return 0.0, []
+    # Rules run on the normalized text, so full-width or zero-width tricks
+    # do not hide keywords; the anomaly checks below look at the raw text
+    raw, text = text, normalize(text, cjk_gaps=True)
+    lowered = text.lower()
+    score, reasons = 0.0, []
+
+    for keywords in (KEYWORDS_EN, KEYWORDS_ZH):
+        for keyword, weight in keywords.items():
+            if keyword in lowered:
+                score += weight
+                reasons.append(keyword)
+
+    for pattern, weight in COMPILED_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            score += weight
+            reasons.append(match.group(0)[:40])
+
+    # Mixed-script anomalies: hidden characters, full-width Latin, and lines
+    # mixing substantial Chinese and English text
+    if ZERO_WIDTH_RE.search(raw):
+        score += 2.0
+        reasons.append("zero-width characters")
+    if FULLWIDTH_LATIN_RE.search(raw):
+        score += 1.0
+        reasons.append("full-width latin")
+    mixed_lines = 0
+    for line in raw.splitlines():
+        counts = script_counts(line)
+        if counts["han"] >= MIXED_LINE_MIN and \
+                counts["latin"] >= MIXED_LINE_MIN:
+            mixed_lines += 1
+    if mixed_lines:
+        score += 0.25 * min(mixed_lines, 4)
+        reasons.append(f"{mixed_lines} mixed-script lines")
+
+    return score, reasons
+
+
+def load_ocr_texts(path):
+    """
+    OCR text keyed by image path (streamed records from ocr.py) or by post
+    directory name (legacy results.csv with one row per directory).
+    """
+    texts = defaultdict(list)
+    if path.lower().endswith((".jsonl", ".parquet")):
+        from ocr import read_ocr_records
+        records = read_ocr_records(path, columns=["image", "text", "error"],
+                                   record_type="image")
+        for image, text, error in zip(records["image"], records["text"],
+                                      records["error"]):
+            if isinstance(error, str):
+                continue    # OCR failed: nothing is known about the image
+            texts[os.path.abspath(image)].append(text or "")
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                texts[row["directory"]].append(row["text"] or "")
+    return {key: "\n".join(dict.fromkeys(parts))
+            for key, parts in texts.items()}
+
+
+def text_for_image(image_path, ocr_texts):
+    """OCR text for an image, by path first, then by its post directory."""
+    text = ocr_texts.get(os.path.abspath(image_path))
+    if text is None:
+        text = ocr_texts.get(os.path.basename(os.path.dirname(image_path)))
+    return text
+
+
+def triage_images(image_paths, ocr_texts, threshold=TRIAGE_THRESHOLD,
+                  audit_rate=AUDIT_RATE, seed=None, score_batch=None):
+    """
+    Split images into (selected, audit, rejected, scores). Images without
+    any OCR entry are selected, since nothing is known about them; `audit`
+    is a random sample of `rejected` to send to the LLM anyway.
+
+    `score_batch` replaces the rule score: it maps a list of texts to a
+    list of scores in one call (e.g. InjectionClassifier.score).
+    """
+    texts = {path: text_for_image(path, ocr_texts) for path in image_paths}
+    known = [path for path in image_paths if texts[path] is not None]
+    if score_batch is None:
+        scores = {path: score_text(texts[path]) for path in known}
+    else:
+        values = score_batch([texts[path] for path in known]) if known else []
+        scores = {path: (float(value), [])
+                  for path, value in zip(known, values)}
+
+    selected, rejected = [], []
+    for path in image_paths:
+        if path not in scores:
+            selected.append(path)
+        elif scores[path][0] >= threshold:
+            selected.append(path)
+        else:
+            rejected.append(path)
+
+    audit = []
+    if rejected and audit_rate > 0:
+        n_audit = max(1, round(len(rejected) * audit_rate))
+        audit = random.Random(seed).sample(rejected,
+                                           min(n_audit, len(rejected)))
+    return selected, audit, rejected, scores
+
+
+def estimate_recall(flagged_selected, flagged_audit, n_audit, n_rejected):
+    """
+    Recall of the gate estimated from the audit sample: positives among
+    rejected images ~ audit hit rate x rejected count.
+    """
+    if not n_audit:
+        return None
+    missed = flagged_audit / n_audit * n_rejected
+    total = flagged_selected + missed
+    return flagged_selected / total if total else 1.0
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Score OCR output with the triage rules."
+    )
+    parser.add_argument("ocr_file",
+                        help="OCR output: results.csv, .jsonl or .parquet.")
+    parser.add_argument("--threshold", type=float, default=TRIAGE_THRESHOLD)
+    parser.add_argument("--top", type=int, default=20,
+                        help="Show the N highest-scoring entries.")
+    args = parser.parse_args()
+
+    ocr_texts = load_ocr_texts(args.ocr_file)
+    scored = sorted(((score_text(text), key)
+                     for key, text in ocr_texts.items()),
+                    key=lambda item: -item[0][0])
+    passing = sum(1 for (score, _), _ in scored if score >= args.threshold)
+    print(f"{passing} / {len(scored)} entries score >= {args.threshold}")
+    for (score, reasons), key in scored[:args.top]:
+        print(f"{score:5.1f}  {key}  {', '.join(reasons)}")
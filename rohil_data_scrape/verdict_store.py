@@ -0,0 +1,302 @@
+"""
+Persistent store of LLM verdicts, keyed by what actually determines the
+answer: the image content hash, a hash of the prompt, the model and the
+max_tokens setting. Re-running the detector only sends images whose key is
+not in the store yet.
+
+Every detector run is also logged: a row in `runs`, and one row in the
+append-only `results` table per item as soon as its batch is answered, so a
+crash loses at most the batches in flight. Reports and flagged sets are
+built from these rows on demand.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    image_hash    TEXT NOT NULL,
+    prompt_hash   TEXT NOT NULL,
+    model         TEXT NOT NULL,
+    max_tokens    INTEGER NOT NULL,
+    is_suspicious INTEGER NOT NULL,
+    analysis      TEXT NOT NULL,
+    raw_response  TEXT,
+    created_at    REAL NOT NULL,
+    PRIMARY KEY (image_hash, prompt_hash, model, max_tokens)
+);
+
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    items_dir   TEXT,
+    model       TEXT,
+    prompt_hash TEXT,
+    total_items INTEGER,
+    started_at  REAL NOT NULL,
+    finished_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id        TEXT NOT NULL REFERENCES runs (run_id),
+    image_hash    TEXT NOT NULL,
+    path          TEXT NOT NULL,
+    post_id       TEXT,
+    is_suspicious INTEGER NOT NULL,
+    analysis      TEXT NOT NULL,
+    source        TEXT NOT NULL,
+    created_at    REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS results_image_hash ON results (image_hash);
+CREATE INDEX IF NOT EXISTS results_post_id ON results (post_id);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id, is_suspicious);
+CREATE INDEX IF NOT EXISTS results_suspicious ON results (is_suspicious);
+
+CREATE TRIGGER IF NOT EXISTS results_no_update BEFORE UPDATE ON results
+BEGIN SELECT RAISE(ABORT, 'results are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS results_no_delete BEFORE DELETE ON results
+BEGIN SELECT RAISE(ABORT, 'results are append-only'); END;
+"""
+
+RESULT_FIELDS = ("id", "run_id", "image_hash", "path", "post_id",
+                 "is_suspicious", "analysis", "source", "created_at")
+RUN_FIELDS = ("run_id", "kind", "items_dir", "model", "prompt_hash",
+              "total_items", "started_at", "finished_at")
+
+# Manifest written next to each materialized flagged set
+FLAGGED_MANIFEST = "flagged.jsonl"
+
+# SQLite caps bound parameters per statement; look up keys in chunks
+LOOKUP_CHUNK = 500
+
+
+def prompt_hash(prompt):
+    """Short stable hash identifying a prompt's exact text."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class VerdictStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, image_hashes, prompt_key, model, max_tokens):
+        """{image_hash: verdict dict} for the hashes already in the store."""
+        image_hashes = list(dict.fromkeys(image_hashes))
+        found = {}
+        for i in range(0, len(image_hashes), LOOKUP_CHUNK):
+            chunk = image_hashes[i : i + LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT image_hash, is_suspicious, analysis, raw_response "
+                f"FROM verdicts WHERE prompt_hash = ? AND model = ? "
+                f"AND max_tokens = ? AND image_hash IN ({placeholders})",
+                [prompt_key, model, max_tokens, *chunk],
+            )
+            for image_hash, is_suspicious, analysis, raw in rows:
+                found[image_hash] = {
+                    "is_suspicious": bool(is_suspicious),
+                    "analysis": analysis,
+                    "raw_response": raw,
+                }
+        return found
+
+    def put_many(self, verdicts, prompt_key, model, max_tokens):
+        """
+        Store verdicts given as (image_hash, is_suspicious, analysis,
+        raw_response) tuples, replacing older entries with the same key.
+        """
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (image_hash, prompt_key, model, max_tokens, int(is_suspicious),
+                 analysis, raw, now)
+                for image_hash, is_suspicious, analysis, raw in verdicts
+            ],
+        )
+        self.conn.commit()
+
+    def image_labels(self):
+        """{image_hash: is_suspicious} over all prompts and models; an image
+        counts as suspicious if any stored verdict flagged it."""
+        rows = self.conn.execute(
+            "SELECT image_hash, MAX(is_suspicious) FROM verdicts "
+            "GROUP BY image_hash"
+        )
+        return {image_hash: bool(flag) for image_hash, flag in rows}
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+
+    # ---- run log ----
+
+    def begin_run(self, kind, items_dir=None, model=None, prompt_key=None,
+                  total_items=None):
+        """Register a new run and return its ID (a timestamp, unique)."""
+        run_id = base = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = 1
+        while self.run(run_id) is not None:
+            suffix += 1
+            run_id = f"{base}_{suffix}"
+        self.conn.execute(
+            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+            (run_id, kind, items_dir, model, prompt_key, total_items,
+             time.time()),
+        )
+        self.conn.commit()
+        return run_id
+
+    def finish_run(self, run_id, total_items=None):
+        self.conn.execute(
+            "UPDATE runs SET finished_at = ?, "
+            "total_items = COALESCE(?, total_items) WHERE run_id = ?",
+            (time.time(), total_items, run_id),
+        )
+        self.conn.commit()
+
+    def run(self, run_id):
+        """The run's row as a dict; None if unknown. "latest" is the newest."""
+        if run_id == "latest":
+            row = self.conn.execute(
+                "SELECT * FROM runs ORDER BY started_at DESC LIMIT 1"
+            ).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT * FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        return dict(zip(RUN_FIELDS, row)) if row else None
+
+    def runs(self):
+        """Every run with its result and flagged counts, oldest first."""
+        rows = self.conn.execute(
+            "SELECT runs.*, COUNT(results.id), "
+            "COALESCE(SUM(results.is_suspicious), 0) "
+            "FROM runs LEFT JOIN results USING (run_id) "
+            "GROUP BY runs.run_id ORDER BY runs.started_at"
+        )
+        return [
+            {**dict(zip(RUN_FIELDS, row)), "results": row[-2],
+             "suspicious": row[-1]}
+            for row in rows
+        ]
+
+    def append_results(self, run_id, results):
+        """
+        Append (image_hash, path, post_id, is_suspicious, analysis, source)
+        tuples to the run's results in one transaction.
+        """
+        if not results:
+            return
+        now = time.time()
+        self.conn.executemany(
+            "INSERT INTO results (run_id, image_hash, path, post_id, "
+            "is_suspicious, analysis, source, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (run_id, image_hash, path, post_id, int(is_suspicious),
+                 analysis, source, now)
+                for image_hash, path, post_id, is_suspicious, analysis, source
+                in results
+            ],
+        )
+        self.conn.commit()
+
+    def results(self, run_id=None, post_id=None, image_hash=None,
+                suspicious=None):
+        """Result rows (dicts) matching every given filter, in order."""
+        filters, params = [], []
+        for column, value in (("run_id", run_id), ("post_id", post_id),
+                              ("image_hash", image_hash)):
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        if suspicious is not None:
+            filters.append("is_suspicious = ?")
+            params.append(int(suspicious))
+        where = f" WHERE {' AND '.join(filters)}" if filters else ""
+        rows = self.conn.execute(
+            f"SELECT * FROM results{where} ORDER BY id", params
+        )
+        return [dict(zip(RESULT_FIELDS, row)) for row in rows]
+
+    def flagged(self, run_id):
+        """The run's final verdicts on flagged items, one row per path."""
+        latest = {}
+        for row in self.results(run_id=run_id):
+            latest[row["path"]] = row
+        return [row for row in latest.values() if row["is_suspicious"]]
+
+
+def materialize_flagged(rows, out_dir, link=True):
+    """
+    Write a flagged set to `out_dir`: a JSONL manifest of `rows` and, with
+    `link`, a hardlink to each image (a copy across filesystems). Names
+    that collide get their post ID as a prefix. Returns the manifest path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    names = set()
+    manifest_path = os.path.join(out_dir, FLAGGED_MANIFEST)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        for row in rows:
+            entry = {key: row[key] for key in
+                     ("path", "image_hash", "post_id", "analysis", "run_id")}
+            if link and os.path.isfile(row["path"]):
+                name = os.path.basename(row["path"])
+                if name in names:
+                    name = f"{row['post_id']}_{name}"
+                names.add(name)
+                dst = os.path.join(out_dir, name)
+                if not os.path.exists(dst):
+                    try:
+                        os.link(row["path"], dst)
+                    except OSError as e:
+                        if e.errno not in (errno.EXDEV, errno.EPERM,
+                                           errno.EMLINK):
+                            raise
+                        shutil.copy2(row["path"], dst)
+                entry["file"] = name
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return manifest_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a verdict store.")
+    parser.add_argument("db", help="Path to the SQLite verdict store.")
+    parser.add_argument("--runs", action="store_true",
+                        help="List detector runs instead of verdict counts.")
+    parser.add_argument("--post", help="Result history of one post ID.")
+    args = parser.parse_args()
+
+    store = VerdictStore(args.db)
+    if args.runs or args.post:
+        print(json.dumps(
+            store.runs() if args.runs else store.results(post_id=args.post),
+            indent=2, ensure_ascii=False,
+        ))
+        raise SystemExit
+    rows = store.conn.execute(
+        "SELECT model, prompt_hash, COUNT(*), SUM(is_suspicious) "
+        "FROM verdicts GROUP BY model, prompt_hash"
+    ).fetchall()
+    print(json.dumps(
+        [{"model": m, "prompt_hash": p, "verdicts": n, "suspicious": s}
+         for m, p, n, s in rows],
+        indent=2,
+    ))
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Watch an image tree and yield files as the scraper finishes writing them,
+so OCR and detection can run while a crawl is still going.
+
+Polling keeps this portable (no inotify on macOS / Windows) and cheap: each
+poll stats the known directories and only lists those whose mtime changed,
+plus the files still being written. A file is ready once it is non-empty,
+its size and mtime have not changed for `settle` seconds, and it decodes
+completely (a download cut off mid-stream does not). Once the consumer
+has finished a file (its results are on disk) it calls mark_done(), which
+records it in an optional JSONL manifest, so a restarted watcher skips it;
+files still queued or in flight when a run dies come round again.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+from PIL import Image       # pip install pillow
+
+from image_cache import IMAGE_EXTENSIONS, sniff_format
+
+POLL_INTERVAL = 2.0         # seconds between scans
+SETTLE_SECONDS = 3.0        # unchanged this long = finished writing
+GIVE_UP_SECONDS = 60.0      # stable but undecodable this long = skipped
+QUEUE_SIZE = 64             # ready files buffered ahead of the consumer
+
+# In-progress download names used by browsers and download helpers
+PARTIAL_SUFFIXES = (".part", ".partial", ".tmp", ".crdownload", ".download")
+
+
+def is_candidate(name):
+    return not name.startswith(".") and \
+        not name.lower().endswith(PARTIAL_SUFFIXES)
+
+
+def decodes(path):
+    """Whether the image decodes to the end (catches truncated writes)."""
+    try:
+        with Image.open(path) as img:
+            img.load()
+        return True
+    except Exception:
+        return False
+
+
+class DirectoryWatcher:
+    """
+    Polling watcher over `root`. Iterate `ready()` for image paths in the
+    order they finish; existing files are reported on the first poll.
+    """
+
+    def __init__(self, root, interval=POLL_INTERVAL, settle=SETTLE_SECONDS,
+                 manifest=None, verify=True):
+        self.root = root
+        self.interval = interval
+        self.settle = settle
+        self.verify = verify
+        self.manifest = manifest
+        self.dirs = {}          # dir -> (mtime_ns at last listing, subdirs)
+        self.pending = {}       # file -> (size, mtime_ns, unchanged since)
+        self.done = set()
+        if manifest and os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                self.done.update(json.loads(line)["path"]
+                                 for line in f if line.strip())
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def scan(self, directory):
+        """Pick up new files and sub-directories of changed directories."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            self.dirs.pop(directory, None)
+            return
+        known, subdirs = self.dirs.get(directory, (None, []))
+        if known != mtime:
+            subdirs = []
+            with os.scandir(directory) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif (is_candidate(entry.name)
+                          and entry.path not in self.done
+                          and entry.path not in self.pending):
+                        self.pending[entry.path] = (-1, -1, 0.0)
+            self.dirs[directory] = (mtime, subdirs)
+        for sub in subdirs:
+            self.scan(sub)
+
+    def poll(self):
+        """One scan; return the files that became ready, in name order."""
+        self.scan(self.root)
+        now = time.monotonic()
+        ready = []
+        for path in sorted(self.pending):
+            size, mtime, since = self.pending[path]
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now)
+                continue
+            if st.st_size == 0 or now - since < self.settle:
+                continue
+            if not (path.lower().endswith(IMAGE_EXTENSIONS)
+                    or sniff_format(path)):
+                del self.pending[path]
+                self.done.add(path)
+                continue
+            if self.verify and not decodes(path):
+                if now - since >= GIVE_UP_SECONDS:
+                    print(f"⚠️  {path} never finished decoding; skipped")
+                    del self.pending[path]
+                    self.done.add(path)
+                continue
+            del self.pending[path]
+            self.done.add(path)
+            ready.append(path)
+        return ready
+
+    def mark_done(self, paths):
+        """
+        Record `paths` in the manifest. Called by the consumer once a file's
+        results are safely written, not when poll() reports it, so nothing
+        still buffered or in flight is skipped after a crash.
+        """
+        paths = list(paths)
+        if not paths or not self.manifest:
+            return
+        with open(self.manifest, "a", encoding="utf-8") as f:
+            for path in paths:
+                f.write(json.dumps({"path": path, "done_at": time.time()},
+                                   ensure_ascii=False) + "\n")
+
+    def ready(self, idle_timeout=None, idle_ticks=False):
+        """
+        Yield ready paths until stop() or until nothing new has landed for
+        `idle_timeout` seconds. With `idle_ticks`, None is yielded after
+        each poll that found nothing, so consumers can flush partial work.
+        """
+        last_new = time.monotonic()
+        while not self.stopped.is_set():
+            paths = self.poll()
+            for path in paths:
+                yield path
+            if paths or self.pending:
+                last_new = time.monotonic()
+            elif idle_timeout is not None and \
+                    time.monotonic() - last_new >= idle_timeout:
+                return
+            if not paths and idle_ticks:
+                yield None
+            self.stopped.wait(self.interval)
+
+    def stream(self, maxsize=QUEUE_SIZE, **kwargs):
+        """
+        ready() polled on a background thread into a bounded queue: polling
+        overlaps with the consumer's work, and a slow consumer blocks the
+        poller instead of letting paths pile up in memory.
+        """
+        buffer = queue.Queue(maxsize)
+        end = object()
+
+        def produce():
+            try:
+                for path in self.ready(**kwargs):
+                    buffer.put(path)
+            finally:
+                buffer.put(end)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        while True:
+            item = buffer.get()
+            if item is end:
+                break
+            yield item
+        thread.join()
+
+
+# ---- CLI wrapper -------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Print image files under a folder as they finish writing."
+    )
+    parser.add_argument("root_dir")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS)
+    parser.add_argument("--idle-timeout", type=float, default=None,
+                        help="Exit after this many seconds without new files.")
+    parser.add_argument("--manifest", default=None,
+                        help="JSONL of printed files, skipped on restart.")
+    args = parser.parse_args()
+
+    watcher = DirectoryWatcher(args.root_dir, args.interval, args.settle,
+                               args.manifest)
+    try:
+        for path in watcher.ready(args.idle_timeout):
+            print(path, flush=True)
+            watcher.mark_done([path])
+    except KeyboardInterrupt:
+        pass